@@ -1,117 +1,246 @@
-from scipy.interpolate import griddata
 import numpy as np
 
 import sys
 import os
-import matplotlib.pyplot as plt
-from mpl_toolkits.axes_grid1 import AxesGrid
-from mpl_toolkits.axes_grid1.inset_locator import inset_axes
-from mpl_toolkits.axes_grid1 import make_axes_locatable
-from scipy.fft import fft
+import time
 from numpy import meshgrid
-from numpy.linalg import norm
-import math
 
+from compute_core import bin_array, my_interpolated_state, my_interpolated_state_onlyTA, my_delta_interpolate, \
+    ParametricInterpolator, interpolate_frame_amplitudes, interpolation_weights, interpolator_cache, \
+    cartesian_to_polar, polar_to_cartesian, samples_to_polar, PolarGeometry, check_steps, report_check, OperatorCache, \
+    FFTShift, interpolate_many, AmplitudeTable, as_amplitude_table
 
-sys.path.append('../sPOD/lib/')
-from sPOD_tools import shifted_rPCA, shifted_POD, give_interpolation_error, build_all_frames
-from transforms import transforms
-from farge_colormaps import farge_colormap_multi
+# Names shared with the sup modules through `from Helper import *`
+__all__ = ['np', 'os', 'meshgrid', 'plt', 'save_fig', 'farge_cmap',
+           'shifted_rPCA', 'give_interpolation_error', 'transforms',
+           'bin_array', 'my_interpolated_state', 'my_interpolated_state_onlyTA', 'my_delta_interpolate',
+           'ParametricInterpolator', 'interpolate_frame_amplitudes', 'interpolation_weights', 'interpolator_cache',
+           'cartesian_to_polar', 'polar_to_cartesian', 'samples_to_polar', 'PolarGeometry', 'check_steps',
+           'report_check', 'OperatorCache', 'FFTShift', 'interpolate_many', 'AmplitudeTable', 'as_amplitude_table',
+           'frame_transform', 'frame_transforms', 'reconstruct_frames', 'report_online_timing', 'BATCH_BYTES',
+           'batch_slices', 'reconstruct_batch', 'unstack_batch', 'sweep_reconstructions', 'cartesian_finish']
 
-plt.rcParams.update({
-    "text.usetex": True,
-    "font.family": "serif",
-    "font.serif": ["Computer Modern"]})
+SPOD_LIB = '../sPOD/lib/'
+
+# Default memory bound of the fields of a chunk in the batched reconstructions (reconstruct_batch)
+BATCH_BYTES = 512 * 1024 ** 2
 
 SMALL_SIZE = 16   # 16
 MEDIUM_SIZE = 18   # 18
 BIGGER_SIZE = 20   # 20
 
-plt.rc('font', size=SMALL_SIZE)          # controls default text sizes
-plt.rc('axes', titlesize=BIGGER_SIZE)     # fontsize of the axes title
-plt.rc('axes', labelsize=MEDIUM_SIZE)    # fontsize of the x and y labels
-plt.rc('xtick', labelsize=MEDIUM_SIZE)    # fontsize of the tick labels
-plt.rc('ytick', labelsize=MEDIUM_SIZE)    # fontsize of the tick labels
-plt.rc('legend', fontsize=SMALL_SIZE)    # legend fontsize
-plt.rc('figure', titlesize=BIGGER_SIZE)  # fontsize of the figure title
+_pyplot = None
+_farge_cmap = None
+_spod = None
 
-cm = farge_colormap_multi(type='velocity', etalement_du_zero=0.02, limite_faible_fort=0.15)
 
+def _load_spod():
+    # The sPOD library is only imported when the first transformation or sPOD run is made
+    global _spod
+    if _spod is None:
+        sys.path.append(SPOD_LIB)
+        import sPOD_tools
+        import transforms as spod_transforms
+        _spod = sPOD_tools, spod_transforms
+    return _spod
 
-def save_fig(filepath, figure=None, **kwargs):
-    import tikzplotlib
-    import os
-    import matplotlib.pyplot as plt
 
-    ## split extension
-    fpath = os.path.splitext(filepath)[0]
-    ## get figure handle
-    if figure is None:
-        figure = plt.gcf()
-    figure.savefig(fpath + ".png", dpi=200, transparent=True)
-    tikzplotlib.save(
-        figure=figure,
-        filepath=fpath + ".tex",
-        axis_height='\\figureheight',
-        axis_width='\\figurewidth',
-        override_externals=True,
-        **kwargs
-    )
+def transforms(data_shape, L, **kwargs):
+    """sPOD `transforms` of the given shape and domain (imports the sPOD library on first use)"""
+    return _load_spod()[1].transforms(data_shape, L, **kwargs)
 
 
-def bin_array(num, m):
-    """Convert a positive integer num into an m-bit bit vector"""
-    return np.flip(np.array(list(np.binary_repr(num).zfill(m))).astype(np.int8))
+def shifted_rPCA(*args, **kwargs):
+    return _load_spod()[0].shifted_rPCA(*args, **kwargs)
 
 
-def my_interpolated_state(Nmodes, U_list, frame_amplitude_list, mu_points, Nx, Ny, Nt, mu_vec, trafos_test):
+def give_interpolation_error(*args, **kwargs):
+    return _load_spod()[0].give_interpolation_error(*args, **kwargs)
 
-    TA_list = []
-    qtilde = 0
-    nf = 0
-    for U, frame_modes, amplitudes in zip(U_list, Nmodes, frame_amplitude_list):
 
-        VT = []
-        for k in range(frame_modes):
-            a = griddata(mu_points, amplitudes[k].T, mu_vec, method='linear')
-            VT.append(np.squeeze(a))
-        VT = np.asarray(VT)
-        TA_list.append(VT)
-        Q = U[:, :frame_modes] @ VT
-        qframe = np.reshape(Q, [Nx, Ny, 1, Nt])
+def _load_pyplot():
+    # matplotlib (and the LaTeX text setup) is only imported when the first plot is made
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib.pyplot as pyplot
 
-        qtilde += trafos_test[nf].apply(qframe)
+        pyplot.rcParams.update({
+            "text.usetex": True,
+            "font.family": "serif",
+            "font.serif": ["Computer Modern"]})
 
-        nf = nf + 1
+        pyplot.rc('font', size=SMALL_SIZE)          # controls default text sizes
+        pyplot.rc('axes', titlesize=BIGGER_SIZE)     # fontsize of the axes title
+        pyplot.rc('axes', labelsize=MEDIUM_SIZE)    # fontsize of the x and y labels
+        pyplot.rc('xtick', labelsize=MEDIUM_SIZE)    # fontsize of the tick labels
+        pyplot.rc('ytick', labelsize=MEDIUM_SIZE)    # fontsize of the tick labels
+        pyplot.rc('legend', fontsize=SMALL_SIZE)    # legend fontsize
+        pyplot.rc('figure', titlesize=BIGGER_SIZE)  # fontsize of the figure title
+        _pyplot = pyplot
+    return _pyplot
 
-    return qtilde, TA_list
 
+class _LazyPyplot:
+    """Stand-in for matplotlib.pyplot that imports and configures it on first attribute access"""
 
-def my_interpolated_state_onlyTA(Nmodes, frame_amplitude_list, mu_points, mu_vec):
+    def __getattr__(self, name):
+        return getattr(_load_pyplot(), name)
 
-    TA_list = []
-    for frame_modes, amplitudes in zip(Nmodes, frame_amplitude_list):
 
-        VT = []
-        for k in range(frame_modes):
-            a = griddata(mu_points, amplitudes[k].T, mu_vec, method='linear')
-            VT.append(np.squeeze(a))
-        VT = np.asarray(VT)
+plt = _LazyPyplot()
 
-        TA_list.append(VT)
 
-    return TA_list
+def farge_cmap():
+    """The Farge colormap used for the synthetic case (built on first use)"""
+    global _farge_cmap
+    if _farge_cmap is None:
+        from farge_colormaps import farge_colormap_multi
+        _farge_cmap = farge_colormap_multi(type='velocity', etalement_du_zero=0.02, limite_faible_fort=0.15)
+    return _farge_cmap
 
 
-def my_delta_interpolate(delta_list, mu_points, mu_vec):
-    from scipy import interpolate
+def save_fig(filepath, figure=None, **kwargs):
+    import tikzplotlib
+
+    plt = _load_pyplot()
 
-    shifts_list = []
-    for frame in range(len(delta_list)):
-        a = griddata(mu_points, delta_list[frame].T, mu_vec, method='linear')
-        a = np.asarray(a)
-        a = np.reshape(a, newshape=[-1])
+    ## split extension
+    fpath = os.path.splitext(filepath)[0]
+    ## get figure handle
+    if figure is None:
+        figure = plt.gcf()
+    figure.savefig(fpath + ".png", dpi=200, transparent=True)
+    tikzplotlib.save(
+        figure=figure,
+        filepath=fpath + ".tex",
+        axis_height='\\figureheight',
+        axis_width='\\figurewidth',
+        override_externals=True,
+        **kwargs
+    )
 
-        shifts_list.append(a)
 
-    return shifts_list
+def frame_transform(data_shape, L, shifts, trafo_type="shift", backend="lagrange", **kwargs):
+    """sPOD transformation of a frame for the online reconstruction, or None if it maps every field onto itself
+    (identity frames and frames whose shifts are all zero). Such frames are added without any transformation.
+
+    The predicted shifts differ from call to call, so the transformation is built directly and not cached.
+    `backend="fft"` (experimental, opt-in) shifts periodic 1D fields with `FFTShift` instead of the interpolation of
+    sPOD `transforms` (`interp_order` and `use_scipy_transform` are then not used). The domain must be periodic with
+    L = Nx * dx, otherwise the shifted field would wrap around the boundary."""
+    if trafo_type == "identity" or not np.any(shifts):
+        return None
+    if backend == "fft":
+        if trafo_type != "shift" or np.prod(data_shape[1:-1]) != 1:
+            raise ValueError("The fft shift backend supports 1D shifts only")
+        dx = np.ravel(kwargs['dx'])[0]
+        if not np.isclose(np.ravel(L)[0], data_shape[0] * dx):
+            raise ValueError("The fft shift backend needs a periodic domain with L = Nx * dx, got L = {} and "
+                             "Nx * dx = {}".format(np.ravel(L)[0], data_shape[0] * dx))
+        return FFTShift(data_shape, dx, shifts)
+    if backend != "lagrange":
+        raise ValueError("Unknown shift backend '{}'".format(backend))
+    return transforms(data_shape, L, shifts=shifts, trafo_type=trafo_type, **kwargs)
+
+
+def frame_transforms(data_shape, L, shifts, trafo_kwargs):
+    """Transformations of all frames of one online reconstruction, `shifts[k]` and `trafo_kwargs[k]` (dx, trafo_type,
+    backend, ...) of frame k. Returns the list of transformations (see `frame_transform`) and the process time spent
+    building them."""
+    tic = time.process_time()
+    trafos = [frame_transform(data_shape, L, shifts=s, **kwargs) for s, kwargs in zip(shifts, trafo_kwargs)]
+    return trafos, time.process_time() - tic
+
+
+def reconstruct_frames(U_list, TA_list, trafos, data_shape, dtype=np.float64):
+    """Transformed frames T_k(U_k @ TA_k) of one parameter, their sum is the sPOD reconstruction. Frames without a
+    transformation (None) are added as they are."""
+    frames = []
+    for U, TA, trafo in zip(U_list, TA_list, trafos):
+        q = np.reshape(U @ TA, data_shape)
+        frames.append(q if trafo is None else np.asarray(trafo.apply(q), dtype=dtype))
+    return frames
+
+
+def report_online_timing(trafo_sPOD, trafo_I, solution_sPOD, solution_I, solution_POD, conversion=None,
+                         verbose=False):
+    """Print the process times of the online reconstructions, the solution times exclude the transformations.
+    With `verbose`, the state of the interpolation weight cache is printed as well."""
+    print('Timing...')
+    print(f"Time consumption in assembling the transformation operators (sPOD-NN) : {trafo_sPOD:0.4f} seconds")
+    print(f"Time consumption in assembling the transformation operators (sPOD-I) : {trafo_I:0.4f} seconds")
+    print(f"Time consumption in assembling the final solution (sPOD-NN) : {solution_sPOD:0.4f} seconds")
+    print(f"Time consumption in assembling the final solution (sPOD-I)  : {solution_I:0.4f} seconds")
+    print(f"Time consumption in assembling the final solution (POD-NN)  : {solution_POD:0.4f} seconds")
+    if conversion is not None:
+        print(f"Time consumption in converting from cart-polar-cart  : {conversion:0.4f} seconds")
+    if verbose:
+        print("Interpolation weights: {}".format(interpolator_cache))
+
+
+def batch_slices(K, param_bytes, batch_size=None, max_bytes=None):
+    """Slices of the K parameters reconstructed together: `batch_size` parameters at a time, or by default as many as
+    keep their `param_bytes` each below `max_bytes` (BATCH_BYTES, at least one parameter per slice)"""
+    if batch_size is None:
+        max_bytes = BATCH_BYTES if max_bytes is None else max_bytes
+        batch_size = max(1, int(max_bytes // max(param_bytes, 1)))
+    return [slice(k, min(k + batch_size, K)) for k in range(0, K, batch_size)]
+
+
+def reconstruct_batch(U_list, TA_batch, shifts_batch, data_shape, L, trafo_kwargs, dtype=np.float64, batch_size=None,
+                      max_bytes=None):
+    """sPOD reconstructions sum_k T_k(U_k @ TA_k) of K test parameters, stacked along time in chunks.
+
+    `TA_batch[k]` and `shifts_batch[k]` are the lists of the K predicted time amplitudes [r_k, Nt] and shifts [..., Nt]
+    of frame k (None for an identity frame), `trafo_kwargs[k]` the remaining arguments of its transformation (dx,
+    trafo_type, ...). The parameters of a chunk share one transformation and one product U_k @ [TA_k^1 ... TA_k^n] per
+    frame. Chunks hold `batch_size` parameters, by default as many as keep the fields of a chunk (frame fields,
+    transformed fields and the sum) below `max_bytes`; the transformations are not cached.
+
+    Generator of (chunk, Q): the slice of the parameters and their stacked reconstruction of shape
+    data_shape[:-1] + [n * Nt], np.split(Q, n, axis=-1) gives the single parameters.
+    """
+    K = len(TA_batch[0])
+    param_bytes = (2 * len(U_list) + 1) * int(np.prod(data_shape)) * np.dtype(dtype).itemsize
+    for chunk in batch_slices(K, param_bytes, batch_size, max_bytes):
+        batch_shape = list(data_shape[:-1]) + [(chunk.stop - chunk.start) * data_shape[-1]]
+        Q = np.zeros(batch_shape, dtype=dtype)
+        for U, TA, shifts, kwargs in zip(U_list, TA_batch, shifts_batch, trafo_kwargs):
+            q = np.reshape(U @ np.concatenate(TA[chunk], axis=1), batch_shape)
+            shifts = None if shifts is None else np.concatenate([np.asarray(s) for s in shifts[chunk]], axis=-1)
+            trafo = frame_transform(batch_shape, L, shifts=shifts, **kwargs)
+            Q += q if trafo is None else np.asarray(trafo.apply(q), dtype=dtype)
+        yield chunk, Q
+
+
+def unstack_batch(batches, finish=None):
+    """Generator of the single reconstructions from the chunks (chunk, Q) of `reconstruct_batch`. `finish(chunk, Q)`
+    is applied to every stacked chunk first (e.g. the mapping back to the cartesian grid)."""
+    for chunk, Q in batches:
+        if finish is not None:
+            Q = finish(chunk, Q)
+        yield from np.split(Q, chunk.stop - chunk.start, axis=-1)
+
+
+def sweep_reconstructions(U_list, TA, shifts_batch, data_shape, L, trafo_kwargs, dtype=np.float64, finish=None,
+                          batch_size=None, max_bytes=None):
+    """Generator of the K reconstructions of a sPOD-I parameter sweep (see `reconstruct_batch`, `unstack_batch`).
+
+    `TA[k]` are the interpolated amplitudes [K, frame_modes, Nt] and `shifts_batch[k]` the K interpolated shifts (None
+    for an identity frame) of the frames k reconstructed on the grid `data_shape`, with the first frame_modes columns
+    of `U_list[k]`. `finish(chunk, Q)` completes every chunk (e.g. the mapping back to the cartesian grid).
+    """
+    U_list = [np.asarray(U[:, :np.size(ta, 1)], dtype=dtype) for U, ta in zip(U_list, TA)]
+    TA_batch = [list(np.asarray(ta, dtype=dtype)) for ta in TA]
+    return unstack_batch(reconstruct_batch(U_list, TA_batch, shifts_batch, data_shape, L, trafo_kwargs, dtype=dtype,
+                                           batch_size=batch_size, max_bytes=max_bytes), finish)
+
+
+def cartesian_finish(geometry, t, U_cart, TA_list):
+    """`finish` step of the batched reconstructions of the polar 2D cases. The stacked polar reconstruction of a chunk
+    is mapped back to the cartesian grid, the identity frame is added from its modes premapped to the cartesian grid
+    `U_cart` and the amplitudes TA_list[k] [frame_modes, Nt] of the parameters k."""
+    def finish(chunk, Q_polar):
+        return polar_to_cartesian(Q_polar, t, aux=geometry) + \
+            np.reshape(U_cart @ np.concatenate(TA_list[chunk], axis=1), Q_polar.shape)
+    return finish
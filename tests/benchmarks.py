@@ -0,0 +1,221 @@
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def time_call(func, *args, repeat=1, memory=True, **kwargs):
+    """Call `func` `repeat` times and return the last result, the best wall time and the peak traced memory in bytes.
+
+    The timed calls run without tracemalloc, which slows down allocation heavy code considerably. The peak memory is
+    taken in one additional traced call (0 with `memory=False`).
+    """
+    best = np.inf
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        result = func(*args, **kwargs)
+        toc = time.perf_counter()
+        best = min(best, toc - tic)
+
+    peak = 0
+    if memory:
+        tracemalloc.start()
+        func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result, best, peak
+
+
+def _relative_difference(value, reference):
+    value = np.asarray(value, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    den = np.linalg.norm(reference)
+    return np.linalg.norm(value - reference) / den if den > 0 else np.linalg.norm(value)
+
+
+def precision_report(run, dtypes=(np.float64, np.float32), repeat=1):
+    """Compare the results, timings and memory of a pipeline run in different floating point precisions.
+
+    `run(dtype)` executes the pipeline in the given precision and returns a dict of named results. Scalars (e.g. the
+    relative errors printed by `plot_online_data`) are reported as they are, arrays (reconstructions, time amplitudes)
+    are reported as relative difference to the result of the first dtype, which is the reference.
+
+    So far it has only been run on the sPOD-free surrogate `polar_pod_pipeline` (see `__main__`), the float32 figures
+    of the sup classes with shifted_rPCA and the sPOD transformations are not measured yet. Example of such a run:
+
+        def run(dtype):
+            df = wildfire1D_sup(q_test, shifts_test, param_test_val, var, dtype=dtype)
+            q_frames, U_list, TA_train, TA_interp, modes = df.run_sPOD(spod_iter=100)
+            return {'qtilde': q_frames[-1]}
+
+        precision_report(run)
+    """
+    dtypes = [np.dtype(d) for d in dtypes]
+    results = {}
+    report = []
+    for dtype in dtypes:
+        result, wall, peak = time_call(run, dtype, repeat=repeat)
+        results[dtype] = result
+        report.append({'dtype': dtype.name, 'time': wall, 'peak_memory': peak, 'values': {}})
+
+    reference = results[dtypes[0]]
+    for row, dtype in zip(report, dtypes):
+        for key, value in results[dtype].items():
+            if np.ndim(value) == 0:
+                row['values'][key] = float(value)
+            else:
+                row['values'][key] = _relative_difference(value, reference[key])
+
+    print("#############################################")
+    print("Precision report (arrays: relative difference to {})".format(dtypes[0].name))
+    for row in report:
+        print("{:>8s} : time {:8.4f} s, peak memory {:8.1f} MB".format(row['dtype'], row['time'],
+                                                                     row['peak_memory'] / 2 ** 20))
+        for key, value in row['values'].items():
+            print("           {} : {:.4e}".format(key, value))
+
+    return report
+
+
+def polar_pod_pipeline(dtype, Nx=128, Nt=200, mu_train=(540, 550, 560, 570, 580), mu_test=558.49, modes=20):
+    """Run of the 2D pipeline stages that do not need the sPOD library, in precision `dtype`, for `precision_report`.
+
+    A radially spreading front (front speed proportional to mu) is converted to polar coordinates for all training
+    parameters (`samples_to_polar`), reduced by a POD of the polar training matrix, interpolated to `mu_test` (sPOD-I
+    amplitude interpolation) and mapped back to the cartesian grid. shifted_rPCA and the shift transformations are not
+    part of it.
+    """
+    from compute_core import PolarGeometry, samples_to_polar, AmplitudeTable, interpolate_frame_amplitudes
+
+    dtype = np.dtype(dtype)
+    x = np.arange(Nx, dtype=np.float64)
+    t = np.linspace(0, 1, Nt)
+    X, Y = np.meshgrid(x, x, indexing='ij')
+    r = np.sqrt((X - x[-1] // 2) ** 2 + (Y - x[-1] // 2) ** 2)
+
+    def snapshots(mu):
+        front = 0.05 * Nx + 0.35 * Nx * mu / max(mu_train) * t
+        return np.reshape(np.exp(-((r[..., None] - front) / (0.03 * Nx)) ** 2), [Nx, Nx, 1, Nt])
+
+    geometry = PolarGeometry(x, x)
+    samples = [snapshots(mu).astype(dtype) for mu in mu_train]
+    Q_polar = samples_to_polar(samples, geometry, np.empty([Nx * Nx, len(mu_train) * Nt], dtype=dtype))
+
+    U, S, VT = np.linalg.svd(Q_polar, full_matrices=False)
+    U = U[:, :modes]
+    TA = S[:modes, None] * VT[:modes, :]
+    table = AmplitudeTable.from_training([TA], len(mu_train), Nt)
+    TA_test = interpolate_frame_amplitudes([modes], table, np.asarray(mu_train), np.asarray([mu_test]))[0]
+
+    q_polar = np.reshape(U @ np.asarray(TA_test, dtype=dtype), [Nx, Nx, 1, Nt])
+    q_cart = geometry.to_cartesian()(q_polar, dtype=dtype)
+    exact = snapshots(mu_test)
+
+    return {'error': _relative_difference(q_cart, exact), 'singular_values': S[:modes], 'reconstruction': q_cart}
+
+
+def shift_backend_benchmark(grid_sizes=(500,), Nt=500, max_shift=0.3, repeat=3, backends=("lagrange", "fft")):
+    """Speed and accuracy of the shift backends of the 1D online reconstruction, "lagrange" (sPOD `transforms` with
+    interp_order=5) and "fft" (`FFTShift`), for a smooth periodic field (period L = Nx * dx) moved by a known shift per
+    time step. With both backends, `fft_difference` is the relative difference of the lagrange to the fft result.
+
+    Only the "fft" backend is run with backends=("fft",), e.g. where the sPOD library is not available.
+    """
+    from compute_core import FFTShift
+    if "lagrange" in backends:
+        from transforms import transforms
+
+    report = []
+    for Nx in grid_sizes:
+        L = 1.0
+        dx = L / Nx
+        x = np.arange(Nx) * dx
+        shifts = np.linspace(0, max_shift * L, Nt)
+        data_shape = [Nx, 1, 1, Nt]
+
+        def field(shift):
+            return np.exp(-((np.mod(x[:, None] - shift, L) - L / 2) / (0.05 * L)) ** 2)
+
+        q = np.reshape(np.tile(field(0), [1, Nt]), data_shape)
+        exact = field(shifts[None, :])
+        builders = {
+            'lagrange': lambda: transforms(data_shape, [L], shifts=shifts, dx=[dx], use_scipy_transform=False,
+                                           interp_order=5),
+            'fft': lambda: FFTShift(data_shape, dx, shifts)}
+        results, rows = {}, {}
+        for name in backends:
+            trafo, build_time, _ = time_call(builders[name], memory=False)
+            q_shifted, apply_time, peak = time_call(trafo.apply, q, repeat=repeat)
+            results[name] = np.reshape(q_shifted, [Nx, Nt])
+            rows[name] = {'Nx': Nx, 'backend': name, 'build': build_time, 'apply': apply_time, 'peak_memory': peak,
+                          'error': _relative_difference(results[name], exact), 'fft_difference': np.nan}
+            report.append(rows[name])
+        if 'lagrange' in results and 'fft' in results:
+            rows['lagrange']['fft_difference'] = _relative_difference(results['lagrange'], results['fft'])
+
+    print("#############################################")
+    print("Shift backends ({} time steps, relative error to the exact shift)".format(Nt))
+    for row in report:
+        print("Nx {:6d} {:>9s} : build {:8.4f} s, apply {:8.4f} s, peak memory {:8.1f} MB, error {:.4e}, "
+              "difference to fft {:.4e}".format(row['Nx'], row['backend'], row['build'], row['apply'],
+                                               row['peak_memory'] / 2 ** 20, row['error'], row['fft_difference']))
+
+    return report
+
+
+def interpolation_benchmark(n_train=(5, 100, 1000), n_dims=(1, 2), methods=("linear", "idw", "rbf"), n_query=100,
+                            n_series=200, seed=0):
+    """Build time, query latency and accuracy of the sPOD-I parameter space interpolation (`ParametricInterpolator`)
+    for growing numbers of training parameters and parameter dimensions.
+
+    The training values are `n_series` stacked series (modes x time steps) of a smooth test function, the accuracy is
+    the relative error at `n_query` test parameters inside the training range (nan if a method leaves some of them
+    undefined, e.g. "linear" outside of the convex hull).
+    """
+    from compute_core import ParametricInterpolator
+
+    rng = np.random.default_rng(seed)
+    report = []
+    for d in n_dims:
+        for n in n_train:
+            if n <= d + 1:
+                continue
+            points = rng.uniform(size=(n, d)) if d > 1 else np.linspace(0, 1, n)[:, None]
+            queries = rng.uniform(0.1, 0.9, size=(n_query, d))
+            freq = np.linspace(1, 3, n_series)
+
+            def field(p):
+                return np.sin(np.sum(p, axis=1)[:, None] * freq[None, :])
+
+            values = field(points)
+            exact = field(queries)
+            for method in methods:
+                interpolator, build_time, _ = time_call(ParametricInterpolator, points, queries, method=method,
+                                                        memory=False)
+                result, query_time, _ = time_call(interpolator, values, repeat=3, memory=False)
+                report.append({'dims': d, 'n_train': n, 'method': method, 'build': build_time,
+                               'query': query_time, 'error': _relative_difference(result, exact)})
+
+    print("#############################################")
+    print("sPOD-I interpolation ({} test parameters, {} series)".format(n_query, n_series))
+    for row in report:
+        print("dims {:2d}, {:6d} training parameters, {:>6s} : build {:8.4f} s, query {:8.4f} s, error {:.4e}".format(
+            row['dims'], row['n_train'], row['method'], row['build'], row['query'], row['error']))
+
+    return report
+
+
+if __name__ == "__main__":
+    # The reports that run without the wildfire data. The "lagrange" shift backend needs the sPOD submodule
+    import importlib.util
+    import sys
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sPOD', 'lib'))
+    shift_backends = ("lagrange", "fft")
+    if importlib.util.find_spec("transforms") is None:
+        print("sPOD library not found in ../sPOD/lib, only the fft shift backend is benchmarked")
+        shift_backends = ("fft",)
+    precision_report(polar_pod_pipeline, repeat=2)
+    shift_backend_benchmark(grid_sizes=(500, 1000, 3000), backends=shift_backends)
+    interpolation_benchmark()
@@ -0,0 +1,696 @@
+from collections import OrderedDict
+import hashlib
+
+from scipy import fft, ndimage, sparse
+import numpy as np
+
+# Compute-only routines of the sPOD-NN / sPOD-I pipelines (interpolation, reconstruction, polar mapping). This module
+# has no plotting dependencies and no import side effects, so it can be used on headless batch workers.
+
+
+def bin_array(num, m):
+    """Convert a positive integer num into an m-bit bit vector"""
+    return np.flip(np.array(list(np.binary_repr(num).zfill(m))).astype(np.int8))
+
+
+def _scaled_points(points, xi):
+    # Parameter dimensions of different magnitude (e.g. ignition temperature and wind speed) are scaled to [0, 1]
+    low = np.min(points, axis=0)
+    span = np.ptp(points, axis=0)
+    span[span == 0] = 1
+    return (points - low) / span, (xi - low) / span
+
+
+def _thin_plate(r):
+    return np.where(r > 0, r ** 2 * np.log(np.maximum(r, 1e-300)), 0.0)
+
+
+class ParametricInterpolator:
+    """Interpolation from the training parameters `mu_points` to the test parameters `mu_vec` as weighted sums over
+    the training samples. The weights are computed once, each call is then one weighted sum over the sample axis of a
+    stacked values array.
+
+    `method` is
+        "linear": piecewise linear, equal to griddata(mu_points, values, mu_vec, method='linear') (nan outside of the
+                  training parameters). The bracketing interval (1D, searchsorted) or Delaunay simplex is used.
+        "idw":    inverse distance weighting of the `k` nearest training parameters (KD-tree), for many training
+                  parameters in several dimensions.
+        "rbf":    thin plate spline radial basis function interpolation with a linear polynomial, the LU factorization
+                  of the interpolation matrix is computed once and gives the (dense) weights of all test parameters.
+    """
+
+    def __init__(self, mu_points, mu_vec, method="linear", k=8, power=2):
+        points = np.asarray(mu_points, dtype=np.float64)
+        xi = np.asarray(mu_vec, dtype=np.float64)
+        self.method = method
+        self.outside = None
+        if points.ndim == 1 or points.shape[1] == 1:
+            points = np.reshape(points, [-1, 1])
+        xi = np.reshape(xi, [-1, points.shape[1]])
+
+        if method == "linear" and points.shape[1] == 1:
+            p = np.ravel(points)
+            order = np.argsort(p)
+            p_sorted = p[order]
+            x = np.ravel(xi)
+            i = np.clip(np.searchsorted(p_sorted, x) - 1, 0, len(p) - 2)
+            w = (x - p_sorted[i]) / (p_sorted[i + 1] - p_sorted[i])
+            self.indices = order[np.stack([i, i + 1], axis=1)]
+            self.weights = np.stack([1 - w, w], axis=1)
+            self.outside = (x < p_sorted[0]) | (x > p_sorted[-1])
+        elif method == "linear":
+            from scipy.spatial import Delaunay
+
+            tri = Delaunay(points)
+            simplex = tri.find_simplex(xi)
+            T = tri.transform[simplex]
+            b = np.einsum('mij,mj->mi', T[:, :-1], xi - T[:, -1])
+            self.indices = tri.simplices[simplex]
+            self.weights = np.concatenate([b, 1 - np.sum(b, axis=1, keepdims=True)], axis=1)
+            self.outside = simplex < 0
+        elif method == "idw":
+            from scipy.spatial import cKDTree
+
+            points, xi = _scaled_points(points, xi)
+            k = min(k, len(points))
+            dist, idx = cKDTree(points).query(xi, k=k)
+            dist, idx = np.reshape(dist, [len(xi), k]), np.reshape(idx, [len(xi), k])
+            with np.errstate(divide='ignore'):
+                w = 1 / dist ** power
+            exact = dist[:, 0] == 0
+            w[exact] = 0
+            w[exact, 0] = 1
+            self.indices = idx
+            self.weights = w / np.sum(w, axis=1, keepdims=True)
+        elif method == "rbf":
+            from scipy.linalg import lu_factor, lu_solve
+
+            points, xi = _scaled_points(points, xi)
+            N, d = points.shape
+            P = np.hstack([np.ones([N, 1]), points])
+            A = np.zeros([N + d + 1, N + d + 1])
+            A[:N, :N] = _thin_plate(np.linalg.norm(points[:, None] - points[None], axis=-1))
+            A[:N, N:] = P
+            A[N:, :N] = P.T
+            self.factorization = lu_factor(A)
+            rhs = np.vstack([_thin_plate(np.linalg.norm(points[:, None] - xi[None], axis=-1)),
+                             np.hstack([np.ones([len(xi), 1]), xi]).T])
+            # value(xi) = [phi(xi), p(xi)] @ A^-1 @ [values, 0], A is symmetric
+            self.indices = None
+            self.weights = lu_solve(self.factorization, rhs)[:N].T
+        else:
+            raise ValueError("Unknown interpolation method '{}'".format(method))
+
+    def __call__(self, values):
+        """Interpolate `values` [Nsamples, ...] (any number of stacked modes, frames, time steps behind the sample
+        axis) to the test parameters, returns [len(mu_vec), ...]"""
+        values = np.asarray(values)
+        if self.indices is None:
+            # Dense weights (rbf), one matrix product over all samples
+            result = np.reshape(self.weights @ np.reshape(values, [len(values), -1]),
+                                (len(self.weights),) + values.shape[1:])
+        else:
+            weights = np.reshape(self.weights, self.weights.shape + (1,) * (values.ndim - 1))
+            result = np.sum(weights * values[self.indices], axis=1)
+        if self.outside is not None:
+            result[self.outside] = np.nan
+        return result
+
+
+def interpolation_weights(mu_points, mu_vec, method="linear", **options):
+    """`ParametricInterpolator` from `mu_points` to the (batch of) query parameters `mu_vec`, taken from
+    `interpolator_cache` if it was computed before. The weights are shared by all shifts, modes and frames."""
+    return interpolator_cache(mu_points, mu_vec, method=method, **options)
+
+
+class AmplitudeTable:
+    """Time amplitudes of all frames and modes of the training parameters in one contiguous array
+    `data` [total_modes, Nt, Nsamples], the modes of frame f are the rows offsets[f]:offsets[f + 1].
+
+    Frames, modes and time steps are sliced as views of the one buffer. For compatibility with the nested lists used
+    before, table[f] is the [frame_modes, Nt, Nsamples] block of frame f and table[f][m] the [Nt, Nsamples] amplitude
+    of mode m.
+    """
+
+    def __init__(self, data, modes):
+        self.data = data
+        self.modes = [int(m) for m in modes]
+        self.offsets = np.cumsum([0] + self.modes)
+        if self.offsets[-1] != np.size(data, 0):
+            raise ValueError("{} modes given for an amplitude table of {} rows".format(self.offsets[-1],
+                                                                                      np.size(data, 0)))
+
+    @classmethod
+    def from_training(cls, VT_list, Nsamples, Nt, dtype=None):
+        """Table of the training amplitudes VT [frame_modes, Nsamples * Nt] of every frame"""
+        modes = [np.size(VT, 0) for VT in VT_list]
+        dtype = np.result_type(*VT_list) if dtype is None else dtype
+        data = np.empty([sum(modes), Nt, Nsamples], dtype=dtype)
+        table = cls(data, modes)
+        for f, VT in enumerate(VT_list):
+            table.frame(f)[...] = np.transpose(np.reshape(VT, [modes[f], Nsamples, Nt]), [0, 2, 1])
+        return table
+
+    @classmethod
+    def from_frames(cls, frame_amplitude_list):
+        """Table of nested lists frame_amplitude_list[f][m] of [Nt, Nsamples] amplitudes (as stored before)"""
+        modes = [len(amplitudes) for amplitudes in frame_amplitude_list]
+        return cls(np.stack([a for amplitudes in frame_amplitude_list for a in amplitudes]), modes)
+
+    @property
+    def Nt(self):
+        return np.size(self.data, 1)
+
+    def frame(self, f):
+        return self.data[self.offsets[f]:self.offsets[f + 1]]
+
+    def mode(self, f, m):
+        return self.data[self.offsets[f] + m]
+
+    def at_time(self, t):
+        """Table of the single time step `t` (a view, nothing is copied)"""
+        return AmplitudeTable(self.data[:, t:t + 1], self.modes)
+
+    def samples_first(self, Nmodes=None):
+        """[Nsamples, modes, Nt] view of the first Nmodes[f] modes of every frame, as interpolated over the samples"""
+        if Nmodes is None or list(Nmodes) == self.modes:
+            return np.moveaxis(self.data, 2, 0)
+        rows = np.concatenate([np.arange(o, o + m) for o, m in zip(self.offsets, Nmodes)])
+        return np.moveaxis(self.data[rows], 2, 0)
+
+    def __getitem__(self, f):
+        return self.frame(f)
+
+    def __len__(self):
+        return len(self.modes)
+
+    def __iter__(self):
+        return (self.frame(f) for f in range(len(self.modes)))
+
+
+def as_amplitude_table(frame_amplitude_list):
+    """`AmplitudeTable` of nested amplitude lists, tables are returned as they are"""
+    if isinstance(frame_amplitude_list, AmplitudeTable):
+        return frame_amplitude_list
+    return AmplitudeTable.from_frames(frame_amplitude_list)
+
+
+def _interpolate_stacked(series, mu_points, mu_vec, interpolator=None, method="linear"):
+    # `series` are [Nt, Nsamples] arrays (mode amplitudes, shifts), they are interpolated together in one pass and
+    # returned as [len(mu_vec), len(series), Nt]
+    if interpolator is None:
+        interpolator = interpolation_weights(mu_points, mu_vec, method)
+    return interpolator(np.stack([np.asarray(a).T for a in series], axis=1))
+
+
+def _interpolate_amplitudes(Nmodes, frame_amplitude_list, mu_points, mu_vec, interpolator, method):
+    # [len(mu_vec), sum(Nmodes), Nt], an AmplitudeTable is interpolated directly from its buffer
+    if isinstance(frame_amplitude_list, AmplitudeTable):
+        if interpolator is None:
+            interpolator = interpolation_weights(mu_points, mu_vec, method)
+        return interpolator(frame_amplitude_list.samples_first(Nmodes))
+    series = [amplitudes[k] for frame_modes, amplitudes in zip(Nmodes, frame_amplitude_list)
+              for k in range(frame_modes)]
+    return _interpolate_stacked(series, mu_points, mu_vec, interpolator, method)
+
+
+def _frame_amplitudes(values):
+    # [len(mu_vec), frame_modes, Nt] -> per mode squeezed amplitudes as returned by the griddata calls before
+    values = np.moveaxis(values, 1, 0)
+    return np.squeeze(values, axis=tuple(ax for ax in (1, 2) if values.shape[ax] == 1))
+
+
+def interpolate_frame_amplitudes(Nmodes, frame_amplitude_list, mu_points, mu_vec, interpolator=None, method="linear"):
+    """Interpolated time amplitudes of all frames, all modes of all frames are interpolated in a single pass"""
+    values = _interpolate_amplitudes(Nmodes, frame_amplitude_list, mu_points, mu_vec, interpolator, method)
+    offsets = np.cumsum([0] + list(Nmodes))
+    return [_frame_amplitudes(values[:, offsets[f]:offsets[f + 1]]) for f in range(len(offsets) - 1)]
+
+
+def my_interpolated_state(Nmodes, U_list, frame_amplitude_list, mu_points, Nx, Ny, Nt, mu_vec, trafos_test,
+                          frame_wise=False, interpolator=None, method="linear"):
+    """Interpolated state sum_k T_k(U_k @ VT_k) of the test parameter, with `frame_wise=True` the list of the
+    transformed frames T_k(U_k @ VT_k) is returned instead of their sum. `method` selects the parameter space
+    interpolation ("linear", "idw", "rbf", see `ParametricInterpolator`) if no `interpolator` is given."""
+
+    TA_list = []
+    qtilde = 0
+    qframes = []
+    nf = 0
+    VT_list = interpolate_frame_amplitudes(Nmodes, frame_amplitude_list, mu_points, mu_vec, interpolator, method)
+    for U, frame_modes, VT in zip(U_list, Nmodes, VT_list):
+
+        # The interpolated state is computed in the precision of the mode basis (float32 or float64)
+        VT = np.asarray(VT, dtype=U.dtype)
+        TA_list.append(VT)
+        Q = U[:, :frame_modes] @ VT
+        qframe = np.reshape(Q, [Nx, Ny, 1, Nt])
+
+        # A frame without transformation (None, see Helper.frame_transform) is added as it is
+        if trafos_test[nf] is not None:
+            qframe = np.asarray(trafos_test[nf].apply(qframe), dtype=U.dtype)
+        if frame_wise:
+            qframes.append(qframe)
+        else:
+            qtilde += qframe
+
+        nf = nf + 1
+
+    if frame_wise:
+        return qframes, TA_list
+    return qtilde, TA_list
+
+
+def my_interpolated_state_onlyTA(Nmodes, frame_amplitude_list, mu_points, mu_vec, interpolator=None, method="linear"):
+
+    return interpolate_frame_amplitudes(Nmodes, frame_amplitude_list, mu_points, mu_vec, interpolator, method)
+
+
+def interpolate_many(Nmodes, frame_amplitude_list, mu_points, mu_vecs, shift_series=(), method="linear",
+                     interpolator=None):
+    """sPOD-I amplitudes and shifts of K query parameters `mu_vecs` with one set of interpolation weights.
+
+    `shift_series` are the shift series [Nt, Nsamples] to interpolate along with the mode amplitudes (shift
+    components, or shift amplitudes of a `ShiftBasis`). Returns the amplitudes [K, frame_modes, Nt] of every frame and
+    the shifts [K, len(shift_series), Nt].
+    """
+    if interpolator is None:
+        interpolator = interpolation_weights(mu_points, mu_vecs, method)
+    values = _interpolate_amplitudes(Nmodes, frame_amplitude_list, mu_points, mu_vecs, interpolator, method)
+    offsets = np.cumsum([0] + list(Nmodes))
+    TA = [values[:, offsets[f]:offsets[f + 1]] for f in range(len(offsets) - 1)]
+    if len(shift_series) == 0:
+        return TA, values[:, :0]
+    return TA, _interpolate_stacked(shift_series, mu_points, mu_vecs, interpolator)
+
+
+def my_delta_interpolate(delta_list, mu_points, mu_vec, interpolator=None, method="linear"):
+    """Interpolated shifts of the test parameter, all shift series [Nt, Nsamples] of `delta_list` in one pass"""
+    values = _interpolate_stacked(delta_list, mu_points, mu_vec, interpolator, method)
+    return [np.reshape(values[:, f], [-1]) for f in range(len(delta_list))]
+
+
+def _polar_axes(X, Y):
+    # Center of the image and the regular (in polar space) grid spanning the min and max r & theta of the grid points
+    X_grid, Y_grid = np.meshgrid(X, Y)
+    X_c = X[-1] // 2
+    Y_c = Y[-1] // 2
+    X_new = X_grid - X_c  # Shift the origin to the center of the image
+    Y_new = Y_grid - Y_c
+    r = np.sqrt(X_new ** 2 + Y_new ** 2).flatten()  # polar coordinate r
+    theta = np.arctan2(Y_new, X_new).flatten()  # polar coordinate theta
+    r_i = np.linspace(np.min(r), np.max(r), np.size(X))
+    theta_i = np.linspace(np.min(theta), np.max(theta), np.size(Y))
+    return X_c, Y_c, r_i, theta_i
+
+
+def _spline_weights(c, order):
+    # Indices and weights of the B-spline of `order` (1 or 3) at the coordinates `c`
+    f = np.floor(c)
+    t = c - f
+    if order == 1:
+        return f.astype(int), [1 - t, t]
+    w = [(1 - t) ** 3 / 6, (3 * t ** 3 - 6 * t ** 2 + 4) / 6, (-3 * t ** 3 + 3 * t ** 2 + 3 * t + 1) / 6, t ** 3 / 6]
+    return f.astype(int) - 1, w
+
+
+def _mirror(i, n):
+    # Boundary extension of the spline coefficients used by scipy.ndimage for mode='constant'
+    p = 2 * (n - 1)
+    i = np.abs(i) % p
+    return np.where(i > n - 1, p - i, i)
+
+
+class SparseResampler:
+    """Spline interpolation of [n0, n1, 1, Nt] blocks at fixed points, precomputed as a sparse operator.
+
+    Reproduces what polarTransform does for every image (scipy.ndimage.map_coordinates of `order` on the edge padded
+    image, `fill_val` outside of it) for all time steps of a block at once: the block is spline filtered along the two
+    spatial axes and all time steps are resampled with one sparse product. `c0`, `c1` are the coordinates (in index
+    space of the unpadded input) of the output points, in the order of the flattened `out_shape`.
+    """
+
+    pad = 3
+
+    def __init__(self, in_shape, c0, c1, out_shape, order=3, fill_val=0):
+        self.in_shape = tuple(in_shape)
+        self.out_shape = tuple(out_shape)
+        self.order = order
+        self.fill_val = fill_val
+
+        c0 = np.asarray(c0).flatten() + self.pad
+        c1 = np.asarray(c1).flatten() + self.pad
+        n0, n1 = self.in_shape[0] + 2 * self.pad, self.in_shape[1] + 2 * self.pad
+        inside = (c0 >= 0) & (c0 <= n0 - 1) & (c1 >= 0) & (c1 <= n1 - 1)
+        self.outside = ~inside
+        points = np.flatnonzero(inside)
+        i0, w0 = _spline_weights(c0[inside], order)
+        j0, w1 = _spline_weights(c1[inside], order)
+
+        rows, cols, vals = [], [], []
+        for a, wa in enumerate(w0):
+            for b, wb in enumerate(w1):
+                rows.append(points)
+                cols.append(_mirror(i0 + a, n0) * n1 + _mirror(j0 + b, n1))
+                vals.append(wa * wb)
+        self.matrix = sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                                        shape=(np.size(c0), n0 * n1))
+        self._matrices = {self.matrix.dtype: self.matrix}
+
+    def operator(self, dtype):
+        """The sparse operator in precision `dtype` (float32 copies are made once and kept)"""
+        dtype = np.dtype(dtype)
+        if dtype not in self._matrices:
+            self._matrices[dtype] = self.matrix.astype(dtype)
+        return self._matrices[dtype]
+
+    def coefficients(self, data):
+        """Edge padded spline coefficients of a [n0, n1, 1, Nt] block, flattened to [(n0 + 6) * (n1 + 6), Nt].
+        They are computed in the precision of the data (float32 or float64, float64 for integer data)."""
+        Nt = np.size(data, -1)
+        data = np.reshape(data, [self.in_shape[0], self.in_shape[1], Nt])
+        coeffs = np.pad(data, ((self.pad, self.pad), (self.pad, self.pad), (0, 0)), mode='edge')
+        coeffs = coeffs.astype(np.result_type(coeffs.dtype, np.float32), copy=False)
+        if self.order > 1:
+            for axis in (0, 1):
+                ndimage.spline_filter1d(coeffs, self.order, axis=axis, mode='constant', output=coeffs)
+        return np.reshape(coeffs, [-1, Nt])
+
+    def __call__(self, data, out=None, dtype=np.float64):
+        """Resample the [n0, n1, 1, Nt] block, into `out` (of shape out_shape + [1, Nt]) if given"""
+        Nt = np.size(data, -1)
+        shape = self.out_shape + (1, Nt)
+        coeffs = self.coefficients(data)
+        values = self.operator(coeffs.dtype) @ coeffs
+        if self.fill_val != 0:
+            values[self.outside] = self.fill_val
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif out.shape != shape:
+            raise ValueError("out has shape {}, expected {}".format(out.shape, shape))
+        out[...] = np.reshape(values, shape)
+        return out
+
+    def map_basis(self, U):
+        """Resample the columns of a mode basis U [n0 * n1, modes], i.e. return P @ U [N_out, modes].
+
+        With `fill_val=0` the resampling is linear, so a field U @ A can be resampled as (P @ U) @ A.
+        """
+        modes = np.size(U, -1)
+        out = self(np.reshape(U, [self.in_shape[0], self.in_shape[1], 1, modes]), dtype=U.dtype)
+        return np.reshape(out, [-1, modes])
+
+
+class PolarGeometry:
+    """Polar grid of the cartesian [Nx, Ny] grid (X, Y) used by `cartesian_to_polar` and `polar_to_cartesian`.
+
+    Holds the polar axes r_i, theta_i, the grid spacing d_del and extent L used for the sPOD transformations and the
+    sparse cartesian <-> polar resampling operators, which are built on first use and then shared by all users of
+    the object. The geometry is fixed at construction. Pickling stores only the grid, the operators are rebuilt.
+    """
+
+    # Number of mode bases premapped to the cartesian grid kept by `cartesian_basis`
+    max_bases = 4
+
+    def __init__(self, X, Y, order=3, fill_val=0):
+        self.X = np.array(X)
+        self.Y = np.array(Y)
+        self.X.flags.writeable = False
+        self.Y.flags.writeable = False
+        self.order = order
+        self.fill_val = fill_val
+        self.Nx = np.size(X)
+        self.Ny = np.size(Y)
+        self.N_r = self.Nx
+        self.N_theta = self.Ny
+        self.X_c, self.Y_c, self.r_i, self.theta_i = _polar_axes(self.X, self.Y)
+        self.r_i.flags.writeable = False
+        self.theta_i.flags.writeable = False
+        self._to_polar = None
+        self._to_cartesian = None
+        self._cartesian_bases = OrderedDict()
+
+    def __getstate__(self):
+        return {'X': self.X, 'Y': self.Y, 'order': self.order, 'fill_val': self.fill_val}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def d_del(self):
+        return np.asarray([self.r_i[1] - self.r_i[0], self.theta_i[1] - self.theta_i[0]])
+
+    @property
+    def L(self):
+        return np.asarray([self.r_i[-1], self.theta_i[-1]])
+
+    def to_polar(self):
+        """Cartesian -> polar operator, equal to polarTransform.convertToPolarImage with the settings of this grid"""
+        if self._to_polar is None:
+            # Sampling points as in polarTransform: image axis 0 is y, axis 1 is x
+            radii = np.linspace(np.min(self.r_i), np.max(self.r_i), self.N_r, endpoint=False)
+            angles = np.linspace(np.min(self.theta_i), np.max(self.theta_i), self.N_theta, endpoint=False)
+            r, theta = np.meshgrid(radii, angles, indexing='ij')
+            x = r * np.cos(theta) + self.X_c
+            y = r * np.sin(theta) + self.Y_c
+            self._to_polar = SparseResampler((self.Nx, self.Ny), y, x, (self.N_r, self.N_theta), order=self.order,
+                                             fill_val=self.fill_val)
+        return self._to_polar
+
+    def to_cartesian(self):
+        """Polar -> cartesian operator, equal to polarTransform.convertToCartesianImage with the settings of this grid"""
+        if self._to_cartesian is None:
+            r_min, r_max = np.min(self.r_i), np.max(self.r_i)
+            theta_min, theta_max = np.min(self.theta_i), np.max(self.theta_i)
+            # Polar coordinates of the cartesian pixels, scaled to polar index space as in polarTransform
+            x, y = np.meshgrid(np.arange(self.Ny), np.arange(self.Nx))
+            cX, cY = x - self.X_c, y - self.Y_c
+            r = np.sqrt(cX ** 2 + cY ** 2)
+            theta = np.arctan2(cY, cX)
+            theta = np.where(theta < 0, theta + 2 * np.pi, theta)
+            r = (r - r_min) * (self.N_r / (r_max - r_min))
+            theta = np.mod(theta - theta_min + 2 * np.pi, 2 * np.pi) * (self.N_theta / (theta_max - theta_min))
+            self._to_cartesian = SparseResampler((self.N_r, self.N_theta), r, theta, (self.Nx, self.Ny),
+                                                 order=self.order)
+        return self._to_cartesian
+
+    def cartesian_basis(self, U):
+        """Polar mode basis U [N_r * N_theta, modes] mapped to the cartesian grid, P @ U [Nx * Ny, modes].
+
+        The result is computed once per basis object and reused by later calls with the same U (identity, not
+        content: the basis must not be modified in place). Truncations U[:, :r] are taken from the mapped basis.
+        """
+        key = id(U)
+        entry = self._cartesian_bases.get(key)
+        if entry is None or entry[0] is not U:
+            entry = (U, self.to_cartesian().map_basis(np.asarray(U)))
+            self._cartesian_bases[key] = entry
+            while len(self._cartesian_bases) > self.max_bases:
+                self._cartesian_bases.popitem(last=False)
+        self._cartesian_bases.move_to_end(key)
+        return entry[1]
+
+
+class FFTShift:
+    """Periodic shift of 1D fields [Nx, 1, 1, Nt] by a shift per time step, with the interface of sPOD `transforms`.
+
+    `apply` maps q(x) to q(x - shift), `reverse` back. All columns are shifted at once by rfft -> phase factor ->
+    irfft, which is exact (up to round-off) for periodic fields resolved on the grid, with period Nx * dx. Fields of
+    non-periodic domains are wrapped around the boundary, use the sPOD `transforms` for them.
+    """
+
+    def __init__(self, data_shape, dx, shifts):
+        self.data_shape = list(data_shape)
+        self.Nx = data_shape[0]
+        wavenumbers = 2 * np.pi * fft.rfftfreq(self.Nx, d=dx)
+        shifts = np.reshape(np.asarray(shifts, dtype=np.float64), [1, -1])
+        self.phase_pos = np.exp(-1j * wavenumbers[:, None] * shifts)
+        self.phase_neg = np.conj(self.phase_pos)
+
+    def shift(self, field, phase):
+        qmat = np.reshape(field, [self.Nx, -1])
+        values = fft.irfft(fft.rfft(qmat, axis=0) * phase, n=self.Nx, axis=0)
+        return np.reshape(values, np.shape(field)).astype(np.result_type(field, np.float32), copy=False)
+
+    def apply(self, frame_field):
+        return self.shift(frame_field, self.phase_pos)
+
+    def reverse(self, field):
+        return self.shift(field, self.phase_neg)
+
+
+def _freeze(value):
+    # Hashable form of a constructor argument, arrays (shifts) enter with a digest of their content
+    if isinstance(value, np.ndarray):
+        digest = hashlib.blake2b(np.ascontiguousarray(value).tobytes(), digest_size=16).hexdigest()
+        return 'array', value.shape, value.dtype.str, digest
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _nbytes(obj, seen=None):
+    """Approximate memory held by an operator object (arrays, sparse matrices and containers of them)"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes if obj.base is None else 0
+    if sparse.issparse(obj):
+        return sum(getattr(obj, a).nbytes for a in ('data', 'indices', 'indptr', 'row', 'col', 'offsets')
+                   if isinstance(getattr(obj, a, None), np.ndarray))
+    if isinstance(obj, (list, tuple, set)):
+        return sum(_nbytes(v, seen) for v in obj)
+    if isinstance(obj, dict):
+        return sum(_nbytes(v, seen) for v in obj.values())
+    if hasattr(obj, '__dict__'):
+        return _nbytes(vars(obj), seen)
+    return 0
+
+
+class OperatorCache:
+    """LRU cache of operator objects (e.g. sPOD `transforms`) built by `factory(*args, **kwargs)`.
+
+    Calls with equal arguments (data shape, domain length, dx, shifts, flags, ...) return the same object, the least
+    recently used operators are dropped when the memory they hold exceeds `max_bytes`. The objects are shared, so they
+    must not be modified by the caller.
+    """
+
+    def __init__(self, factory, max_bytes=1024 ** 3):
+        self.factory = factory
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __call__(self, *args, **kwargs):
+        key = (_freeze(args), tuple(sorted((k, _freeze(v)) for k, v in kwargs.items())))
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+        self.misses += 1
+        operator = self.factory(*args, **kwargs)
+        size = _nbytes(operator)
+        self._entries[key] = (operator, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, dropped) = self._entries.popitem(last=False)
+            self.nbytes -= dropped
+            self.evictions += 1
+        return operator
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    @property
+    def hit_rate(self):
+        calls = self.hits + self.misses
+        return self.hits / calls if calls > 0 else 0.0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate, 'evictions': self.evictions,
+                'entries': len(self._entries), 'nbytes': self.nbytes}
+
+    def __repr__(self):
+        return "OperatorCache({} hits, {} misses ({:.0%} hit rate), {} evictions, {} entries, {:.1f} MB)".format(
+            self.hits, self.misses, self.hit_rate, self.evictions, len(self._entries), self.nbytes / 1024 ** 2)
+
+
+# Interpolation weights of query parameters, shared by the amplitude, shift and shift amplitude interpolation
+interpolator_cache = OperatorCache(ParametricInterpolator, max_bytes=64 * 1024 ** 2)
+
+
+def check_steps(Nt, budget=None, mode="strided", seed=None):
+    """Time steps evaluated by a diagnostic check: all of them for mode "full" (or a `budget` of at least Nt), else
+    `budget` steps spread evenly over the trajectory ("strided") or drawn at random ("random")."""
+    if mode == "full" or budget is None or budget >= Nt:
+        return np.arange(Nt)
+    if mode == "strided":
+        return np.unique(np.round(np.linspace(0, Nt - 1, budget)).astype(int))
+    if mode == "random":
+        return np.sort(np.random.default_rng(seed).choice(Nt, size=budget, replace=False))
+    raise ValueError("Unknown check mode '{}'".format(mode))
+
+
+def sampled_relative_error(num, den, Nt, n_boot=1000, seed=None):
+    """Relative error sqrt(sum(num) / sum(den)) over all Nt time steps, estimated from the squared residual and
+    reference norms `num`, `den` of the checked time steps.
+
+    Returns the estimate and a 95% bootstrap interval over the checked steps (equal to the estimate if all Nt time
+    steps were checked).
+    """
+    num = np.asarray(num, dtype=np.float64)
+    den = np.asarray(den, dtype=np.float64)
+    err = np.sqrt(np.sum(num) / np.sum(den))
+    if np.size(num) >= Nt:
+        return err, (err, err)
+    idx = np.random.default_rng(seed).integers(0, np.size(num), size=(n_boot, np.size(num)))
+    boot = np.sqrt(np.sum(num[idx], axis=1) / np.sum(den[idx], axis=1))
+    return err, tuple(np.percentile(boot, [2.5, 97.5]))
+
+
+def report_check(label, num, den, Nt, seed=None):
+    """Print (and return) the relative error of a diagnostic check, with its confidence interval if it was sampled"""
+    err, (low, high) = sampled_relative_error(num, den, Nt, seed=seed)
+    if np.size(num) >= Nt:
+        print("%s =  %4.4e " % (label, err))
+    else:
+        print("%s =  %4.4e (95%% interval %4.4e - %4.4e, %d of %d time steps)" % (label, err, low, high,
+                                                                               np.size(num), Nt))
+    return err
+
+
+def cartesian_to_polar(cartesian_data, X, Y, t, t_exact=None, fill_val=0, out=None, dtype=np.float64, geometry=None):
+    """Map [Nx, Ny, 1, Nt] cartesian data to the polar grid. If `out` is given (an array or view of shape
+    [N_r, N_theta, 1, Nt]) the polar data is written into it instead of a newly allocated array of `dtype`.
+    A `PolarGeometry` of the grid can be passed to share it between calls, it is returned as last value."""
+    if geometry is None:
+        geometry = PolarGeometry(X, Y, fill_val=fill_val)
+    Nt = np.size(t) if t_exact is None else 1
+    polar_data = geometry.to_polar()(cartesian_data[..., :Nt], out=out, dtype=dtype)
+
+    return polar_data, geometry.theta_i, geometry.r_i, geometry
+
+
+def samples_to_polar(samples, geometry, out):
+    """Convert the [Nx, Ny, 1, Nt] cartesian `samples` to the polar grid of `geometry`, written sample after sample
+    into the columns of the snapshot matrix `out` [N_r * N_theta, Nsamples * Nt]. Every sample is converted directly
+    into its own columns, no per sample polar copy is made.
+    """
+    to_polar = geometry.to_polar()  # built once here, shared by all samples
+    Nt = np.size(samples[0], -1)
+    for s, q in enumerate(samples):
+        q_block = np.reshape(out[:, s * Nt:(s + 1) * Nt], [geometry.N_r, geometry.N_theta, 1, Nt])
+        to_polar(q, out=q_block)
+
+    return out
+
+
+def polar_to_cartesian(polar_data, t, aux=None, t_exact=None):
+    """Map polar data back to the cartesian grid. `aux` is the `PolarGeometry` returned by `cartesian_to_polar`, all
+    time steps are converted at once. (A list of per time step polarTransform settings, as stored by earlier
+    versions, is still accepted.)"""
+    if isinstance(aux, PolarGeometry):
+        return aux.to_cartesian()(polar_data, dtype=polar_data.dtype)
+
+    Nt = len(t)
+    cartesian_data = np.zeros_like(polar_data)
+
+    if t_exact is None:
+        for k in range(Nt):
+            cartesian_data[..., 0, k] = aux[k].convertToCartesianImage(polar_data[..., 0, k].transpose())
+    else:
+        cartesian_data[..., 0, 0] = aux[t_exact].convertToCartesianImage(polar_data[..., 0, 0].transpose())
+
+    return cartesian_data
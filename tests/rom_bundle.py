@@ -0,0 +1,130 @@
+import io
+import json
+import os
+import pathlib
+import pickle
+import tempfile
+import zipfile
+
+import numpy as np
+
+from rom_store import MANIFEST, save_rom_store, read_manifest, _load_item
+
+INDEX = 'index.json'
+BUNDLE_INFO = 'bundle.json'
+BUNDLE_VERSION = 1
+
+
+def file_blob(file):
+    """Raw content of a file (e.g. trained network weights) as uint8 array, to be stored in a bundle"""
+    with open(file, 'rb') as f:
+        return np.frombuffer(f.read(), dtype=np.uint8)
+
+
+def new_run_dir(logs_folder, runs_before):
+    """The run directory a training added to `logs_folder`, given the set `runs_before` of its directories before"""
+    runs = set(pathlib.Path(logs_folder).glob('*/')) - set(runs_before)
+    if len(runs) != 1:
+        raise RuntimeError("Expected exactly one new training run in {}, found {}: {}".format(
+            logs_folder, len(runs), sorted(str(r) for r in runs)))
+    return str(runs.pop())
+
+
+def _read_index(root):
+    path = os.path.join(root, INDEX)
+    if not os.path.exists(path):
+        return {'version': BUNDLE_VERSION, 'bundles': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_index(root, index):
+    tmp = os.path.join(root, INDEX + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, os.path.join(root, INDEX))
+
+
+def save_rom_bundle(root, case, var, **items):
+    """Write the ROM artifacts of one case and variable into a single versioned bundle file under `root`.
+
+    `items` are stored as in `save_rom_store` (sPOD bases, mode counts, interpolation data, ...), network weights are
+    passed as `file_blob(path)`. The bundle gets the next version number of (`case`, `var`) and is registered in the
+    `index.json` of `root`, which is what `resolve_rom_bundle` looks up. Returns the path of the bundle.
+    """
+    os.makedirs(root, exist_ok=True)
+    index = _read_index(root)
+    entries = index['bundles'].setdefault("{}/{}".format(case, var), [])
+    version = max([e['version'] for e in entries], default=0) + 1
+    name = "{}_{}_v{}.rom".format(case, var, version)
+
+    info = {'bundle_version': BUNDLE_VERSION, 'case': case, 'var': var, 'version': version}
+    with tempfile.TemporaryDirectory(dir=root) as tmpdir:
+        save_rom_store(tmpdir, **items)
+        # The members are stored uncompressed, a bundle is read with a single read of the file
+        tmp = os.path.join(root, name + '.tmp')
+        with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_STORED) as zf:
+            zf.writestr(BUNDLE_INFO, json.dumps(info, indent=1))
+            for file in sorted(os.listdir(tmpdir)):
+                zf.write(os.path.join(tmpdir, file), file)
+        os.replace(tmp, os.path.join(root, name))
+
+    entries.append({'version': version, 'file': name})
+    _write_index(root, index)
+    return os.path.join(root, name)
+
+
+def resolve_rom_bundle(root, case, var, version=None):
+    """Path of the bundle of (`case`, `var`) registered in the index of `root`, the latest version if `version` is None"""
+    entries = _read_index(root)['bundles'].get("{}/{}".format(case, var), [])
+    if version is not None:
+        entries = [e for e in entries if e['version'] == version]
+    if not entries:
+        raise KeyError("No ROM bundle for case '{}', variable {} (version {}) in {}".format(case, var, version, root))
+    return os.path.join(root, max(entries, key=lambda e: e['version'])['file'])
+
+
+class ROMBundle:
+    """Everything an online worker needs for one case and variable, read from a single bundle file.
+
+    The items are available as `bundle[key]`, stored weights are opened as in-memory files with `blob`.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        with open(file, 'rb') as f:
+            data = f.read()
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            info = json.loads(zf.read(BUNDLE_INFO))
+            if info['bundle_version'] > BUNDLE_VERSION:
+                raise ValueError("ROM bundle version {} is not supported".format(info['bundle_version']))
+            manifest = read_manifest(zf.read(MANIFEST))
+
+            def load(name):
+                if name.endswith('.npy'):
+                    return np.load(io.BytesIO(zf.read(name)))
+                return pickle.loads(zf.read(name))
+
+            self.items = {key: _load_item(spec, load) for key, spec in manifest['items'].items()}
+
+        self.case = info['case']
+        self.var = info['var']
+        self.version = info['version']
+
+    def __getitem__(self, key):
+        return self.items[key]
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def keys(self):
+        return self.items.keys()
+
+    def blob(self, key):
+        """The blob `key` (stored with `file_blob`) as a new in-memory file, e.g. for torch.load of the weights"""
+        return io.BytesIO(np.asarray(self.items[key], dtype=np.uint8).tobytes())
+
+
+def load_rom_bundle(root, case, var, version=None):
+    """Resolve (`case`, `var`) in the index of `root` and open its bundle"""
+    return ROMBundle(resolve_rom_bundle(root, case, var, version))
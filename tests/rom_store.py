@@ -0,0 +1,124 @@
+import json
+import os
+import pickle
+from functools import partial
+
+import numpy as np
+
+from compute_core import AmplitudeTable
+
+MANIFEST = 'manifest.json'
+STORE_VERSION = 1
+
+
+def _is_array(value):
+    return isinstance(value, np.ndarray) and value.dtype != object
+
+
+def _to_json(value):
+    # Plain python values (mode counts, flags, ...) live directly in the manifest
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _to_json(v) for k, v in value.items()}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError
+
+
+def _save_item(path, key, value):
+    if isinstance(value, AmplitudeTable):
+        # The contiguous amplitude buffer of all frames is stored as is, together with the modes per frame
+        np.save(os.path.join(path, key + '.npy'), value.data)
+        return {'kind': 'amplitude_table', 'file': key + '.npy', 'modes': value.modes,
+                'shape': list(value.data.shape), 'dtype': value.data.dtype.str}
+
+    if _is_array(value):
+        np.save(os.path.join(path, key + '.npy'), value)
+        return {'kind': 'array', 'file': key + '.npy', 'shape': list(value.shape), 'dtype': value.dtype.str}
+
+    if isinstance(value, (list, tuple)) and len(value) > 0 and all(_is_array(v) for v in value):
+        if all(v.shape == value[0].shape and v.dtype == value[0].dtype for v in value):
+            # Equally shaped members (e.g. the per mode amplitudes of one frame) are stored as one stacked array
+            stacked = np.stack(value)
+            np.save(os.path.join(path, key + '.npy'), stacked)
+            return {'kind': 'stack', 'file': key + '.npy', 'shape': list(stacked.shape), 'dtype': stacked.dtype.str}
+
+    if isinstance(value, (list, tuple)) and any(_is_array(v) or isinstance(v, (list, tuple)) for v in value):
+        return {'kind': 'list', 'items': [_save_item(path, key + '.' + str(i), v) for i, v in enumerate(value)]}
+
+    try:
+        return {'kind': 'value', 'value': _to_json(value)}
+    except TypeError:
+        pass
+
+    # Anything else (e.g. transformation settings objects) is kept as a small pickle
+    with open(os.path.join(path, key + '.pkl'), 'wb') as filehandle:
+        pickle.dump(value, filehandle)
+    return {'kind': 'pickle', 'file': key + '.pkl'}
+
+
+def _load_file(path, mmap_mode, name):
+    if name.endswith('.npy'):
+        return np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+    with open(os.path.join(path, name), 'rb') as filehandle:
+        return pickle.load(filehandle)
+
+
+def _load_item(spec, load):
+    # `load(name)` returns the array (.npy) or object (.pkl) stored under a file name of the store
+    kind = spec['kind']
+    if kind == 'array':
+        return load(spec['file'])
+    if kind == 'stack':
+        return list(load(spec['file']))
+    if kind == 'amplitude_table':
+        return AmplitudeTable(load(spec['file']), spec['modes'])
+    if kind == 'list':
+        return [_load_item(s, load) for s in spec['items']]
+    if kind == 'value':
+        return spec['value']
+    if kind == 'pickle':
+        return load(spec['file'])
+    raise ValueError("Unknown item kind '{}' in ROM store".format(kind))
+
+
+def read_manifest(manifest):
+    """Parse and check the json manifest of a ROM store"""
+    manifest = json.loads(manifest)
+    if manifest['version'] > STORE_VERSION:
+        raise ValueError("ROM store version {} is not supported".format(manifest['version']))
+    return manifest
+
+
+def save_rom_store(path, **items):
+    """Save ROM artifacts as raw .npy arrays together with a json manifest describing them.
+
+    Arrays and lists of arrays (mode bases, time amplitudes, polar snapshot matrices) are written as .npy files so that
+    they can be memory mapped when reopened, small python values are kept in the manifest itself.
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest = {'version': STORE_VERSION, 'items': {}}
+    for key, value in items.items():
+        manifest['items'][key] = _save_item(path, key, value)
+
+    # The manifest is written last so that a store is never left half written
+    tmp = os.path.join(path, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(path, MANIFEST))
+
+
+def load_rom_store(path, mmap_mode='r', keys=None):
+    """Open a ROM store written by `save_rom_store`.
+
+    With `mmap_mode='r'` no array data is read at this point, the pages are loaded when the arrays are accessed.
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = read_manifest(f.read())
+
+    keys = manifest['items'].keys() if keys is None else keys
+    load = partial(_load_file, path, mmap_mode)
+    return {key: _load_item(manifest['items'][key], load) for key in keys}
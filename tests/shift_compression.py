@@ -0,0 +1,56 @@
+import numpy as np
+
+from compute_core import my_delta_interpolate
+
+# Low-rank compression of the shifts of all frames. The networks predict (and sPOD-I interpolates) the few shift
+# amplitudes TA instead of every shift entry, the shifts are rebuilt as U @ TA when a transformation is assembled.
+
+
+def energy_rank(S, energy):
+    """Smallest rank whose singular values `S` hold at least the fraction `energy` of sum(S**2)"""
+    total = np.sum(S ** 2)
+    if total == 0:
+        return 1
+    return int(min(np.searchsorted(np.cumsum(S ** 2) / total, energy) + 1, len(S)))
+
+
+class ShiftBasis:
+    """Low-rank basis of the stacked shift components, shifts ~ U @ TA.
+
+    `components` are the shift arrays [..., Nsamples * Nt] of the shifted frames and dimensions (e.g. the training
+    shifts of frame 1 and 3 in 1D, the r-shift field of frame 1 in 2DNonLinear). The rank is chosen such that the
+    amplitudes keep the fraction `energy` of the shift energy, unless it is given as `rank`.
+    """
+
+    def __init__(self, components, energy=0.999999, rank=None):
+        self.shapes = [np.shape(c)[:-1] for c in components]
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.offsets = np.cumsum([0] + self.sizes)
+
+        U, S, VT = np.linalg.svd(self.stack(components), full_matrices=False)
+        self.singular_values = S
+        self.rank = energy_rank(S, energy) if rank is None else rank
+        self.U = U[:, :self.rank]
+        # Amplitudes of the components the basis was built from
+        self.TA = S[:self.rank, None] * VT[:self.rank, :]
+
+    def stack(self, components):
+        return np.concatenate([np.reshape(c, [size, -1]) for c, size in zip(components, self.sizes)], axis=0)
+
+    def amplitudes(self, components):
+        """Amplitudes U^T @ shifts of other shift components (e.g. of the test parameter) in this basis"""
+        return self.U.T @ self.stack(components)
+
+    def component(self, amplitudes, k):
+        """Shift component `k` rebuilt from the amplitudes [rank, Nt], only its rows of U are used"""
+        values = self.U[self.offsets[k]:self.offsets[k + 1]] @ np.reshape(amplitudes, [self.rank, -1])
+        return np.reshape(values, self.shapes[k] + np.shape(amplitudes)[1:])
+
+    def expand(self, amplitudes):
+        return [self.component(amplitudes, k) for k in range(len(self.sizes))]
+
+    def interpolate(self, TA_train, mu_points, mu_vec, Nsamples, interpolator=None):
+        """Amplitudes [rank, Nt] of the test parameter `mu_vec`, interpolated from the training amplitudes
+        [rank, Nsamples * Nt] (rank series are interpolated instead of every shift entry)"""
+        TA_list = [np.reshape(ta, [Nsamples, -1]).T for ta in TA_train]
+        return np.asarray(my_delta_interpolate(TA_list, mu_points, mu_vec, interpolator))
@@ -0,0 +1,222 @@
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+
+def extract_variable(dat, var, Nvar=2, interleaved=True):
+    """Return the rows of field variable `var` from a stacked snapshot matrix as a view (no copy).
+
+    The 2D snapshot matrices store the variables interleaved per grid point (row = var + Nvar * point), the 1D
+    ones store them as consecutive blocks of Nx rows.
+    """
+    if interleaved:
+        return dat[var::Nvar, :]
+    N = np.size(dat, 0) // Nvar
+    return dat[var * N:(var + 1) * N, :]
+
+
+def time_steps(dat, t=None):
+    """Time steps `t` of an array with time as last axis: all for t=None, a [..., 1] view for a single step"""
+    if t is None:
+        return dat
+    if np.ndim(t) == 0:
+        return dat[..., t:t + 1]
+    return dat[..., np.asarray(t, dtype=int)]
+
+
+def load_variable(file, var, Nvar=2, interleaved=True, mmap_mode='r', order="C", dtype=None):
+    """Load a single field variable of a snapshot matrix.
+
+    With `mmap_mode` set the file is memory mapped and only the rows of `var` are read and copied, so the memory
+    footprint is that of one variable instead of the whole file. With `mmap_mode=None` the full file is loaded first.
+    A `dtype` (e.g. np.float32) is applied during that copy, no full precision copy is made in between.
+    """
+    dat = np.load(file, mmap_mode=mmap_mode)
+    return np.array(extract_variable(dat, var, Nvar, interleaved), dtype=dtype, order=order)
+
+
+def load_parallel(jobs, max_workers=4):
+    """Run the callables `jobs` (file reads) in a pool of at most `max_workers` threads.
+
+    The results are returned in the order of `jobs`. With `max_workers` None or 1 the jobs run one after another.
+    """
+    if max_workers is None or max_workers <= 1 or len(jobs) <= 1:
+        return [job() for job in jobs]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+        futures = [pool.submit(job) for job in jobs]
+        return [future.result() for future in futures]
+
+
+def read_header(file):
+    """Read shape and dtype of a .npy file without touching its data"""
+    with open(file, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+    return shape, dtype
+
+
+def _read_npy_into(file, out):
+    """Read the data of a .npy file directly into the C-contiguous array `out` (no intermediate copy)"""
+    with open(file, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        if shape != out.shape or dtype != out.dtype or fortran_order:
+            raise ValueError("Block {} does not match the expected layout".format(file))
+        f.readinto(memoryview(out).cast('B'))
+
+
+def convert_to_chunked(file, chunk_size=32, out_dir=None):
+    """Convert an array with time as last axis (snapshot matrix [M, Nt] or shifts [..., Nt]) to a time-chunked store.
+
+    The store is a directory `<name>.chunks` holding the array in time-major blocks `block_<k>.npy` of shape
+    [chunk_size, M] and a small `meta.json`. Every time instant is a contiguous record inside one block, so reading a
+    few time columns only touches the blocks containing them.
+    """
+    dat = np.load(file, mmap_mode='r')
+    Nt = dat.shape[-1]
+    flat = np.reshape(dat, [-1, Nt])
+    if out_dir is None:
+        out_dir = os.path.splitext(file)[0] + '.chunks'
+    os.makedirs(out_dir, exist_ok=True)
+
+    blocks = []
+    for k, t0 in enumerate(range(0, Nt, chunk_size)):
+        name = 'block_{:05d}.npy'.format(k)
+        np.save(os.path.join(out_dir, name), np.ascontiguousarray(flat[:, t0:t0 + chunk_size].T))
+        blocks.append(name)
+
+    meta = {'shape': list(dat.shape), 'dtype': dat.dtype.str, 'chunk_size': chunk_size, 'blocks': blocks}
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+    return out_dir
+
+
+class ChunkedArray:
+    """Reader for the time-chunked store written by `convert_to_chunked`"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.shape = tuple(meta['shape'])
+        self.dtype = np.dtype(meta['dtype'])
+        self.chunk_size = meta['chunk_size']
+        self.blocks = meta['blocks']
+        self.Nt = self.shape[-1]
+        self.M = int(np.prod(self.shape[:-1]))
+
+    def read(self, t=None):
+        """Read the full array (t=None) or only the time columns `t`, returned with time as last axis. Negative
+        indices count from the end as in numpy, indices outside [-Nt, Nt) raise an IndexError."""
+        if t is None:
+            out = np.empty((self.Nt, self.M), dtype=self.dtype)
+            for k, name in enumerate(self.blocks):
+                t0 = k * self.chunk_size
+                _read_npy_into(os.path.join(self.path, name), out[t0:t0 + self.chunk_size])
+            return np.reshape(out.T, self.shape)
+
+        t = np.atleast_1d(np.asarray(t, dtype=int))
+        if np.any((t < -self.Nt) | (t >= self.Nt)):
+            raise IndexError("Time index out of bounds for {} time steps: {}".format(
+                self.Nt, t[(t < -self.Nt) | (t >= self.Nt)]))
+        t = np.where(t < 0, t + self.Nt, t)
+        out = np.empty((np.size(t), self.M), dtype=self.dtype)
+        for k in np.unique(t // self.chunk_size):
+            sel = np.flatnonzero(t // self.chunk_size == k)
+            block = np.load(os.path.join(self.path, self.blocks[k]), mmap_mode='r')
+            out[sel] = block[t[sel] - k * self.chunk_size]
+        return np.reshape(out.T, self.shape[:-1] + (np.size(t),))
+
+
+class SnapshotDataset:
+    """Index of the parameter-wise snapshot and shift files (`SnapShotMatrix<mu>.npy`, `Shifts<mu>.npy`) of a case.
+
+    The directory is scanned once and only the .npy headers are read to record shape and dtype of every parameter.
+    The arrays themselves are loaded on demand for the requested parameters only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.snapshots = {}
+        self.shifts = {}
+        for name in sorted(os.listdir(path)):
+            match = re.fullmatch(r"(SnapShotMatrix|Shifts)(\d+(?:\.\d*)?)\.(npy|chunks)", name)
+            if match is None:
+                continue
+            kind, mu, ext = match.groups()
+            table = self.snapshots if kind == "SnapShotMatrix" else self.shifts
+            entry = table.setdefault(float(mu), {'file': None, 'chunks': None})
+            if ext == "npy":
+                entry['file'] = name
+                entry['shape'], entry['dtype'] = read_header(os.path.join(path, name))
+            else:
+                entry['chunks'] = ChunkedArray(os.path.join(path, name))
+                entry.setdefault('shape', entry['chunks'].shape)
+                entry.setdefault('dtype', entry['chunks'].dtype)
+
+    @property
+    def mu_values(self):
+        return np.asarray(sorted(set(self.snapshots) & set(self.shifts)))
+
+    def __contains__(self, mu):
+        return float(mu) in self.snapshots and float(mu) in self.shifts
+
+    def shape(self, mu):
+        return self.snapshots[float(mu)]['shape']
+
+    def dtype(self, mu):
+        return self.snapshots[float(mu)]['dtype']
+
+    def _entry(self, table, mu):
+        try:
+            return table[float(mu)]
+        except KeyError:
+            raise KeyError("No data for parameter {} in {}".format(mu, self.path)) from None
+
+    def _read(self, entry, t, mmap_mode):
+        # Single time instants come from the chunked store if one exists, full trajectories from the plain .npy
+        if entry['chunks'] is not None and (t is not None or entry['file'] is None):
+            return entry['chunks'].read(t)
+        return time_steps(np.load(os.path.join(self.path, entry['file']), mmap_mode=mmap_mode), t)
+
+    def load_snapshots(self, mu, var, Nvar=2, interleaved=True, mmap_mode='r', order="C", t=None, dtype=None):
+        """Load variable `var` of the snapshot matrix of parameter `mu`, optionally only at the time indices `t`"""
+        entry = self._entry(self.snapshots, mu)
+        if t is None and entry['file'] is not None:
+            return load_variable(os.path.join(self.path, entry['file']), var, Nvar=Nvar, interleaved=interleaved,
+                                 mmap_mode=mmap_mode, order=order, dtype=dtype)
+        return np.array(extract_variable(self._read(entry, t, mmap_mode), var, Nvar, interleaved), dtype=dtype,
+                        order=order)
+
+    def load_shifts(self, mu, t=None):
+        return np.asarray(self._read(self._entry(self.shifts, mu), t, None))
+
+    def load_training(self, mu_values, var, files=(), io_workers=4, **kwargs):
+        """Load the shifts and variable `var` of the snapshots of all parameters in `mu_values`, together with the
+        additional case `files` (grids, time), with up to `io_workers` concurrent reads.
+
+        Returns ([arrays of files], [shifts per mu], [snapshots per mu]) in the order of the arguments. `kwargs` are
+        passed on to `load_snapshots`.
+        """
+        # Fail on unknown parameters before any read is started
+        for mu in mu_values:
+            self._entry(self.snapshots, mu)
+            self._entry(self.shifts, mu)
+        jobs = [partial(np.load, os.path.join(self.path, file), allow_pickle=True) for file in files]
+        jobs += [partial(self.load_shifts, mu) for mu in mu_values]
+        jobs += [partial(self.load_snapshots, mu, var, **kwargs) for mu in mu_values]
+        results = load_parallel(jobs, max_workers=io_workers)
+
+        Nfiles, Nmu = len(files), len(mu_values)
+        return results[:Nfiles], results[Nfiles:Nfiles + Nmu], results[Nfiles + Nmu:]
@@ -2,11 +2,11 @@ from scipy.special import eval_hermite
 from Helper import *
 
 impath = "../plots/images_synthetic/"
-os.makedirs(impath, exist_ok=True)
 
 
 class synthetic_sup:
-    def __init__(self, training_samples=[], testing_sample=[], nmodes=8, spod_iter=300, plot_offline_data=False):
+    def __init__(self, training_samples=[], testing_sample=[], nmodes=8, spod_iter=300, plot_offline_data=False,
+                 dtype=np.float64, shift_backend="lagrange"):
         self.Nx = 500  # number of grid points in x
         self.Ny = 1  # number of grid points in y
         self.Nt = 500  # numer of time intervals
@@ -17,6 +17,11 @@ class synthetic_sup:
         self.L = 1  # total domain size
         self.nmodes = nmodes  # reduction of singular values
         self.D = self.nmodes
+        # Working precision of snapshots, modes and reconstructions (shifts are kept in float64)
+        self.dtype = np.dtype(dtype)
+        # Shift operator of the online reconstruction: "lagrange" (sPOD transforms) or the experimental "fft"
+        # (FFTShift, the domain is periodic with L = Nx * dx)
+        self.shift_backend = shift_backend
 
         self.x = np.arange(-self.Nx // 2, self.Nx // 2) / self.Nx * self.L
         self.t = np.arange(0, self.Nt) / self.Nt * self.T
@@ -68,23 +73,22 @@ class synthetic_sup:
         ###########################################
         # Calculate the time amplitudes for training data
         self.U_list = []
-        self.TA_interp_list = []
         TA_training_list = []
         qtrunc = 0
         cnt = 0
         for frame in sPOD_frames:
             VT = frame.modal_system["VT"][:self.D, :]
             S = frame.modal_system["sigma"][:self.D]
-            VT = np.diag(S) @ VT
-            Nmodes = self.D
-            amplitudes = [np.reshape(VT[n, :], [self.Nsamples_train, self.Nt]).T for n in range(Nmodes)]
-            self.TA_interp_list.append(amplitudes)
+            VT = np.asarray(np.diag(S) @ VT, dtype=self.dtype)
             TA_training_list.append(VT)
-            self.U_list.append(frame.modal_system["U"][:, :self.D])
+            self.U_list.append(np.asarray(frame.modal_system["U"][:, :self.D], dtype=self.dtype))
 
-            qtrunc += self.trafos_train[cnt].apply(self.U_list[cnt] @ TA_training_list[cnt])
+            qtrunc += np.asarray(self.trafos_train[cnt].apply(self.U_list[cnt] @ TA_training_list[cnt]),
+                                 dtype=self.dtype)
             cnt = cnt + 1
 
+        self.TA_interp_list = AmplitudeTable.from_training(TA_training_list, self.Nsamples_train, self.Nt)
+
         err_trunc = np.linalg.norm(self.q_train - qtrunc) / np.linalg.norm(self.q_train)
         print("Error for truncated sPOD recons. is {}".format(err_trunc))
 
@@ -158,6 +162,7 @@ class synthetic_sup:
         q = 0
         for trafo, qf in zip(trafos, q_frames):
             q += trafo.apply(qf)
+        q, q1, q2 = [np.asarray(x, dtype=self.dtype) for x in (q, q1, q2)]
 
         # Parameter matrix
         p = [np.squeeze(np.asarray([[self.t], [np.ones_like(self.t) * mu]])) for mu in mu_vecs]
@@ -165,20 +170,28 @@ class synthetic_sup:
 
         return q, q1, q2, shifts, p, trafos
 
+    def trafo_kwargs(self):
+        """Arguments of the transformations of both frames in the online reconstruction"""
+        kwargs = {'dx': [self.dx], 'backend': self.shift_backend, 'use_scipy_transform': False, 'interp_order': 5}
+        return [kwargs, kwargs]
+
     def OnlinePredictionAnalysis(self, TA_sPOD_pred, shifts_sPOD_pred, TA_POD_pred,
                                  plot_online=False, test_type=None):
 
-        if test_type['typeOfTest'] == "query":
+        q_test = self.q_test
+        shifts_train = self.shifts_train
+        query = test_type is not None and test_type['typeOfTest'] == "query"
+        if query:
             plot_online = False
             test_sample = test_type['test_sample']
-            self.q_test = self.q_test[:, test_sample][..., np.newaxis]
-            for frame in range(self.NumFrames):
-                self.shifts_train[frame] = np.asarray([self.shifts_train[frame][:, i * self.Nt + test_sample]
-                                                      for i in range(self.Nsamples_train)]).transpose()
-
+            # Only the requested time step is taken from the test data and the training shifts (strided views)
+            q_test = q_test[:, test_sample:test_sample + 1]
+            shifts_train = [shifts[:, test_sample::self.Nt] for shifts in shifts_train]
 
         print("#############################################")
         print('Online Error checks')
+        TA_sPOD_pred = np.asarray(TA_sPOD_pred, dtype=self.dtype)
+        TA_POD_pred = np.asarray(TA_POD_pred, dtype=self.dtype)
         Nx = len(self.x)
         Nt = TA_sPOD_pred.shape[1]  # len(self.t)
         data_shape = [Nx, 1, 1, Nt]
@@ -190,25 +203,22 @@ class synthetic_sup:
 
         ###########################################
         # Implement the interpolation to find the online prediction
+        interpolator = interpolation_weights(self.mu_vecs_train, self.mu_vecs_test)
         shifts_list_interpolated = []
         cnt = 0
         for frame in range(self.NumFrames):
-            shifts = np.reshape(self.shifts_train[cnt], [self.Nsamples_train, Nt]).T
+            shifts = np.reshape(shifts_train[cnt], [self.Nsamples_train, Nt]).T
             shifts_list_interpolated.append(shifts)
             cnt = cnt + 1
 
-        DELTA_PRED_FRAME_WISE = my_delta_interpolate(shifts_list_interpolated, self.mu_vecs_train, self.mu_vecs_test)
+        DELTA_PRED_FRAME_WISE = my_delta_interpolate(shifts_list_interpolated, self.mu_vecs_train,
+                                                     self.mu_vecs_test, interpolator)
         Nmodes = [self.D, self.D]
-        trafos_interp = [
-            transforms(data_shape, [self.L], shifts=DELTA_PRED_FRAME_WISE[0], dx=[self.dx], use_scipy_transform=False,
-                       interp_order=5),
-            transforms(data_shape, [self.L], shifts=DELTA_PRED_FRAME_WISE[1], dx=[self.dx], use_scipy_transform=False,
-                       interp_order=5)
-        ]
+        trafos_interp, _ = frame_transforms(data_shape, [self.L], DELTA_PRED_FRAME_WISE, self.trafo_kwargs())
         q_interp, TA_interp = my_interpolated_state(Nmodes, self.U_list, self.TA_interp_list,
                                                     self.mu_vecs_train,
                                                     self.Nx, self.Ny, Nt,
-                                                    self.mu_vecs_test, trafos_interp)
+                                                    self.mu_vecs_test, trafos_interp, interpolator=interpolator)
         ###########################################
 
         # Shifts error
@@ -246,51 +256,41 @@ class synthetic_sup:
         print("Relative time amplitude error indicator (sPOD-I) for frame: 2 is {}".format(num4 / den4))
         print("Relative time amplitude error indicator (POD-NN) is {}".format(num5 / den5))
 
-        q_sPOD_pred_1 = self.U_list[0][:, :self.D] @ TA_sPOD_pred_1
-        q_sPOD_pred_2 = self.U_list[1][:, :self.D] @ TA_sPOD_pred_2
         # Total reconstructed error
-        q_sPOD_recon = 0
-        NumFrames = 2
-        q_pred = [np.reshape(q_sPOD_pred_1, newshape=data_shape), np.reshape(q_sPOD_pred_2, newshape=data_shape)]
-        trafos = [
-            transforms(data_shape, [self.L], shifts=shifts_sPOD_pred_1, dx=[self.dx],
-                       use_scipy_transform=False,
-                       interp_order=5),
-            transforms(data_shape, [self.L], shifts=shifts_sPOD_pred_2, dx=[self.dx],
-                       use_scipy_transform=False,
-                       interp_order=5)]
-        for frame in range(NumFrames):
-            q_sPOD_recon += trafos[frame].apply(q_pred[frame])
+        trafos, _ = frame_transforms(data_shape, [self.L], [shifts_sPOD_pred_1, shifts_sPOD_pred_2],
+                                     self.trafo_kwargs())
+        q_sPOD_recon = sum(reconstruct_frames([U[:, :self.D] for U in self.U_list], [TA_sPOD_pred_1, TA_sPOD_pred_2],
+                                              trafos, data_shape, self.dtype))
         q_POD_recon = self.U_POD_TRAIN @ TA_POD_pred
 
-        self.q_test = np.squeeze(self.q_test)
+        q_test = np.squeeze(q_test)
         q_sPOD_recon = np.squeeze(q_sPOD_recon)
         q_POD_recon = np.squeeze(q_POD_recon)
         q_interp = np.squeeze(q_interp)
 
-        num1 = np.linalg.norm(self.q_test - q_sPOD_recon)
-        den1 = np.linalg.norm(self.q_test)
+        num1 = np.linalg.norm(q_test - q_sPOD_recon)
+        den1 = np.linalg.norm(q_test)
 
-        num2 = np.linalg.norm(self.q_test - q_POD_recon)
-        den2 = np.linalg.norm(self.q_test)
+        num2 = np.linalg.norm(q_test - q_POD_recon)
+        den2 = np.linalg.norm(q_test)
 
-        num3 = np.linalg.norm(self.q_test - q_interp)
-        den3 = np.linalg.norm(self.q_test)
+        num3 = np.linalg.norm(q_test - q_interp)
+        den3 = np.linalg.norm(q_test)
 
         print('Check 3...')
         print("Relative reconstruction error indicator for full snapshot (sPOD-NN) is {}".format(num1 / den1))
         print("Relative reconstruction error indicator for full snapshot (sPOD-I) is {}".format(num3 / den3))
         print("Relative reconstruction error indicator for full snapshot (POD-NN) is {}".format(num2 / den2))
 
-        if test_type['typeOfTest'] != "query":
-            one = self.q_test - q_sPOD_recon
+        if not query:
+            one = q_test - q_sPOD_recon
             num1 = np.sqrt(np.einsum('ij,ij->j', one, one))
-            den1 = np.sqrt(np.sum(np.einsum('ij,ij->j', self.q_test, self.q_test)) / self.Nt)
+            den1 = np.sqrt(np.sum(np.einsum('ij,ij->j', q_test, q_test)) / self.Nt)
 
-            two = self.q_test - q_POD_recon
+            two = q_test - q_POD_recon
             num2 = np.sqrt(np.einsum('ij,ij->j', two, two))
 
-            three = self.q_test - q_interp
+            three = q_test - q_interp
             num3 = np.sqrt(np.einsum('ij,ij->j', three, three))
 
             rel_err_sPOD = num1 / den1
@@ -319,13 +319,13 @@ class synthetic_sup:
         qmax = np.max(q_train)
         for k in range(0, Nsamples_train):
             kw = k
-            axs[0, kw].pcolormesh(q_train[:, Nt * k:Nt * (k + 1)], vmin=qmin, vmax=qmax, cmap=cm)
+            axs[0, kw].pcolormesh(q_train[:, Nt * k:Nt * (k + 1)], vmin=qmin, vmax=qmax, cmap=farge_cmap())
             axs[0, kw].set_title(r'${\mu}_{' + str(k) + '}$')
             axs[0, kw].set_yticks([0, Nx // 2, Nx])
             axs[0, kw].set_xticks([0, Nt // 2, Nt])
             axs[0, kw].set_yticklabels([r"$-L/2$", 0, r"$L/2$"])
-            axs[1, kw].pcolormesh(q1_train[:, Nt * k:Nt * (k + 1)], vmin=qmin, vmax=qmax, cmap=cm)
-            im = axs[2, kw].pcolormesh(q2_train[:, Nt * k:Nt * (k + 1)], vmin=qmin, vmax=qmax, cmap=cm)
+            axs[1, kw].pcolormesh(q1_train[:, Nt * k:Nt * (k + 1)], vmin=qmin, vmax=qmax, cmap=farge_cmap())
+            im = axs[2, kw].pcolormesh(q2_train[:, Nt * k:Nt * (k + 1)], vmin=qmin, vmax=qmax, cmap=farge_cmap())
 
         # axs[0, 0].set_ylabel(r"$q$")
         # axs[1, 0].set_ylabel(r"$q^1$")
@@ -336,6 +336,7 @@ class synthetic_sup:
         fig.subplots_adjust(right=0.8)
         cbar_ax = fig.add_axes([0.83, 0.25, 0.01, 0.5])
         fig.colorbar(im, cax=cbar_ax)
+        os.makedirs(impath, exist_ok=True)
         fig.savefig(impath + "synthetic_" + "training" + '.png', dpi=300, transparent=True)
 
     def plot_sPODframes(self, q_train, qtilde, q1_spod_frame, q2_spod_frame):
@@ -349,7 +350,7 @@ class synthetic_sup:
         fig.subplots_adjust(top=top, bottom=bottom, left=left, right=right, hspace=0.15, wspace=0)
         # 1. frame
         k_frame = 0
-        im = axs[0].pcolormesh(q1_spod_frame[:, :self.Nt], cmap=cm, vmin=qmin, vmax=qmax)
+        im = axs[0].pcolormesh(q1_spod_frame[:, :self.Nt], cmap=farge_cmap(), vmin=qmin, vmax=qmax)
         axs[0].set_title(r"$Q^" + str(k_frame + 1) + "$")
         axs[0].set_yticks([0, Nx // 2, Nx])
         axs[0].set_xticks([0, Nt // 2, Nt])
@@ -357,13 +358,13 @@ class synthetic_sup:
         axs[0].set_xticklabels(["", r"$T/2$", r"$T$"])
         # 2. frame
         k_frame = 1
-        im = axs[1].pcolormesh(q2_spod_frame[:, :self.Nt], cmap=cm, vmin=qmin, vmax=qmax)
+        im = axs[1].pcolormesh(q2_spod_frame[:, :self.Nt], cmap=farge_cmap(), vmin=qmin, vmax=qmax)
         axs[1].set_title(r"$Q^" + str(k_frame + 1) + "$")
         axs[1].set_yticks([0, Nx // 2, Nx])
         axs[1].set_xticks([0, Nt // 2, Nt])
         axs[1].set_xticklabels(["", r"$T/2$", r"$T$"])
         # Reconstruction
-        im = axs[2].pcolormesh(qtilde[:, :self.Nt], cmap=cm, vmin=qmin, vmax=qmax)
+        im = axs[2].pcolormesh(qtilde[:, :self.Nt], cmap=farge_cmap(), vmin=qmin, vmax=qmax)
         axs[2].set_title(r"$Q$")
         axs[2].set_yticks([0, Nx // 2, Nx])
         axs[2].set_xticks([0, Nt // 2, Nt])
@@ -375,6 +376,7 @@ class synthetic_sup:
         fig.supxlabel(r"time $t$")
         fig.supylabel(r"space $x$")
 
+        os.makedirs(impath, exist_ok=True)
         fig.savefig(impath + "synthetic_spod_frames" + ".png", dpi=300, transparent=True)
 
     def plot_timeamplitudes_shifts_Pred(self, TA_sPOD_pred_1, TA_test_1, TA_sPOD_pred_2,
@@ -445,6 +447,7 @@ class synthetic_sup:
         subfig_b.supxlabel(r"time $t$")
         subfig_b.supylabel(r"shifts $\underline{\Delta}^k$")
 
+        os.makedirs(impath, exist_ok=True)
         save_fig(filepath=impath + "time_amplitudes_shifts_newplot_predicted", figure=fig)
         fig.savefig(impath + "time_amplitudes_shifts_newplot_predicted" + ".pdf", format='pdf',
                     dpi=200, transparent=True, bbox_inches="tight")
@@ -459,26 +462,26 @@ class synthetic_sup:
         left, right = 0.1, 0.8
         fig.subplots_adjust(top=top, bottom=bottom, left=left, right=right, hspace=0.15, wspace=0)
         # Original
-        im = axs[0].pcolormesh(self.q_test, cmap=cm, vmin=qmin, vmax=qmax)
+        im = axs[0].pcolormesh(self.q_test, cmap=farge_cmap(), vmin=qmin, vmax=qmax)
         axs[0].set_title(r"$Q$")
         axs[0].set_yticks([0, Nx // 2, Nx])
         axs[0].set_xticks([0, Nt // 2, Nt])
         axs[0].set_yticklabels([r"$-L/2$", 0, r"$L/2$"])
         axs[0].set_xticklabels(["", r"$T/2$", r"$T$"])
         # Interpolated
-        axs[1].pcolormesh(q_interp, cmap=cm, vmin=qmin, vmax=qmax)
+        axs[1].pcolormesh(q_interp, cmap=farge_cmap(), vmin=qmin, vmax=qmax)
         axs[1].set_title(r"$Q^" + "{\mathrm{sPOD-I}}$")
         axs[1].set_yticks([0, Nx // 2, Nx])
         axs[1].set_xticks([0, Nt // 2, Nt])
         axs[1].set_xticklabels(["", r"$T/2$", r"$T$"])
         # sPOD NN predicted
-        axs[2].pcolormesh(q_sPOD_recon, cmap=cm, vmin=qmin, vmax=qmax)
+        axs[2].pcolormesh(q_sPOD_recon, cmap=farge_cmap(), vmin=qmin, vmax=qmax)
         axs[2].set_yticks([0, Nx // 2, Nx])
         axs[2].set_xticks([0, Nt // 2, Nt])
         axs[2].set_title(r"$Q^" + "{\mathrm{sPOD-NN}}$")
         axs[2].set_xticklabels(["", r"$T/2$", r"$T$"])
         # POD NN predicted
-        axs[3].pcolormesh(q_POD_recon, cmap=cm, vmin=qmin, vmax=qmax)
+        axs[3].pcolormesh(q_POD_recon, cmap=farge_cmap(), vmin=qmin, vmax=qmax)
         axs[3].set_yticks([0, Nx // 2, Nx])
         axs[3].set_xticks([0, Nt // 2, Nt])
         axs[3].set_title(r"$Q^" + "{\mathrm{POD-NN}}$")
@@ -490,4 +493,5 @@ class synthetic_sup:
         fig.supxlabel(r"time $t$")
         fig.supylabel(r"space $x$")
 
+        os.makedirs(impath, exist_ok=True)
         fig.savefig(impath + "Snapshot_Comparison" + ".png", dpi=300, transparent=True)
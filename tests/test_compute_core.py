@@ -0,0 +1,289 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from scipy import ndimage
+from scipy.interpolate import griddata
+
+from compute_core import FFTShift, PolarGeometry, SparseResampler, ParametricInterpolator, AmplitudeTable, \
+    interpolate_frame_amplitudes
+from Helper import frame_transform, frame_transforms, reconstruct_frames, reconstruct_batch, unstack_batch, \
+    batch_slices, sweep_reconstructions
+
+SPOD_LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sPOD', 'lib')
+
+
+def periodic_grid(Nx, L=1.0):
+    dx = L / Nx
+    return np.arange(Nx) * dx, dx
+
+
+def periodic_field(x, L=1.0):
+    return np.exp(np.sin(2 * np.pi * x / L)) + 0.5 * np.cos(6 * np.pi * x / L)
+
+
+def test_fft_shift_moves_periodic_field():
+    Nx, Nt, L = 128, 7, 1.0
+    x, dx = periodic_grid(Nx, L)
+    shifts = np.linspace(-0.7, 1.3, Nt) * L
+    q = np.tile(periodic_field(x, L)[:, None], [1, Nt])
+    trafo = FFTShift([Nx, 1, 1, Nt], dx, shifts)
+
+    # apply maps q(x) to q(x - shift) with period Nx * dx, reverse back
+    exact = periodic_field(np.mod(x[:, None] - shifts[None, :], L), L)
+    q_shifted = np.reshape(trafo.apply(np.reshape(q, [Nx, 1, 1, Nt])), [Nx, Nt])
+    np.testing.assert_allclose(q_shifted, exact, atol=1e-12)
+    np.testing.assert_allclose(np.reshape(trafo.reverse(q_shifted), [Nx, Nt]), q, atol=1e-12)
+
+
+def test_fft_shift_keeps_float32():
+    x, dx = periodic_grid(64)
+    q = periodic_field(x)[:, None].astype(np.float32)
+    assert FFTShift([64, 1, 1, 1], dx, [0.1]).apply(q).dtype == np.float32
+
+
+def test_fft_backend_rejects_non_periodic_domain():
+    x, dx = periodic_grid(64)
+    with pytest.raises(ValueError):
+        frame_transform([64, 1, 1, 3], [x[-1]], shifts=np.ones(3), dx=[dx], backend="fft")
+    assert isinstance(frame_transform([64, 1, 1, 3], [1.0], shifts=np.ones(3), dx=[dx], backend="fft"), FFTShift)
+
+
+def test_reconstruct_frames_transforms_shifted_frames_only():
+    Nx, Nt = 64, 5
+    x, dx = periodic_grid(Nx)
+    rng = np.random.default_rng(0)
+    U_list = [rng.standard_normal((Nx, 3)), rng.standard_normal((Nx, 2))]
+    TA_list = [rng.standard_normal((3, Nt)), rng.standard_normal((2, Nt))]
+    shifts = [np.linspace(0, 0.2, Nt), np.zeros(Nt)]
+    data_shape = [Nx, 1, 1, Nt]
+    kwargs = {'dx': [dx], 'backend': "fft"}
+    trafos, build_time = frame_transforms(data_shape, [1.0], shifts, [kwargs, dict(kwargs, trafo_type="identity")])
+
+    assert isinstance(trafos[0], FFTShift) and trafos[1] is None and build_time >= 0
+    frames = reconstruct_frames(U_list, TA_list, trafos, data_shape)
+    np.testing.assert_allclose(frames[0], trafos[0].apply(np.reshape(U_list[0] @ TA_list[0], data_shape)))
+    np.testing.assert_allclose(frames[1], np.reshape(U_list[1] @ TA_list[1], data_shape))
+
+
+def test_cartesian_basis_is_mapped_once_per_basis():
+    geometry = PolarGeometry(np.linspace(0, 1, 12), np.linspace(0, 1, 10))
+    U = np.random.default_rng(3).standard_normal((12 * 10, 3))
+    U_cart = geometry.cartesian_basis(U)
+
+    np.testing.assert_allclose(U_cart, geometry.to_cartesian().map_basis(U))
+    assert geometry.cartesian_basis(U) is U_cart
+    assert geometry.cartesian_basis(U.copy()) is not U_cart
+    for _ in range(PolarGeometry.max_bases):
+        geometry.cartesian_basis(U.copy())
+    assert geometry.cartesian_basis(U) is not U_cart
+
+
+@pytest.mark.parametrize("order", [1, 3])
+@pytest.mark.parametrize("fill_val", [0, 2.5])
+def test_resampler_matches_map_coordinates(order, fill_val):
+    rng = np.random.default_rng(5)
+    q = rng.standard_normal((15, 12, 1, 3))
+    c0, c1 = rng.uniform(-4, 18, 200), rng.uniform(-4, 15, 200)
+    resampler = SparseResampler((15, 12), c0, c1, (20, 10), order=order, fill_val=fill_val)
+    q_out = resampler(q)
+
+    # As polarTransform: map_coordinates of every time step on the edge padded image, fill_val outside of it
+    for k in range(3):
+        padded = np.pad(q[:, :, 0, k], resampler.pad, mode='edge')
+        expected = ndimage.map_coordinates(padded, [c0 + resampler.pad, c1 + resampler.pad], order=order,
+                                           mode='constant', cval=fill_val)
+        np.testing.assert_allclose(np.reshape(q_out[..., 0, k], -1), expected, atol=1e-12)
+
+
+def test_to_polar_matches_map_coordinates():
+    X, Y = np.linspace(0, 1, 16), np.linspace(0, 1, 14)
+    geometry = PolarGeometry(X, Y)
+    q = np.random.default_rng(6).standard_normal((16, 14, 1, 2))
+    radii = np.linspace(np.min(geometry.r_i), np.max(geometry.r_i), geometry.N_r, endpoint=False)
+    angles = np.linspace(np.min(geometry.theta_i), np.max(geometry.theta_i), geometry.N_theta, endpoint=False)
+    r, theta = np.meshgrid(radii, angles, indexing='ij')
+    coords = [np.reshape(r * np.sin(theta) + geometry.Y_c, -1) + 3,
+              np.reshape(r * np.cos(theta) + geometry.X_c, -1) + 3]
+
+    q_polar = geometry.to_polar()(q)
+    for k in range(2):
+        expected = ndimage.map_coordinates(np.pad(q[:, :, 0, k], 3, mode='edge'), coords, order=3, mode='constant')
+        np.testing.assert_allclose(np.reshape(q_polar[..., 0, k], -1), expected, atol=1e-12)
+
+
+def test_resampler_keeps_float32():
+    geometry = PolarGeometry(np.linspace(0, 1, 12), np.linspace(0, 1, 10))
+    q = np.random.default_rng(4).standard_normal((12, 10, 1, 2))
+    resampler = geometry.to_polar()
+    assert resampler.coefficients(q.astype(np.float32)).dtype == np.float32
+    q_polar = resampler(q.astype(np.float32), dtype=np.float32)
+    assert q_polar.dtype == np.float32
+    np.testing.assert_allclose(q_polar, resampler(q), atol=1e-5)
+
+
+def test_linear_interpolation_matches_griddata_1d():
+    rng = np.random.default_rng(7)
+    mu_train = rng.permutation(np.linspace(500, 600, 9))
+    mu_test = np.array([500, 512.3, 555.5, 600, 620])
+    values = rng.standard_normal((9, 3, 4))
+
+    result = ParametricInterpolator(mu_train, mu_test)(values)
+    for m in range(3):
+        for t in range(4):
+            np.testing.assert_allclose(result[:, m, t], griddata(mu_train, values[:, m, t], mu_test), atol=1e-12)
+    assert np.all(np.isnan(result[-1]))
+
+
+def test_linear_interpolation_matches_griddata_2d():
+    rng = np.random.default_rng(8)
+    mu_train = np.stack(np.meshgrid(np.linspace(500, 600, 5), np.linspace(0, 10, 4)), axis=-1).reshape(-1, 2)
+    mu_test = np.vstack([rng.uniform([500, 0], [600, 10], (6, 2)), [[650, 5]]])
+    values = rng.standard_normal((len(mu_train), 2, 3))
+
+    result = ParametricInterpolator(mu_train, mu_test)(values)
+    for m in range(2):
+        for t in range(3):
+            np.testing.assert_allclose(result[:, m, t], griddata(mu_train, values[:, m, t], mu_test), atol=1e-10)
+    assert np.all(np.isnan(result[-1]))
+
+
+def test_frame_amplitudes_match_griddata_per_mode():
+    rng = np.random.default_rng(9)
+    Nsamples, Nt, mu_train = 5, 6, np.array([540, 550, 560, 570, 580])
+    VT_list = [rng.standard_normal((3, Nsamples * Nt)), rng.standard_normal((2, Nsamples * Nt))]
+    table = AmplitudeTable.from_training(VT_list, Nsamples, Nt)
+
+    TA = interpolate_frame_amplitudes([3, 2], table, mu_train, np.array([558.49]))
+    for f, VT in enumerate(VT_list):
+        for m in range(np.size(VT, 0)):
+            samples = np.reshape(VT[m], [Nsamples, Nt])
+            expected = [griddata(mu_train, samples[:, t], 558.49) for t in range(Nt)]
+            np.testing.assert_allclose(TA[f][m], np.ravel(expected), atol=1e-12)
+
+
+@pytest.mark.parametrize("method", ["idw", "rbf"])
+def test_scattered_interpolation_is_exact_at_the_nodes(method):
+    rng = np.random.default_rng(10)
+    mu_train = rng.uniform([500, 0], [600, 10], (30, 2))
+    values = rng.standard_normal((30, 3, 4))
+    result = ParametricInterpolator(mu_train, mu_train, method=method, k=5)(values)
+    np.testing.assert_allclose(result, values, atol=1e-8)
+
+
+def test_idw_stays_within_the_neighbour_values():
+    rng = np.random.default_rng(11)
+    mu_train = rng.uniform([500, 0], [600, 10], (30, 2))
+    values = rng.standard_normal(30)
+    interpolator = ParametricInterpolator(mu_train, rng.uniform([500, 0], [600, 10], (10, 2)), method="idw", k=5)
+    result = interpolator(values)
+    np.testing.assert_allclose(np.sum(interpolator.weights, axis=1), 1)
+    assert np.all(result >= np.min(values[interpolator.indices], axis=1) - 1e-12)
+    assert np.all(result <= np.max(values[interpolator.indices], axis=1) + 1e-12)
+
+
+def test_rbf_reproduces_linear_functions():
+    rng = np.random.default_rng(12)
+    mu_train = rng.uniform([500, 0], [600, 10], (25, 2))
+    mu_test = rng.uniform([480, -2], [620, 12], (15, 2))
+
+    def linear(mu):
+        return 3.0 + 0.02 * mu[:, 0] - 1.5 * mu[:, 1]
+
+    result = ParametricInterpolator(mu_train, mu_test, method="rbf")(linear(mu_train))
+    np.testing.assert_allclose(result, linear(mu_test), rtol=1e-8)
+
+
+def test_amplitude_table_indexing():
+    rng = np.random.default_rng(13)
+    Nsamples, Nt = 4, 5
+    VT_list = [rng.standard_normal((3, Nsamples * Nt)), rng.standard_normal((2, Nsamples * Nt))]
+    table = AmplitudeTable.from_training(VT_list, Nsamples, Nt)
+
+    assert len(table) == 2 and table.modes == [3, 2] and table.Nt == Nt
+    for f, VT in enumerate(VT_list):
+        assert table[f].shape == (np.size(VT, 0), Nt, Nsamples)
+        for m in range(np.size(VT, 0)):
+            # Training amplitudes are ordered sample after sample, the table holds [Nt, Nsamples] per mode
+            np.testing.assert_array_equal(table[f][m], np.reshape(VT[m], [Nsamples, Nt]).T)
+            np.testing.assert_array_equal(table.mode(f, m), table[f][m])
+            assert np.shares_memory(table[f][m], table.data)
+
+    nested = [[table[f][m].copy() for m in range(table.modes[f])] for f in range(2)]
+    np.testing.assert_array_equal(AmplitudeTable.from_frames(nested).data, table.data)
+    np.testing.assert_array_equal(table.at_time(2).data[..., 0, :], table.data[:, 2])
+    np.testing.assert_array_equal(table.samples_first([2, 1])[:, 2], table[1][0].T)
+    with pytest.raises(ValueError):
+        AmplitudeTable(table.data, [3, 3])
+
+
+def test_batch_slices():
+    assert batch_slices(5, 10, batch_size=2) == [slice(0, 2), slice(2, 4), slice(4, 5)]
+    assert batch_slices(5, 10, max_bytes=35) == [slice(0, 3), slice(3, 5)]
+    assert batch_slices(2, 100, max_bytes=1) == [slice(0, 1), slice(1, 2)]
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 5])
+def test_reconstruct_batch_matches_single_reconstructions(batch_size):
+    Nx, Nt, K = 32, 4, 5
+    x, dx = periodic_grid(Nx)
+    rng = np.random.default_rng(1)
+    U_list = [rng.standard_normal((Nx, 3)), rng.standard_normal((Nx, 2))]
+    TA_batch = [[rng.standard_normal((r, Nt)) for _ in range(K)] for r in (3, 2)]
+    shifts_batch = [[rng.uniform(-0.3, 0.3, Nt) for _ in range(K)], None]
+    kwargs = {'dx': [dx], 'backend': "fft"}
+    trafo_kwargs = [kwargs, dict(kwargs, trafo_type="identity")]
+    data_shape = [Nx, 1, 1, Nt]
+
+    batches = reconstruct_batch(U_list, TA_batch, shifts_batch, data_shape, [1.0], trafo_kwargs,
+                                batch_size=batch_size)
+    Q = list(unstack_batch(batches))
+    assert len(Q) == K
+    for k in range(K):
+        trafos, _ = frame_transforms(data_shape, [1.0], [shifts_batch[0][k], None], trafo_kwargs)
+        expected = sum(reconstruct_frames(U_list, [TA[k] for TA in TA_batch], trafos, data_shape))
+        np.testing.assert_allclose(Q[k], expected, atol=1e-12)
+
+
+def test_sweep_reconstructions_is_chunked_and_finished():
+    Nx, Nt, K = 32, 4, 5
+    x, dx = periodic_grid(Nx)
+    rng = np.random.default_rng(2)
+    U_list = [rng.standard_normal((Nx, 4))]
+    TA = [rng.standard_normal((K, 3, Nt))]
+    shifts = rng.uniform(-0.3, 0.3, (K, Nt))
+    trafo_kwargs = [{'dx': [dx], 'backend': "fft"}]
+    data_shape = [Nx, 1, 1, Nt]
+    chunks = []
+
+    def finish(chunk, Q):
+        chunks.append(chunk)
+        return -Q
+
+    Q = sweep_reconstructions(U_list, TA, [list(shifts)], data_shape, [1.0], trafo_kwargs, finish=finish, batch_size=2)
+    assert not chunks
+    Q = list(Q)
+    assert chunks == [slice(0, 2), slice(2, 4), slice(4, 5)]
+    for k in range(K):
+        trafos, _ = frame_transforms(data_shape, [1.0], [shifts[k]], trafo_kwargs)
+        expected = reconstruct_frames([U_list[0][:, :3]], [TA[0][k]], trafos, data_shape)[0]
+        np.testing.assert_allclose(Q[k], -expected, atol=1e-12)
+
+
+def test_fft_shift_matches_spod_transforms():
+    if SPOD_LIB not in sys.path:
+        sys.path.append(SPOD_LIB)
+    spod_transforms = pytest.importorskip("transforms")
+    Nx, Nt, L = 500, 20, 1.0
+    x, dx = periodic_grid(Nx, L)
+    shifts = np.linspace(0, 0.3, Nt) * L
+    data_shape = [Nx, 1, 1, Nt]
+    q = np.reshape(np.tile(periodic_field(x, L)[:, None], [1, Nt]), data_shape)
+
+    lagrange = spod_transforms.transforms(data_shape, [L], shifts=shifts, dx=[dx], use_scipy_transform=False,
+                                          interp_order=5)
+    fft = FFTShift(data_shape, dx, shifts)
+    q_lagrange = np.reshape(lagrange.apply(q), [Nx, Nt])
+    q_fft = np.reshape(fft.apply(q), [Nx, Nt])
+    assert np.linalg.norm(q_lagrange - q_fft) / np.linalg.norm(q_fft) < 1e-6
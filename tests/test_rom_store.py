@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from compute_core import AmplitudeTable
+from rom_bundle import new_run_dir, save_rom_bundle, load_rom_bundle, resolve_rom_bundle, file_blob
+from rom_store import save_rom_store, load_rom_store
+
+
+def rom_items(seed=0):
+    rng = np.random.default_rng(seed)
+    table = AmplitudeTable.from_training([rng.standard_normal((3, 20)), rng.standard_normal((2, 20))], 4, 5)
+    return {'U_list': [rng.standard_normal((30, 3)), rng.standard_normal((30, 2))],
+            'TA_list_interp': table,
+            'shifts_train': [rng.standard_normal(20), np.zeros(20), rng.standard_normal(20)],
+            'frame_amplitudes': [[rng.standard_normal(5) for _ in range(3)], [rng.standard_normal(5)]],
+            'spod_modes': [3, 2],
+            'params': {'scaling': 'minmax', 'layers': [6, 12]},
+            'mu_vecs_train': np.array([540., 550., 560., 570.]),
+            'settings': {1, 2}}
+
+
+def assert_items_equal(loaded, items):
+    assert set(loaded) == set(items)
+    for f in range(2):
+        np.testing.assert_array_equal(loaded['U_list'][f], items['U_list'][f])
+        for m in range(items['TA_list_interp'].modes[f]):
+            np.testing.assert_array_equal(loaded['TA_list_interp'][f][m], items['TA_list_interp'][f][m])
+        for a, b in zip(loaded['frame_amplitudes'][f], items['frame_amplitudes'][f]):
+            np.testing.assert_array_equal(a, b)
+    assert isinstance(loaded['TA_list_interp'], AmplitudeTable)
+    assert loaded['TA_list_interp'].modes == [3, 2]
+    for a, b in zip(loaded['shifts_train'], items['shifts_train']):
+        np.testing.assert_array_equal(a, b)
+    np.testing.assert_array_equal(loaded['mu_vecs_train'], items['mu_vecs_train'])
+    assert loaded['spod_modes'] == [3, 2]
+    assert loaded['params'] == items['params']
+    assert loaded['settings'] == items['settings']
+
+
+@pytest.mark.parametrize("mmap_mode", ['r', None])
+def test_rom_store_round_trip(tmp_path, mmap_mode):
+    items = rom_items()
+    save_rom_store(str(tmp_path / 'store'), **items)
+    loaded = load_rom_store(str(tmp_path / 'store'), mmap_mode=mmap_mode)
+    assert_items_equal(loaded, items)
+    if mmap_mode == 'r':
+        assert isinstance(loaded['TA_list_interp'].data, np.memmap)
+
+    partial = load_rom_store(str(tmp_path / 'store'), keys=['spod_modes'])
+    assert partial == {'spod_modes': [3, 2]}
+
+
+def test_rom_bundle_round_trip_and_versions(tmp_path):
+    root = str(tmp_path / 'bundles')
+    weights = tmp_path / 'weights.pt'
+    weights.write_bytes(b'\x00\x01weights\xff')
+
+    items = rom_items()
+    first = save_rom_bundle(root, 'wildfire1D', 0, weights_sPOD=file_blob(str(weights)), **items)
+    second = save_rom_bundle(root, 'wildfire1D', 0, **rom_items(seed=1))
+    assert resolve_rom_bundle(root, 'wildfire1D', 0) == second
+    assert resolve_rom_bundle(root, 'wildfire1D', 0, version=1) == first
+    with pytest.raises(KeyError):
+        resolve_rom_bundle(root, 'wildfire2D', 0)
+
+    bundle = load_rom_bundle(root, 'wildfire1D', 0, version=1)
+    assert (bundle.case, bundle.var, bundle.version) == ('wildfire1D', 0, 1)
+    assert bundle.blob('weights_sPOD').read() == weights.read_bytes()
+    assert_items_equal({key: bundle[key] for key in bundle.keys() if key != 'weights_sPOD'}, items)
+
+
+def test_new_run_dir(tmp_path):
+    (tmp_path / 'run_0').mkdir()
+    runs_before = set(tmp_path.glob('*/'))
+    with pytest.raises(RuntimeError):
+        new_run_dir(tmp_path, runs_before)
+
+    (tmp_path / 'run_1').mkdir()
+    assert new_run_dir(tmp_path, runs_before) == str(tmp_path / 'run_1')
+
+    (tmp_path / 'run_2').mkdir()
+    with pytest.raises(RuntimeError):
+        new_run_dir(tmp_path, runs_before)
@@ -0,0 +1,49 @@
+import numpy as np
+
+from shift_compression import ShiftBasis, energy_rank
+
+
+def truncated_svd(shifts, rank):
+    # Rank truncation of the 2DNonLinear shifts as done for the paper
+    U, S, VT = np.linalg.svd(shifts, full_matrices=False)
+    return U[:, :rank], np.diag(S[:rank]).dot(VT[:rank, :])
+
+
+def r_shifts(Nr=40, Nt=60, seed=0):
+    rng = np.random.default_rng(seed)
+    r = np.linspace(0, 1, Nr)[:, None]
+    t = np.linspace(0, 1, Nt)[None, :]
+    return np.sin(np.pi * r) * t + 0.1 * r ** 2 * np.cos(3 * t) + 1e-3 * rng.standard_normal((Nr, Nt))
+
+
+def test_rank_4_matches_truncated_svd():
+    shifts = r_shifts()
+    U, TA = truncated_svd(shifts, 4)
+    basis = ShiftBasis([shifts], rank=4)
+
+    # Singular vectors are only defined up to sign, the rank-4 approximation is unique
+    np.testing.assert_allclose(basis.U @ basis.TA, U @ TA, atol=1e-12)
+    signs = np.sign(np.sum(basis.U * U, axis=0))
+    np.testing.assert_allclose(basis.U * signs, U, atol=1e-10)
+    np.testing.assert_allclose(basis.TA * signs[:, None], TA, atol=1e-10)
+
+
+def test_training_shifts_project_onto_their_amplitudes():
+    shifts = r_shifts()
+    basis = ShiftBasis([shifts], rank=4)
+    np.testing.assert_allclose(basis.amplitudes([shifts]), basis.TA, atol=1e-10)
+
+
+def test_components_are_rebuilt_from_their_rows():
+    shifts = [r_shifts(Nr=10, seed=1), r_shifts(Nr=6, seed=2)]
+    basis = ShiftBasis(shifts, energy=1.0)
+    for k, s in enumerate(shifts):
+        np.testing.assert_allclose(basis.component(basis.TA, k), s, atol=1e-10)
+
+
+def test_energy_rank():
+    S = np.array([3.0, 2.0, 1.0, 0.0])
+    assert energy_rank(S, 9 / 14) == 1
+    assert energy_rank(S, 0.9) == 2
+    assert energy_rank(S, 1.0) == 3
+    assert energy_rank(np.zeros(3), 0.9) == 1
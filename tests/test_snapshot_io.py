@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from snapshot_io import ChunkedArray, convert_to_chunked
+
+
+@pytest.fixture
+def chunked(tmp_path):
+    data = np.random.default_rng(0).standard_normal((4, 3, 10))
+    np.save(tmp_path / 'SnapShotMatrix550.npy', data)
+    return data, ChunkedArray(convert_to_chunked(str(tmp_path / 'SnapShotMatrix550.npy'), chunk_size=4))
+
+
+def test_read_full_and_columns(chunked):
+    data, store = chunked
+    np.testing.assert_array_equal(store.read(), data)
+    np.testing.assert_array_equal(store.read([9, 0, 5]), data[..., [9, 0, 5]])
+
+
+def test_read_negative_indices(chunked):
+    data, store = chunked
+    np.testing.assert_array_equal(store.read([-1, -10, 3]), data[..., [-1, -10, 3]])
+    np.testing.assert_array_equal(store.read(-4), data[..., [-4]])
+
+
+@pytest.mark.parametrize("t", [10, -11, [0, 10]])
+def test_read_out_of_bounds(chunked, t):
+    with pytest.raises(IndexError):
+        chunked[1].read(t)
@@ -1,9 +1,8 @@
 import time
 from Helper import *
-from mpl_toolkits.axes_grid1.inset_locator import inset_axes
+from snapshot_io import SnapshotDataset, time_steps
 
 impath = "../plots/images_wildfire1D/"
-os.makedirs(impath, exist_ok=True)
 
 data_path = os.path.abspath(".") + '/wildfire_data/1D/'
 
@@ -14,21 +13,23 @@ cmap = 'YlOrRd'
 
 
 class wildfire1D_sup:
-    def __init__(self, q_test, shifts_test, param_test_val, var):
-        dat1_train = np.load(data_path + 'SnapShotMatrix540.npy')
-        dat2_train = np.load(data_path + 'SnapShotMatrix550.npy')
-        dat3_train = np.load(data_path + 'SnapShotMatrix560.npy')
-        dat4_train = np.load(data_path + 'SnapShotMatrix570.npy')
-        dat5_train = np.load(data_path + 'SnapShotMatrix580.npy')
-        self.grid = np.load(data_path + '1D_Grid.npy', allow_pickle=True)
+    def __init__(self, q_test, shifts_test, param_test_val, var, mu_vecs_train=(540, 550, 560, 570, 580),
+                 mmap_mode='r', dtype=np.float64, io_workers=4, test_sample=None,
+                 trafo_cache_bytes=1024 ** 3):
+        self.dataset = SnapshotDataset(data_path)
+        # Working precision of snapshots, modes and reconstructions (shifts are kept in float64)
+        self.dtype = np.dtype(dtype)
+        # The transformations of the test shifts are built once and kept for test_data and plot_sPOD_frames, up to
+        # `trafo_cache_bytes` (the online transformations change with every prediction and are not kept)
+        self.trafo_cache = OperatorCache(transforms, max_bytes=trafo_cache_bytes)
+        self.mu_vecs_train = np.asarray(mu_vecs_train)
+
+        # Grid, time, shifts and the snapshots of the training parameters are read concurrently
+        (self.grid, self.t), shifts_train, q_train = self.dataset.load_training(
+            self.mu_vecs_train, var, files=('1D_Grid.npy', 'Time.npy'), io_workers=io_workers, interleaved=False,
+            mmap_mode=mmap_mode, dtype=self.dtype)
         self.x = self.grid[0]
         self.y = self.grid[1]
-        self.t = np.load(data_path + 'Time.npy')
-        delta1_train = np.load(data_path + 'Shifts540.npy')
-        delta2_train = np.load(data_path + 'Shifts550.npy')
-        delta3_train = np.load(data_path + 'Shifts560.npy')
-        delta4_train = np.load(data_path + 'Shifts570.npy')
-        delta5_train = np.load(data_path + 'Shifts580.npy')
 
         self.var = var
         self.Nx = np.size(self.x)
@@ -37,18 +38,26 @@ class wildfire1D_sup:
         self.param_test_val = param_test_val
         self.mu_vecs_test = np.asarray([self.param_test_val])
 
-        self.q_test = q_test[self.var * self.Nx:(self.var + 1) * self.Nx, :]
+        # The test parameter is read from the case directory unless given. With `test_sample` (query mode) only that
+        # time step is kept and read from disk, from the time-chunked store if one was written by convert_to_chunked
+        self.test_sample = test_sample
+        if q_test is None:
+            self.q_test = self.dataset.load_snapshots(param_test_val, var, interleaved=False, mmap_mode=mmap_mode,
+                                                      t=test_sample, dtype=self.dtype)
+        else:
+            self.q_test = np.asarray(time_steps(q_test[self.var * self.Nx:(self.var + 1) * self.Nx, :], test_sample),
+                                     dtype=self.dtype)
+        if shifts_test is None:
+            shifts_test = self.dataset.load_shifts(param_test_val, t=test_sample)
+        else:
+            shifts_test = time_steps(shifts_test, test_sample)
         self.shifts_test = shifts_test
 
-        q_train_total = np.concatenate((dat1_train, dat2_train, dat3_train, dat4_train, dat5_train), axis=1)
-        self.q_train = q_train_total[var * self.Nx:(var + 1) * self.Nx, :]
-        self.shifts_train = np.concatenate((delta1_train, delta2_train, delta3_train, delta4_train, delta5_train),
-                                           axis=1)
-
-        self.Nsamples_train = 5
+        self.Nsamples_train = np.size(self.mu_vecs_train)
         self.NumFrames = 3
 
-        self.mu_vecs_train = np.asarray([540, 550, 560, 570, 580])
+        self.q_train = np.concatenate(q_train, axis=1)
+        self.shifts_train = np.concatenate(shifts_train, axis=1)
         self.params_train = [np.squeeze(np.asarray([[np.ones_like(self.t) * mu], [self.t]])) for mu in
                              self.mu_vecs_train]
         self.params_train = np.concatenate(self.params_train, axis=1)
@@ -95,29 +104,33 @@ class wildfire1D_sup:
         # Calculate the time amplitudes for training wildfire_data
         U_list = []
         spod_modes = []
-        frame_amplitude_list_interpolation = []
         frame_amplitude_list_training = []
         cnt = 0
         for frame in sPOD_frames_train:
             VT = frame.modal_system["VT"]
             S = frame.modal_system["sigma"]
-            VT = np.diag(S) @ VT
+            VT = np.asarray(np.diag(S) @ VT, dtype=self.dtype)
             Nmodes = frame.Nmodes
-            amplitudes = [np.reshape(VT[n, :], [self.Nsamples_train, self.Nt]).T for n in range(Nmodes)]
-            frame_amplitude_list_interpolation.append(amplitudes)
             frame_amplitude_list_training.append(VT)
-            U_list.append(frame.modal_system["U"])
+            U_list.append(np.asarray(frame.modal_system["U"], dtype=self.dtype))
             spod_modes.append(Nmodes)
             cnt = cnt + 1
 
-        q_spod_frames = [sPOD_frames_train[0].build_field(),
-                         sPOD_frames_train[1].build_field(),
-                         sPOD_frames_train[2].build_field(),
-                         qtilde_train]
+        frame_amplitude_list_interpolation = AmplitudeTable.from_training(
+            [VT[:Nmodes] for VT, Nmodes in zip(frame_amplitude_list_training, spod_modes)], self.Nsamples_train,
+            self.Nt)
+
+        q_spod_frames = [np.asarray(q, dtype=self.dtype) for q in [sPOD_frames_train[0].build_field(),
+                                                                   sPOD_frames_train[1].build_field(),
+                                                                   sPOD_frames_train[2].build_field(),
+                                                                   qtilde_train]]
 
         return q_spod_frames, U_list, frame_amplitude_list_training, frame_amplitude_list_interpolation, spod_modes
 
     def test_data(self, spod_iter):
+        if self.test_sample is not None:
+            raise ValueError("test_data needs the full test trajectory, only time step {} was loaded".format(
+                self.test_sample))
         ##########################################
         # Calculate the transformation interpolation error
         dat = self.q_test
@@ -126,15 +139,15 @@ class wildfire1D_sup:
         L = [self.x[-1]]
         q = np.reshape(dat, data_shape)
 
-        trafo_test_1 = transforms(data_shape, L, shifts=self.shifts_test[0], dx=[dx],
-                                  use_scipy_transform=False,
-                                  interp_order=5)
-        trafo_test_2 = transforms(data_shape, L, shifts=self.shifts_test[1], trafo_type="identity",
-                                  dx=[dx],
-                                  use_scipy_transform=False, interp_order=5)
-        trafo_test_3 = transforms(data_shape, L, shifts=self.shifts_test[2], dx=[dx],
-                                  use_scipy_transform=False,
-                                  interp_order=5)
+        trafo_test_1 = self.trafo_cache(data_shape, L, shifts=self.shifts_test[0], dx=[dx],
+                                        use_scipy_transform=False,
+                                        interp_order=5)
+        trafo_test_2 = self.trafo_cache(data_shape, L, shifts=self.shifts_test[1], trafo_type="identity",
+                                        dx=[dx],
+                                        use_scipy_transform=False, interp_order=5)
+        trafo_test_3 = self.trafo_cache(data_shape, L, shifts=self.shifts_test[2], dx=[dx],
+                                        use_scipy_transform=False,
+                                        interp_order=5)
 
         interp_err = give_interpolation_error(q, trafo_test_1)
         print("Transformation interpolation error =  %4.4e " % interp_err)
@@ -156,7 +169,7 @@ class wildfire1D_sup:
         q2_test = sPOD_frames_test[1].build_field()
         q3_test = sPOD_frames_test[2].build_field()
 
-        Q_frames_test = [q1_test, q2_test, q3_test, qtilde_test]
+        Q_frames_test = [np.asarray(q, dtype=self.dtype) for q in [q1_test, q2_test, q3_test, qtilde_test]]
 
         return Q_frames_test
 
@@ -169,15 +182,15 @@ class wildfire1D_sup:
         data_shape = [self.Nx, 1, 1, self.Nt]
         dx = self.x[1] - self.x[0]
         L = [self.x[-1]]
-        trafo_test_1 = transforms(data_shape, L, shifts=self.shifts_test[0], dx=[dx],
-                                  use_scipy_transform=False,
-                                  interp_order=5)
-        trafo_test_2 = transforms(data_shape, L, shifts=self.shifts_test[1], trafo_type="identity",
-                                  dx=[dx],
-                                  use_scipy_transform=False, interp_order=5)
-        trafo_test_3 = transforms(data_shape, L, shifts=self.shifts_test[2], dx=[dx],
-                                  use_scipy_transform=False,
-                                  interp_order=5)
+        trafo_test_1 = self.trafo_cache(data_shape, L, shifts=self.shifts_test[0], dx=[dx],
+                                        use_scipy_transform=False,
+                                        interp_order=5)
+        trafo_test_2 = self.trafo_cache(data_shape, L, shifts=self.shifts_test[1], trafo_type="identity",
+                                        dx=[dx],
+                                        use_scipy_transform=False, interp_order=5)
+        trafo_test_3 = self.trafo_cache(data_shape, L, shifts=self.shifts_test[2], dx=[dx],
+                                        use_scipy_transform=False,
+                                        interp_order=5)
 
         q1_spod_frame = trafo_test_1.apply(q1_spod_frame)
         q2_spod_frame = trafo_test_2.apply(q2_spod_frame)
@@ -185,25 +198,84 @@ class wildfire1D_sup:
 
         plot_sPODframes(self.q_test, q1_spod_frame, q2_spod_frame, q3_spod_frame, qtilde_test, self.x, self.t)
 
+    def test_snapshot(self, t):
+        """Test snapshot [M, 1] and test shifts [..., 1] of time step `t` (query mode)"""
+        if self.test_sample is None:
+            return self.q_test[:, t:t + 1], self.shifts_test[..., t:t + 1]
+        if t != self.test_sample:
+            raise ValueError("Only time step {} of the test parameter was loaded".format(self.test_sample))
+        return self.q_test, self.shifts_test
+
+    def trafo_kwargs(self):
+        """Arguments of the frame transformations of the online reconstruction, frame 2 is not shifted"""
+        kwargs = {'dx': [self.x[1] - self.x[0]], 'use_scipy_transform': False, 'interp_order': 5}
+        return [kwargs, dict(kwargs, trafo_type="identity"), kwargs]
+
+    def reconstruct_sPOD_batch(self, frame_amplitudes_predicted_sPOD, shifts_predicted, spod_modes, U_list,
+                               batch_size=None, max_bytes=None):
+        """sPOD-NN reconstructions of several test parameters, given the lists of their predicted time amplitudes and
+        shifts (as passed to `plot_online_data`). The parameters of a chunk (`batch_size`, or bounded by `max_bytes`,
+        see `reconstruct_batch`) share one transformation and one product per frame. Returns a generator of the
+        [Nx, 1, 1, Nt] reconstructions."""
+        Nmf = spod_modes
+        Nt = np.size(frame_amplitudes_predicted_sPOD[0], 1)
+        TA = [np.asarray(a, dtype=self.dtype) for a in frame_amplitudes_predicted_sPOD]
+        TA_batch = [[a[:Nmf[0], :] for a in TA],
+                    [a[Nmf[0]:Nmf[0] + Nmf[1], :] for a in TA],
+                    [a[Nmf[0] + Nmf[1]:, :] for a in TA]]
+        shifts_batch = [[s[0, :] for s in shifts_predicted], None, [s[1, :] for s in shifts_predicted]]
+
+        U_list = [np.asarray(U, dtype=self.dtype) for U in U_list]
+        return unstack_batch(reconstruct_batch(U_list, TA_batch, shifts_batch, [self.Nx, 1, 1, Nt], [self.x[-1]],
+                                               self.trafo_kwargs(), dtype=self.dtype, batch_size=batch_size,
+                                               max_bytes=max_bytes))
+
+    def sPOD_I_sweep(self, mu_vecs, TA_list_interp, spod_modes, U_list, reconstruct=False, method="linear",
+                     batch_size=None, max_bytes=None):
+        """sPOD-I predictions of K parameters `mu_vecs` at once (e.g. a dense parameter sweep). Amplitudes and shifts of
+        all parameters are interpolated in one pass, the reconstructions of a chunk of parameters share one
+        transformation per frame (see `sweep_reconstructions`).
+
+        Returns the amplitudes [K, frame_modes, Nt] of every frame, the shifts [K, Nt] of frame 1 and 3 and, with
+        `reconstruct=True`, a generator of the K reconstructed fields [Nx, 1, 1, Nt].
+        """
+        shift_series = [np.reshape(self.shifts_train[f], [self.Nsamples_train, self.Nt]).T for f in (0, 2)]
+        TA, shifts = interpolate_many(spod_modes, TA_list_interp, self.mu_vecs_train, np.asarray(mu_vecs),
+                                      shift_series, method=method)
+        shifts_1, shifts_3 = shifts[:, 0], shifts[:, 1]
+        if not reconstruct:
+            return TA, shifts_1, shifts_3
+
+        Q = sweep_reconstructions(U_list, TA, [list(shifts_1), None, list(shifts_3)], [self.Nx, 1, 1, self.Nt],
+                                  [self.x[-1]], self.trafo_kwargs(), dtype=self.dtype, batch_size=batch_size,
+                                  max_bytes=max_bytes)
+        return TA, shifts_1, shifts_3, Q
+
     def plot_online_data(self, frame_amplitude_predicted_sPOD, frame_amplitude_predicted_POD,
                          TA_TEST, TA_POD_TEST, TA_list_interp, shifts_predicted,
                          SHIFTS_TEST, spod_modes, U_list, U_POD_TRAIN, Q_frames_test,
-                         plot_online=False, test_type=None):
+                         plot_online=False, test_type=None, verbose=False):
 
-        if test_type['typeOfTest'] == "query":
+        q_test = self.q_test
+        shifts_train = self.shifts_train
+        query = test_type is not None and test_type['typeOfTest'] == "query"
+        if query:
             plot_online = False
             test_sample = test_type['test_sample']
-            self.q_test = self.q_test[:, test_sample][..., np.newaxis]
-            self.shifts_train = np.asarray([self.shifts_train[:, i * self.Nt + test_sample]
-                                            for i in range(self.Nsamples_train)]).transpose()
+            # Only the requested time step is taken from the test data and the training shifts (strided views)
+            q_test, _ = self.test_snapshot(test_sample)
+            shifts_train = shifts_train[:, test_sample::self.Nt]
 
         print("#############################################")
         print('Online Error checks')
         # Online error with respect to testing data
         Nx = len(self.x)
         Nt = frame_amplitude_predicted_sPOD.shape[1]  # len(self.t)
-        dx = self.x[1] - self.x[0]
         Nmf = spod_modes
+        frame_amplitude_predicted_sPOD = np.asarray(frame_amplitude_predicted_sPOD, dtype=self.dtype)
+        frame_amplitude_predicted_POD = np.asarray(frame_amplitude_predicted_POD, dtype=self.dtype)
+        U_list = [np.asarray(U, dtype=self.dtype) for U in U_list]
+        U_POD_TRAIN = np.asarray(U_POD_TRAIN, dtype=self.dtype)
         time_amplitudes_1_pred = frame_amplitude_predicted_sPOD[:Nmf[0], :]
         time_amplitudes_2_pred = frame_amplitude_predicted_sPOD[Nmf[0]:Nmf[0] + Nmf[1], :]
         time_amplitudes_3_pred = frame_amplitude_predicted_sPOD[Nmf[0] + Nmf[1]:, :]
@@ -212,33 +284,24 @@ class wildfire1D_sup:
 
         # Implement the interpolation to find the online prediction
         tic_I = time.process_time()
+        interpolator = interpolation_weights(self.mu_vecs_train, self.mu_vecs_test)
         shifts_list_interpolated = []
         cnt = 0
         for frame in range(self.NumFrames):
-            shifts = np.reshape(self.shifts_train[cnt], [self.Nsamples_train, Nt]).T
+            shifts = np.reshape(shifts_train[cnt], [self.Nsamples_train, Nt]).T
             shifts_list_interpolated.append(shifts)
             cnt = cnt + 1
 
-        DELTA_PRED_FRAME_WISE = my_delta_interpolate(shifts_list_interpolated, self.mu_vecs_train, self.mu_vecs_test)
+        DELTA_PRED_FRAME_WISE = my_delta_interpolate(shifts_list_interpolated, self.mu_vecs_train,
+                                                     self.mu_vecs_test, interpolator)
         data_shape = [Nx, 1, 1, Nt]
         L = [self.x[-1]]
-        tic_trafo_1 = time.process_time()
-        trafo_interpolated_1 = transforms(data_shape, L, shifts=DELTA_PRED_FRAME_WISE[0], dx=[dx],
-                                          use_scipy_transform=False,
-                                          interp_order=5)
-        trafo_interpolated_2 = transforms(data_shape, L, shifts=DELTA_PRED_FRAME_WISE[1], trafo_type="identity",
-                                          dx=[dx],
-                                          use_scipy_transform=False, interp_order=5)
-        trafo_interpolated_3 = transforms(data_shape, L, shifts=DELTA_PRED_FRAME_WISE[2], dx=[dx],
-                                          use_scipy_transform=False,
-                                          interp_order=5)
-        toc_trafo_1 = time.process_time()
-        trafos_interpolated = [trafo_interpolated_1, trafo_interpolated_2, trafo_interpolated_3]
+        trafos_interpolated, trafo_time_I = frame_transforms(data_shape, L, DELTA_PRED_FRAME_WISE, self.trafo_kwargs())
 
         QTILDE_FRAME_WISE, TA_INTERPOLATED = my_interpolated_state(spod_modes, U_list,
                                                                    TA_list_interp, self.mu_vecs_train,
                                                                    Nx, 1, Nt, self.mu_vecs_test,
-                                                                   trafos_interpolated)
+                                                                   trafos_interpolated, interpolator=interpolator)
         toc_I = time.process_time()
 
         # Shifts error
@@ -288,68 +351,44 @@ class wildfire1D_sup:
 
         # Frame wise error
         tic_sPOD = time.process_time()
-        q1_pred = U_list[0] @ time_amplitudes_1_pred
-        q2_pred = U_list[1] @ time_amplitudes_2_pred
-        q3_pred = U_list[2] @ time_amplitudes_3_pred
-
-        Q_recon_sPOD = 0
-        NumFrames = 3
-        Q_pred = [np.reshape(q1_pred, newshape=data_shape),
-                  np.reshape(q2_pred, newshape=data_shape),
-                  np.reshape(q3_pred, newshape=data_shape)]
-
-        shifts_1 = shifts_1_pred
-        shifts_2 = np.zeros_like(shifts_1_pred)
-        shifts_3 = shifts_3_pred
-        L = [self.x[-1]]
-        tic_trafo_2 = time.process_time()
-        trafos_1 = transforms(data_shape, L, shifts=shifts_1, dx=[dx],
-                              use_scipy_transform=False,
-                              interp_order=5)
-        trafos_2 = transforms(data_shape, L, shifts=shifts_2, trafo_type="identity", dx=[dx],
-                              use_scipy_transform=False,
-                              interp_order=5)
-        trafos_3 = transforms(data_shape, L, shifts=shifts_3, dx=[dx],
-                              use_scipy_transform=False,
-                              interp_order=5)
-        toc_trafo_2 = time.process_time()
-        trafos = [trafos_1, trafos_2, trafos_3]
-        for frame in range(NumFrames):
-            Q_recon_sPOD += trafos[frame].apply(Q_pred[frame])
+        shifts = [shifts_1_pred, np.zeros_like(shifts_1_pred), shifts_3_pred]
+        trafos, trafo_time_sPOD = frame_transforms(data_shape, L, shifts, self.trafo_kwargs())
+        Q_recon_sPOD = sum(reconstruct_frames(U_list, [time_amplitudes_1_pred, time_amplitudes_2_pred,
+                                                       time_amplitudes_3_pred], trafos, data_shape, self.dtype))
         toc_sPOD = time.process_time()
 
         tic_POD = time.process_time()
         Q_recon_POD = U_POD_TRAIN @ frame_amplitude_predicted_POD
         toc_POD = time.process_time()
 
-        self.q_test = np.squeeze(self.q_test)
+        q_test = np.squeeze(q_test)
         Q_recon_sPOD = np.squeeze(Q_recon_sPOD)
         Q_recon_POD = np.squeeze(Q_recon_POD)
         QTILDE_FRAME_WISE = np.squeeze(QTILDE_FRAME_WISE)
 
-        num1 = np.linalg.norm(self.q_test - Q_recon_sPOD)
-        den1 = np.linalg.norm(self.q_test)
+        num1 = np.linalg.norm(q_test - Q_recon_sPOD)
+        den1 = np.linalg.norm(q_test)
 
-        num2 = np.linalg.norm(self.q_test - Q_recon_POD)
-        den2 = np.linalg.norm(self.q_test)
+        num2 = np.linalg.norm(q_test - Q_recon_POD)
+        den2 = np.linalg.norm(q_test)
 
-        num1_i = np.linalg.norm(self.q_test - QTILDE_FRAME_WISE)
-        den1_i = np.linalg.norm(self.q_test)
+        num1_i = np.linalg.norm(q_test - QTILDE_FRAME_WISE)
+        den1_i = np.linalg.norm(q_test)
 
         print('Check 3...')
         print("Relative reconstruction error indicator for full snapshot (sPOD-NN): {}".format(num1 / den1))
         print("Relative reconstruction error indicator for full snapshot (sPOD-I): {}".format(num1_i / den1_i))
         print("Relative reconstruction error indicator for full snapshot (POD-NN): {}".format(num2 / den2))
 
-        if test_type['typeOfTest'] != "query":
-            one = self.q_test - Q_recon_sPOD
+        if not query:
+            one = q_test - Q_recon_sPOD
             num1 = np.sqrt(np.einsum('ij,ij->j', one, one))
-            den1 = np.sqrt(np.sum(np.einsum('ij,ij->j', self.q_test, self.q_test)) / self.Nt)
+            den1 = np.sqrt(np.sum(np.einsum('ij,ij->j', q_test, q_test)) / self.Nt)
 
-            two = self.q_test - Q_recon_POD
+            two = q_test - Q_recon_POD
             num2 = np.sqrt(np.einsum('ij,ij->j', two, two))
 
-            three = self.q_test - QTILDE_FRAME_WISE
+            three = q_test - QTILDE_FRAME_WISE
             num3 = np.sqrt(np.einsum('ij,ij->j', three, three))
 
             rel_err_sPOD = num1 / den1
@@ -361,22 +400,16 @@ class wildfire1D_sup:
             errors = [np.zeros(self.Nt), np.zeros(self.Nt), np.zeros(self.Nt)]
             
         if plot_online:
-            if test_type['typeOfTest'] != "query":
+            if not query:
                 plot_pred_comb(time_amplitudes_1_pred, time_amplitudes_1_test, time_amplitudes_2_pred,
                                time_amplitudes_2_test, time_amplitudes_3_pred, time_amplitudes_3_test,
                                TA_INTERPOLATED, shifts_1_pred, shifts_3_pred, SHIFTS_TEST, DELTA_PRED_FRAME_WISE,
                                frame_amplitude_predicted_POD, TA_POD_TEST, self.x, self.t)
-                plot_recons_snapshot_cross_section(self.q_test, QTILDE_FRAME_WISE, Q_recon_sPOD, Q_recon_POD, self.x,
+                plot_recons_snapshot_cross_section(q_test, QTILDE_FRAME_WISE, Q_recon_sPOD, Q_recon_POD, self.x,
                                                    self.t)
 
-        print('Timing...')
-        print(
-            f"Time consumption in assembling the transformation operators (sPOD-NN) : {toc_trafo_2 - tic_trafo_2:0.4f} seconds")
-        print(
-            f"Time consumption in assembling the transformation operators (sPOD-I) : {toc_trafo_1 - tic_trafo_1:0.4f} seconds")
-        print(f"Time consumption in assembling the final solution (sPOD-NN) : {((toc_sPOD - tic_sPOD) - (toc_trafo_2 - tic_trafo_2)):0.4f} seconds")
-        print(f"Time consumption in assembling the final solution (sPOD-I)  : {((toc_I - tic_I) - (toc_trafo_1 - tic_trafo_1)):0.4f} seconds")
-        print(f"Time consumption in assembling the final solution (POD-NN)  : {toc_POD - tic_POD:0.4f} seconds")
+        report_online_timing(trafo_time_sPOD, trafo_time_I, toc_sPOD - tic_sPOD - trafo_time_sPOD,
+                             toc_I - tic_I - trafo_time_I, toc_POD - tic_POD, verbose=verbose)
 
         return errors
 
@@ -430,6 +463,7 @@ def plot_sPODframes(q_test, q1_spod_frame, q2_spod_frame, q3_spod_frame, qtilde,
     fig.supylabel(r"time $t$")
     fig.supxlabel(r"space $x$")
 
+    os.makedirs(impath, exist_ok=True)
     save_fig(filepath=impath + "frames_sPOD", figure=fig)
 
 
@@ -503,6 +537,7 @@ def plot_pred_comb(time_amplitudes_1_pred, time_amplitudes_1_test, time_amplitud
     axs[2, 1].grid()
 
     fig.supxlabel(r"time $t$")
+    os.makedirs(impath, exist_ok=True)
     save_fig(filepath=impath + "all_comb_pred", figure=fig)
     fig.savefig(impath + "all_comb_pred" + ".pdf", format='pdf', dpi=200, transparent=True, bbox_inches="tight")
 
@@ -590,4 +625,5 @@ def plot_recons_snapshot_cross_section(q_test, Q_recon_interp, Q_recon_sPOD, Q_r
     subfig_b.supylabel(r"$T$")
     subfig_b.supxlabel(r"space $x$")
 
+    os.makedirs(impath, exist_ok=True)
     fig.savefig(impath + "T_x_cross_section" + ".png", dpi=300, transparent=True)
@@ -1,10 +1,9 @@
 import time
 from Helper import *
-from mpl_toolkits.axes_grid1.inset_locator import inset_axes
-from wildfire2D_sup import cartesian_to_polar, polar_to_cartesian
+from snapshot_io import SnapshotDataset, extract_variable, time_steps
+from shift_compression import ShiftBasis
 
 impath = "../plots/images_wildfire2DNonLinear/"
-os.makedirs(impath, exist_ok=True)
 
 data_path = os.path.abspath(".") + '/wildfire_data/2DNonLinear/'
 
@@ -14,24 +13,36 @@ cmap = 'YlOrRd'
 
 
 class wildfire2DNonLinear_sup:
-    def __init__(self, q_test, shifts_test, param_test_val, var):
-        dat1_train = np.load(data_path + 'SnapShotMatrix540.npy')
-        dat2_train = np.load(data_path + 'SnapShotMatrix550.npy')
-        dat3_train = np.load(data_path + 'SnapShotMatrix560.npy')
-        dat4_train = np.load(data_path + 'SnapShotMatrix570.npy')
-        dat5_train = np.load(data_path + 'SnapShotMatrix580.npy')
-        self.grid_1D = np.load(data_path + '1D_Grid.npy', allow_pickle=True)
-        self.grid_2D = np.load(data_path + '2D_Grid.npy', allow_pickle=True)
+    """2D wildfire case with the non-linear (polar r) transport of frame 1.
+
+    The r-shifts of frame 1 are compressed to `truncate_shift_rank` amplitudes (or the rank holding `shift_energy`).
+    With `test_shift_basis="train"` (default) the test shifts are projected onto the basis of the training shifts, so
+    `shift_TA_test` (the network targets of the test parameter) is comparable to the predicted amplitudes. This
+    changes the reported shift errors and test targets with respect to the paper, where the test shifts were
+    compressed with their own SVD. `test_shift_basis="test"` keeps that behaviour (`shift_U_test` then differs from
+    `shift_U_train`).
+    """
+
+    def __init__(self, q_test, shifts_test, param_test_val, var, mu_vecs_train=(540, 550, 560, 570, 580),
+                 mmap_mode='r', dtype=np.float64, io_workers=4, shift_energy=None, test_sample=None,
+                 test_shift_basis="train"):
+        if test_shift_basis not in ("train", "test"):
+            raise ValueError("test_shift_basis must be 'train' or 'test', got {!r}".format(test_shift_basis))
+        if test_shift_basis == "test" and test_sample is not None:
+            raise ValueError("test_shift_basis='test' needs the shifts of all time steps, not only test_sample")
+        self.dataset = SnapshotDataset(data_path)
+        # Working precision of snapshots, polar data, modes and reconstructions (shifts are kept in float64)
+        self.dtype = np.dtype(dtype)
+        self.mu_vecs_train = np.asarray(mu_vecs_train)
+
+        # Grids, time, shifts and the snapshots of the training parameters are read concurrently
+        (self.grid_1D, self.grid_2D, self.t), deltas_train, q_train = self.dataset.load_training(
+            self.mu_vecs_train, var, files=('1D_Grid.npy', '2D_Grid.npy', 'Time.npy'), io_workers=io_workers,
+            mmap_mode=mmap_mode, order="F", dtype=self.dtype)
         self.x = self.grid_1D[0]
         self.y = self.grid_1D[1]
         self.X = self.grid_2D[0]
         self.Y = self.grid_2D[1]
-        self.t = np.load(data_path + 'Time.npy')
-        delta1_train = np.load(data_path + 'Shifts540.npy')
-        delta2_train = np.load(data_path + 'Shifts550.npy')
-        delta3_train = np.load(data_path + 'Shifts560.npy')
-        delta4_train = np.load(data_path + 'Shifts570.npy')
-        delta5_train = np.load(data_path + 'Shifts580.npy')
 
         self.truncate_shift_rank = 4
 
@@ -41,68 +52,65 @@ class wildfire2DNonLinear_sup:
         self.Nt = np.size(self.t)
         self.x_c = self.x[-1] // 2
         self.y_c = self.y[-1] // 2
+        self.geometry = PolarGeometry(self.x, self.y)
 
         # Test data
         self.param_test_val = param_test_val
         self.mu_vecs_test = np.asarray([self.param_test_val])
-        self.q_test = np.reshape(np.transpose(q_test), newshape=[self.Nt, 2, self.Nx, self.Ny], order="F")
-        self.q_test = np.transpose(np.reshape(np.squeeze(self.q_test[:, var, :, :]), newshape=[self.Nt, -1], order="F"))
-        self.shifts_test = [np.reshape(x, newshape=[2, -1, self.Nt]) for x in shifts_test]
+        # The test parameter is read from the case directory unless given. With `test_sample` (query mode) only that
+        # time step is kept and read from disk, from the time-chunked store if one was written by convert_to_chunked
+        self.test_sample = test_sample
+        if q_test is None:
+            self.q_test = self.dataset.load_snapshots(param_test_val, var, mmap_mode=mmap_mode, order="F",
+                                                      t=test_sample, dtype=self.dtype)
+        else:
+            self.q_test = np.asfortranarray(time_steps(extract_variable(q_test, var), test_sample), dtype=self.dtype)
+        if shifts_test is None:
+            shifts_test = self.dataset.load_shifts(param_test_val, t=test_sample)
+        else:
+            shifts_test = time_steps(np.asarray(shifts_test), test_sample)
+        self.shifts_test = [np.reshape(x, newshape=[2, -1, np.shape(x)[-1]]) for x in shifts_test]
         self.q_polar_test = None
 
         # Train data
-        self.Nsamples_train = 5
+        self.Nsamples_train = np.size(self.mu_vecs_train)
         self.NumFrames = 2
-        self.mu_vecs_train = np.asarray([540, 550, 560, 570, 580])
         self.params_train = [np.squeeze(np.asarray([[np.ones_like(self.t) * mu], [self.t]])) for mu in
                              self.mu_vecs_train]
         self.params_train = np.concatenate(self.params_train, axis=1)
 
-        delta1_train = [np.reshape(x, newshape=[2, -1, self.Nt]) for x in delta1_train]
-        delta2_train = [np.reshape(x, newshape=[2, -1, self.Nt]) for x in delta2_train]
-        delta3_train = [np.reshape(x, newshape=[2, -1, self.Nt]) for x in delta3_train]
-        delta4_train = [np.reshape(x, newshape=[2, -1, self.Nt]) for x in delta4_train]
-        delta5_train = [np.reshape(x, newshape=[2, -1, self.Nt]) for x in delta5_train]
+        deltas_train = [[np.reshape(x, newshape=[2, -1, self.Nt]) for x in delta] for delta in deltas_train]
         self.shifts_train = []
-        self.shifts_train.append(np.concatenate((delta1_train[0], delta2_train[0],
-                                                 delta3_train[0], delta4_train[0], delta5_train[0]), axis=-1))
-        self.shifts_train.append(np.concatenate((delta1_train[1], delta2_train[1],
-                                                 delta3_train[1], delta4_train[1], delta5_train[1]), axis=-1))
-
-        # Extract relevant shift amplitudes from the 2D shifts
-        self.shift_U_test, self.shift_TA_test = truncate_shifts(self.shifts_test)
-        self.shift_U_train, self.shift_TA_train = truncate_shifts(self.shifts_train)
-
-        dat1_train = np.reshape(np.transpose(dat1_train), newshape=[self.Nt, 2, self.Nx, self.Ny], order="F")
-        dat1_train = np.transpose(np.reshape(np.squeeze(dat1_train[:, var, :, :]), newshape=[self.Nt, -1], order="F"))
-        dat2_train = np.reshape(np.transpose(dat2_train), newshape=[self.Nt, 2, self.Nx, self.Ny], order="F")
-        dat2_train = np.transpose(np.reshape(np.squeeze(dat2_train[:, var, :, :]), newshape=[self.Nt, -1], order="F"))
-        dat3_train = np.reshape(np.transpose(dat3_train), newshape=[self.Nt, 2, self.Nx, self.Ny], order="F")
-        dat3_train = np.transpose(np.reshape(np.squeeze(dat3_train[:, var, :, :]), newshape=[self.Nt, -1], order="F"))
-        dat4_train = np.reshape(np.transpose(dat4_train), newshape=[self.Nt, 2, self.Nx, self.Ny], order="F")
-        dat4_train = np.transpose(np.reshape(np.squeeze(dat4_train[:, var, :, :]), newshape=[self.Nt, -1], order="F"))
-        dat5_train = np.reshape(np.transpose(dat5_train), newshape=[self.Nt, 2, self.Nx, self.Ny], order="F")
-        dat5_train = np.transpose(np.reshape(np.squeeze(dat5_train[:, var, :, :]), newshape=[self.Nt, -1], order="F"))
-        self.q_train = [dat1_train, dat2_train, dat3_train, dat4_train, dat5_train]
+        self.shifts_train.append(np.concatenate([delta[0] for delta in deltas_train], axis=-1))
+        self.shifts_train.append(np.concatenate([delta[1] for delta in deltas_train], axis=-1))
+
+        # Extract relevant shift amplitudes from the 2D shifts. Only the r-shifts of frame 1 are non-zero by problem
+        # design. The rank is chosen by `shift_energy` if given, else `truncate_shift_rank` amplitudes are kept
+        self.shift_basis = ShiftBasis([np.squeeze(self.shifts_train[0][0, ...])], energy=shift_energy,
+                                      rank=self.truncate_shift_rank if shift_energy is None else None)
+        self.shift_U_train, self.shift_TA_train = self.shift_basis.U, self.shift_basis.TA
+        if test_shift_basis == "train":
+            self.shift_U_test = self.shift_U_train
+            self.shift_TA_test = self.shift_basis.amplitudes([np.squeeze(self.shifts_test[0][0, ...])])
+        else:
+            test_basis = ShiftBasis([np.squeeze(self.shifts_test[0][0, ...])], rank=self.shift_basis.rank)
+            self.shift_U_test, self.shift_TA_test = test_basis.U, test_basis.TA
+
+        self.q_train = q_train
         self.q_polar_train = None
 
     def run_sPOD(self, spod_iter):
         # Reshape the variable array to suit the dimension of the input for the sPOD
         self.q_train = [np.reshape(q, newshape=[self.Nx, self.Ny, 1, self.Nt], order="F") for q in self.q_train]
 
-        # Map the field variable from cartesian to polar coordinate system
-        q_polar = []
-        s0, theta_i, r_i, _ = cartesian_to_polar(self.q_train[0], self.x, self.y, self.t)
-        q_polar.append(s0)
-        for samples in range(self.Nsamples_train - 1):
-            s, _, _, _ = cartesian_to_polar(self.q_train[samples + 1], self.x, self.y, self.t)
-            q_polar.append(s)
+        # Map the field variable from cartesian to polar coordinate system. The training matrix is allocated once at
+        # its final size and every sample is converted directly into its own columns
+        qmat = np.empty((self.Nx * self.Ny, self.Nsamples_train * self.Nt), dtype=self.dtype)
+        samples_to_polar(self.q_train, self.geometry, qmat)
 
         data_shape = [self.Nx, self.Ny, 1, self.Nsamples_train * self.Nt]
-        dr = r_i[1] - r_i[0]
-        dtheta = theta_i[1] - theta_i[0]
-        d_del = np.asarray([dr, dtheta])
-        L = np.asarray([r_i[-1], theta_i[-1]])
+        d_del = self.geometry.d_del
+        L = self.geometry.L
 
         # Create the transformations
         trafo_train_1 = transforms(data_shape, L, shifts=self.shifts_train[0],
@@ -115,7 +123,6 @@ class wildfire2DNonLinear_sup:
         # Apply srPCA on the data
         transform_list = [trafo_train_1, trafo_train_2]
 
-        qmat = np.concatenate([np.reshape(q, newshape=[-1, self.Nt]) for q in q_polar], axis=1)
         mu = np.prod(np.size(qmat, 0)) / (4 * np.sum(np.abs(qmat))) * 0.1
         lambd = 1 / np.sqrt(np.max([self.Nx, self.Ny])) * 5.0
 
@@ -127,42 +134,51 @@ class wildfire2DNonLinear_sup:
         # Calculate the time amplitudes for training data
         U_list = []
         spod_modes = []
-        frame_amplitude_list_interpolation = []
         frame_amplitude_list_training = []
         cnt = 0
         for frame in sPOD_frames_train:
             VT = frame.modal_system["VT"]
             S = frame.modal_system["sigma"]
-            VT = np.diag(S) @ VT
+            VT = np.asarray(np.diag(S) @ VT, dtype=self.dtype)
             Nmodes = frame.Nmodes
-            amplitudes = [np.reshape(VT[n, :], [self.Nsamples_train, self.Nt]).T for n in range(Nmodes)]
-            frame_amplitude_list_interpolation.append(amplitudes)
             frame_amplitude_list_training.append(VT)
-            U_list.append(frame.modal_system["U"])
+            U_list.append(np.asarray(frame.modal_system["U"], dtype=self.dtype))
             spod_modes.append(Nmodes)
             cnt = cnt + 1
 
+        frame_amplitude_list_interpolation = AmplitudeTable.from_training(
+            [VT[:Nmodes] for VT, Nmodes in zip(frame_amplitude_list_training, spod_modes)], self.Nsamples_train,
+            self.Nt)
+
         return U_list, frame_amplitude_list_training, frame_amplitude_list_interpolation, spod_modes
 
-    def test_data(self, spod_iter):
+    def test_data(self, spod_iter, check="full", check_budget=16, check_seed=None):
+        if self.test_sample is not None:
+            raise ValueError("test_data needs the full test trajectory, only time step {} was loaded".format(
+                self.test_sample))
         ##########################################
         # Reshape the variable array to suit the dimension of the input for the sPOD
         q = np.reshape(self.q_test, newshape=[self.Nx, self.Ny, 1, self.Nt], order="F")
 
         # Map the field variable from cartesian to polar coordinate system
-        q_polar, theta_i, r_i, aux = cartesian_to_polar(q, self.x, self.y, self.t, fill_val=0)
-
-        # Check the transformation back and forth error between polar and cartesian coordinates (Checkpoint)
-        q_cartesian = polar_to_cartesian(q_polar, self.t, aux=aux)
-        res = q - q_cartesian
-        err = np.linalg.norm(np.reshape(res, -1)) / np.linalg.norm(np.reshape(q, -1))
-        print("Transformation back and forth error (cartesian - polar - cartesian) =  %4.4e " % err)
+        q_polar, _, _, geometry = cartesian_to_polar(q, self.x, self.y, self.t, fill_val=0, dtype=self.dtype,
+                                                     geometry=self.geometry)
+
+        # Diagnostics (back and forth error of the polar mapping, interpolation error of the transformation), computed
+        # on all time steps (check="full"), on `check_budget` strided or random time steps or skipped (check=None)
+        steps = check_steps(self.Nt, check_budget, check, check_seed) if check is not None else []
+        if len(steps) > 0:
+            # Check the transformation back and forth error between polar and cartesian coordinates (Checkpoint)
+            q_steps = np.reshape(q[..., steps], [-1, len(steps)])
+            q_cartesian = np.reshape(polar_to_cartesian(q_polar[..., steps], self.t[steps], aux=geometry),
+                                     [-1, len(steps)])
+            report_check("Transformation back and forth error (cartesian - polar - cartesian)",
+                         np.sum((q_steps - q_cartesian) ** 2, axis=0), np.sum(q_steps ** 2, axis=0), self.Nt,
+                         seed=check_seed)
 
         data_shape = [self.Nx, self.Ny, 1, self.Nt]
-        dr = r_i[1] - r_i[0]
-        dtheta = theta_i[1] - theta_i[0]
-        d_del = np.asarray([dr, dtheta])
-        L = np.asarray([r_i[-1], theta_i[-1]])
+        d_del = self.geometry.d_del
+        L = self.geometry.L
 
         trafo_test_1 = transforms(data_shape, L, shifts=self.shifts_test[0],
                                   dx=d_del,
@@ -172,8 +188,18 @@ class wildfire2DNonLinear_sup:
                                   use_scipy_transform=False)
 
         # Check the transformation interpolation error
-        err = give_interpolation_error(q_polar, trafo_test_1)
-        print("Transformation interpolation error =  %4.4e " % err)
+        if len(steps) == self.Nt:
+            err = give_interpolation_error(q_polar, trafo_test_1)
+            print("Transformation interpolation error =  %4.4e " % err)
+        elif len(steps) > 0:
+            # Sampled: the error of every checked time step with a transformation of that step only
+            num, den = [], []
+            for k in steps:
+                trafo_k = transforms([self.Nx, self.Ny, 1, 1], L, shifts=self.shifts_test[0][..., k:k + 1], dx=d_del,
+                                     use_scipy_transform=False)
+                den.append(np.sum(np.asarray(q_polar[..., k], dtype=np.float64) ** 2))
+                num.append(give_interpolation_error(q_polar[..., k:k + 1], trafo_k) ** 2 * den[-1])
+            report_check("Transformation interpolation error", num, den, self.Nt, seed=check_seed)
 
         ##########################################
         # Apply sPOD on the data
@@ -188,18 +214,21 @@ class wildfire2DNonLinear_sup:
 
         # Deduce the frames
         modes_list = [sPOD_frames_test[0].Nmodes, sPOD_frames_test[1].Nmodes]
-        q_frame_1 = sPOD_frames_test[0].build_field()
-        q_frame_2 = sPOD_frames_test[1].build_field()
+        q_frame_1 = np.asarray(sPOD_frames_test[0].build_field(), dtype=self.dtype)
+        q_frame_2 = np.asarray(sPOD_frames_test[1].build_field(), dtype=self.dtype)
+        qtilde_test = np.asarray(qtilde_test, dtype=self.dtype)
         qtilde = np.reshape(qtilde_test, newshape=data_shape)
 
         # Transform the frame wise snapshots into lab frame (moving frame)
-        q_frame_1_lab = transform_list[0].apply(np.reshape(q_frame_1, newshape=data_shape))
-        q_frame_2_lab = transform_list[1].apply(np.reshape(q_frame_2, newshape=data_shape))
+        q_frame_1_lab = np.asarray(transform_list[0].apply(np.reshape(q_frame_1, newshape=data_shape)),
+                                   dtype=self.dtype)
+        q_frame_2_lab = np.asarray(transform_list[1].apply(np.reshape(q_frame_2, newshape=data_shape)),
+                                   dtype=self.dtype)
 
         # Shift the pre-transformed polar data to cartesian grid to visualize
-        q_frame_1_cart_lab = polar_to_cartesian(q_frame_1_lab, self.t, aux=aux)
-        q_frame_2_cart_lab = polar_to_cartesian(q_frame_2_lab, self.t, aux=aux)
-        qtilde_cart = polar_to_cartesian(qtilde, self.t, aux=aux)
+        q_frame_1_cart_lab = polar_to_cartesian(q_frame_1_lab, self.t, aux=geometry)
+        q_frame_2_cart_lab = polar_to_cartesian(q_frame_2_lab, self.t, aux=geometry)
+        qtilde_cart = polar_to_cartesian(qtilde, self.t, aux=geometry)
 
         # Relative reconstruction error for sPOD
         res = q - qtilde_cart
@@ -209,7 +238,7 @@ class wildfire2DNonLinear_sup:
         Q_frames_test_polar = [q_frame_1, q_frame_2, qtilde_test]
         Q_frames_test_cart = [q_frame_1_cart_lab, q_frame_2_cart_lab, qtilde_cart]
 
-        return Q_frames_test_polar, Q_frames_test_cart, aux
+        return Q_frames_test_polar, Q_frames_test_cart, geometry
 
 
     def plot_sPOD_frames(self, Q_frames_test_cart, plot_every=10, var_name="T"):
@@ -257,70 +286,139 @@ class wildfire2DNonLinear_sup:
                 fig.savefig(immpath + str(var_name) + "-" + str(n), dpi=200, transparent=True)
                 plt.close(fig)
 
+    def test_snapshot(self, t):
+        """Test snapshot [M, 1] and test shifts [..., 1] of time step `t` (query mode)"""
+        if self.test_sample is None:
+            return self.q_test[:, t:t + 1], [x[..., t:t + 1] for x in self.shifts_test]
+        if t != self.test_sample:
+            raise ValueError("Only time step {} of the test parameter was loaded".format(self.test_sample))
+        return self.q_test, self.shifts_test
+
+    def trafo_kwargs(self):
+        """Arguments of the frame transformations on the polar grid, frame 2 is not shifted"""
+        kwargs = {'dx': self.geometry.d_del, 'use_scipy_transform': False}
+        return [kwargs, dict(kwargs, trafo_type="identity")]
+
+    def reconstruct_sPOD_batch(self, frame_amplitudes_predicted_sPOD, shifts_predicted, spod_modes, U_list,
+                               batch_size=None, max_bytes=None):
+        """Cartesian sPOD-NN reconstructions of several test parameters, given the lists of their predicted time
+        amplitudes and shifts (as passed to `plot_online_data`). The shifted frame of the parameters of a chunk
+        (`batch_size`, or bounded by `max_bytes`, see `reconstruct_batch`) is transformed and mapped back from the polar
+        grid at once, the identity frame is reconstructed from its premapped modes. Returns a generator of the
+        [Nx, Ny, 1, Nt] reconstructions."""
+        Nmf = spod_modes
+        Nt = np.size(frame_amplitudes_predicted_sPOD[0], 1)
+        TA = [np.asarray(a, dtype=self.dtype) for a in frame_amplitudes_predicted_sPOD]
+        U_cart_2 = self.geometry.cartesian_basis(U_list[1]).astype(self.dtype, copy=False)
+        U_list = [np.asarray(U, dtype=self.dtype) for U in U_list]
+        shifts = []
+        for s in shifts_predicted:
+            shift = np.zeros([2, Nt])
+            shift[0] = self.shift_U_train @ s
+            shifts.append(shift)
+
+        data_shape = [self.Nx, self.Ny, 1, Nt]
+        TA_2 = [a[Nmf[0]:, :] for a in TA]
+
+        batches = reconstruct_batch(U_list[:1], [[a[:Nmf[0], :] for a in TA]], [shifts], data_shape, self.geometry.L,
+                                    self.trafo_kwargs()[:1], dtype=self.dtype, batch_size=batch_size,
+                                    max_bytes=max_bytes)
+        return unstack_batch(batches, cartesian_finish(self.geometry, self.t, U_cart_2, TA_2))
+
+    def sPOD_I_sweep(self, mu_vecs, TA_list_interp, spod_modes, U_list, reconstruct=False, method="linear",
+                     batch_size=None, max_bytes=None):
+        """sPOD-I predictions of K parameters `mu_vecs` at once (e.g. a dense parameter sweep). Amplitudes and shifts of
+        all parameters are interpolated in one pass, the reconstructions of a chunk of parameters share one
+        transformation of the shifted frame and one mapping back to the cartesian grid (see `sweep_reconstructions`).
+
+        Returns the amplitudes [K, frame_modes, Nt] of every frame, the shifts [K, 2, ..., Nt] (r and theta) of frame 1
+        and, with `reconstruct=True`, a generator of the K cartesian reconstructions [Nx, Ny, 1, Nt].
+        """
+        mu_vecs = np.asarray(mu_vecs)
+        K = np.size(mu_vecs, 0)
+        Nt = self.Nt
+        shift_series = [np.reshape(ta, [self.Nsamples_train, Nt]).T for ta in self.shift_TA_train]
+        TA, shifts = interpolate_many(spod_modes, TA_list_interp, self.mu_vecs_train, mu_vecs, shift_series,
+                                      method=method)
+        # Only the r-shift of frame 1 is non zero, it is rebuilt from the interpolated shift amplitudes
+        shift_TA = np.reshape(np.moveaxis(shifts, 1, 0), [self.shift_basis.rank, -1])
+        shift_r = np.moveaxis(np.reshape(self.shift_U_train @ shift_TA, [-1, K, Nt]), 1, 0)
+        shifts = np.zeros([K, 2] + list(np.shape(shift_r)[1:]))
+        shifts[:, 0] = shift_r
+        if not reconstruct:
+            return TA, shifts
+
+        U_cart_2 = self.geometry.cartesian_basis(U_list[1])[:, :spod_modes[1]].astype(self.dtype, copy=False)
+        finish = cartesian_finish(self.geometry, self.t, U_cart_2, np.asarray(TA[1], dtype=self.dtype))
+        Q = sweep_reconstructions(U_list[:1], TA[:1], [list(shifts)], [self.Nx, self.Ny, 1, Nt], self.geometry.L,
+                                  self.trafo_kwargs()[:1], dtype=self.dtype, finish=finish, batch_size=batch_size,
+                                  max_bytes=max_bytes)
+        return TA, shifts, Q
+
     def plot_online_data(self, frame_amplitude_predicted_sPOD, frame_amplitude_predicted_POD,
                          TA_TEST, TA_POD_TEST, TA_list_interp, shifts_predicted, SHIFTS_TEST, spod_modes,
-                         U_list, U_POD_TRAIN, q_test_polar, Q_frames_test_polar, aux, plot_online=False):
+                         U_list, U_POD_TRAIN, q_test_polar, Q_frames_test_polar, aux, plot_online=False,
+                         test_type=None, verbose=False):
 
         Ndims = 2
         Nt = frame_amplitude_predicted_sPOD.shape[1]
-        Q = np.reshape(self.q_test, newshape=[self.Nx, self.Ny, 1, self.Nt], order="F")
-        q_test_polar = np.reshape(q_test_polar, newshape=[self.Nx, self.Ny, 1, self.Nt])
+        shift_TA_train = self.shift_TA_train
+        shifts_test = self.shifts_test
+        t_exact = None
+        if test_type is not None and test_type['typeOfTest'] == "query":
+            test_sample = test_type['test_sample']
+            t_exact = test_sample
+
+            # Only the requested time step is taken from the training shift amplitudes (one strided view) and the
+            # test data, the rest of the evaluation then runs on a single column
+            shift_TA_train = shift_TA_train[:, test_sample::self.Nt]
+            q_test, shifts_test = self.test_snapshot(test_sample)
+            q_test_polar = np.reshape(np.reshape(q_test_polar, [-1, self.Nt])[:, test_sample], [self.Nx, self.Ny, 1, 1])
+            Q = np.reshape(q_test, [self.Nx, self.Ny, 1, 1], order="F")
+        else:
+            Q = np.reshape(self.q_test, newshape=[self.Nx, self.Ny, 1, self.Nt], order="F")
+            q_test_polar = np.reshape(q_test_polar, newshape=[self.Nx, self.Ny, 1, self.Nt])
         print("#############################################")
         print('Online Error checks')
         # %% Online error with respect to testing wildfire_data
         Nmf = spod_modes
+        frame_amplitude_predicted_sPOD = np.asarray(frame_amplitude_predicted_sPOD, dtype=self.dtype)
+        frame_amplitude_predicted_POD = np.asarray(frame_amplitude_predicted_POD, dtype=self.dtype)
+        U_list = [np.asarray(U, dtype=self.dtype) for U in U_list]
+        U_POD_TRAIN = np.asarray(U_POD_TRAIN, dtype=self.dtype)
         time_amplitudes_1_pred = frame_amplitude_predicted_sPOD[:Nmf[0], :]
         time_amplitudes_2_pred = frame_amplitude_predicted_sPOD[Nmf[0]:, :]
         shift_TA_pred = shifts_predicted
 
-        X_new = self.X - self.x_c  # Shift the origin to the center of the image
-        Y_new = self.Y - self.y_c
-        r = np.sqrt(X_new ** 2 + Y_new ** 2).flatten()  # polar coordinate r
-        theta = np.arctan2(Y_new, X_new).flatten()  # polar coordinate theta
-        r_i = np.linspace(np.min(r), np.max(r), self.Nx)
-        theta_i = np.linspace(np.min(theta), np.max(theta), self.Ny)
-        dr = r_i[1] - r_i[0]
-        dtheta = theta_i[1] - theta_i[0]
-        d_del = np.asarray([dr, dtheta])
-        L = np.asarray([r_i[-1], theta_i[-1]])
+        L = self.geometry.L
         data_shape = [self.Nx, self.Ny, 1, Nt]
 
         # Implement the interpolation to find the online prediction
         tic_I = time.process_time()
-        shifts_TA_list_interpolated = []
-        for rank in range(self.truncate_shift_rank):
-            shifts_TA_list_interpolated.append(
-                np.reshape(self.shift_TA_train[rank], [self.Nsamples_train, Nt]).T)
-        DELTA_TA = my_delta_interpolate(shifts_TA_list_interpolated, self.mu_vecs_train, self.mu_vecs_test)
-        DELTA_TA = [x[np.newaxis, ...] for x in DELTA_TA]
-        DELTA_TA = np.concatenate(DELTA_TA, axis=0)
-
-        DELTA_PRED_FRAME_WISE = [np.zeros_like(self.shifts_test[0]), np.zeros_like(self.shifts_test[1])]
+        interpolator = interpolation_weights(self.mu_vecs_train, self.mu_vecs_test)
+        DELTA_TA = self.shift_basis.interpolate(shift_TA_train, self.mu_vecs_train, self.mu_vecs_test,
+                                                self.Nsamples_train, interpolator)
+
+        DELTA_PRED_FRAME_WISE = [np.zeros_like(shifts_test[0]), np.zeros_like(shifts_test[1])]
         DELTA_PRED_FRAME_WISE[0][0] = self.shift_U_train @ DELTA_TA
         DELTA_PRED_FRAME_WISE[0][1] = 0
         DELTA_PRED_FRAME_WISE[1][0] = 0
         DELTA_PRED_FRAME_WISE[1][1] = 0
 
-        tic_trafo_1 = time.process_time()
-        trafo_interpolated_1 = transforms(data_shape, L, shifts=DELTA_PRED_FRAME_WISE[0],
-                                          dx=d_del,
-                                          use_scipy_transform=False)
-        trafo_interpolated_2 = transforms(data_shape, L, shifts=DELTA_PRED_FRAME_WISE[1],
-                                          trafo_type="identity", dx=d_del,
-                                          use_scipy_transform=False)
-        toc_trafo_1 = time.process_time()
-        trafos_interpolated = [trafo_interpolated_1, trafo_interpolated_2]
-        QTILDE_FRAME_WISE, TA_INTERPOLATED = my_interpolated_state(spod_modes, U_list,
-                                                                   TA_list_interp, self.mu_vecs_train,
-                                                                   self.Nx, self.Ny, Nt, self.mu_vecs_test,
-                                                                   trafos_interpolated)
+        trafos_interpolated, trafo_time_I = frame_transforms(data_shape, L, DELTA_PRED_FRAME_WISE, self.trafo_kwargs())
+        Q_I_FRAMES, TA_INTERPOLATED = my_interpolated_state(spod_modes, U_list,
+                                                            TA_list_interp, self.mu_vecs_train,
+                                                            self.Nx, self.Ny, Nt, self.mu_vecs_test,
+                                                            trafos_interpolated, frame_wise=True,
+                                                            interpolator=interpolator)
+        QTILDE_FRAME_WISE = Q_I_FRAMES[0] + Q_I_FRAMES[1]
         toc_I = time.process_time()
 
         # Shifts error
-        num1 = np.linalg.norm(self.shifts_test[0][0] - self.shift_U_train @ shift_TA_pred)
-        den1 = np.linalg.norm(self.shifts_test[0][0])
-        num1_i = np.linalg.norm(self.shifts_test[0][0] - DELTA_PRED_FRAME_WISE[0][0])
-        den1_i = np.linalg.norm(self.shifts_test[0][0])
+        num1 = np.linalg.norm(shifts_test[0][0] - self.shift_U_train @ shift_TA_pred)
+        den1 = np.linalg.norm(shifts_test[0][0])
+        num1_i = np.linalg.norm(shifts_test[0][0] - DELTA_PRED_FRAME_WISE[0][0])
+        den1_i = np.linalg.norm(shifts_test[0][0])
         print('Check 1...')
         print("Relative error indicator for shift for frame 1 (sPOD-NN): {}".format(num1 / den1))
         print("Relative error indicator for shift for frame 1 (sPOD-I): {}".format(num1_i / den1_i))
@@ -346,42 +444,33 @@ class wildfire2DNonLinear_sup:
         print("Relative time amplitude error indicator (polar) (POD-NN): {}".format(num3 / den3))
 
         tic_sPOD = time.process_time()
-        q1_pred = U_list[0] @ time_amplitudes_1_pred
-        q2_pred = U_list[1] @ time_amplitudes_2_pred
-        NumFrames = 2
-        data_shape = [self.Nx, self.Ny, 1, Nt]
-        Q_pred = [np.reshape(q1_pred, newshape=data_shape), np.reshape(q2_pred, newshape=data_shape)]
-        Q_recon_sPOD_polar = np.zeros_like(q_test_polar)
-
-        shifts = [np.zeros_like(self.shifts_test[0]), np.zeros_like(self.shifts_test[1])]
+        shifts = [np.zeros_like(shifts_test[0]), np.zeros_like(shifts_test[1])]
         shifts[0][0] = self.shift_U_train @ shift_TA_pred
-        shifts[0][1] = 0
-        shifts[1][0] = 0
-        shifts[1][1] = 0
-
-        tic_trafo_2 = time.process_time()
-        trafos_1 = transforms(data_shape, L, shifts=shifts[0], dx=d_del, use_scipy_transform=False)
-        trafos_2 = transforms(data_shape, L, shifts=shifts[1], trafo_type="identity", dx=d_del, use_scipy_transform=False)
-        toc_trafo_2 = time.process_time()
-        trafos = [trafos_1, trafos_2]
-        for frame in range(NumFrames):
-            Q_recon_sPOD_polar += trafos[frame].apply(Q_pred[frame])
+        trafos, trafo_time_sPOD = frame_transforms(data_shape, L, shifts, self.trafo_kwargs())
+        Q_frames_sPOD = reconstruct_frames(U_list, [time_amplitudes_1_pred, time_amplitudes_2_pred], trafos, data_shape,
+                                           self.dtype)
+        Q_recon_sPOD_polar = Q_frames_sPOD[0] + Q_frames_sPOD[1]
         toc_sPOD = time.process_time()
 
-        res = np.squeeze(np.reshape(q_test_polar - Q_recon_sPOD_polar, newshape=[-1, 1, self.Nt], order="F"))
-        err_full_sPOD = np.linalg.norm(res) / np.linalg.norm(np.squeeze(np.reshape(q_test_polar, newshape=[-1, 1, self.Nt], order="F")))
+        res = np.squeeze(np.reshape(q_test_polar - Q_recon_sPOD_polar, newshape=[-1, 1, Nt], order="F"))
+        err_full_sPOD = np.linalg.norm(res) / np.linalg.norm(np.squeeze(np.reshape(q_test_polar, newshape=[-1, 1, Nt], order="F")))
 
-        res = np.squeeze(np.reshape(q_test_polar - QTILDE_FRAME_WISE, newshape=[-1, 1, self.Nt], order="F"))
-        err_full_interp = np.linalg.norm(res) / np.linalg.norm(np.squeeze(np.reshape(q_test_polar, newshape=[-1, 1, self.Nt], order="F")))
+        res = np.squeeze(np.reshape(q_test_polar - QTILDE_FRAME_WISE, newshape=[-1, 1, Nt], order="F"))
+        err_full_interp = np.linalg.norm(res) / np.linalg.norm(np.squeeze(np.reshape(q_test_polar, newshape=[-1, 1, Nt], order="F")))
 
         print('Check 3...')
         print("Relative reconstruction error indicator for full snapshot (polar) (sPOD-NN): {}".format(err_full_sPOD))
         print(
             "Relative reconstruction error indicator for full snapshot (polar) (sPOD-I): {}".format(err_full_interp))
 
-        # Convert the polar data into cartesian data
+        # Convert the polar data into cartesian data. Only the shifted frame is mapped back from the polar grid, the
+        # identity frame is reconstructed directly from its modes premapped to the cartesian grid (P @ U, computed on
+        # the first call for this basis and counted in the conversion time)
+        geometry = self.geometry
         tic_sPOD_cart = time.process_time()
-        Q_recon_sPOD_cart = polar_to_cartesian(Q_recon_sPOD_polar, self.t, aux=aux)
+        U_cart_2 = geometry.cartesian_basis(U_list[1])
+        Q_recon_sPOD_cart = polar_to_cartesian(Q_frames_sPOD[0], self.t, aux=geometry) + \
+            np.reshape(U_cart_2 @ time_amplitudes_2_pred, data_shape)
         toc_sPOD_cart = time.process_time()
 
         tic_POD = time.process_time()
@@ -390,15 +479,16 @@ class wildfire2DNonLinear_sup:
         toc_POD = time.process_time()
 
         tic_I_cart = time.process_time()
-        Q_recon_interp_cart = polar_to_cartesian(QTILDE_FRAME_WISE, self.t, aux=aux)
+        Q_recon_interp_cart = polar_to_cartesian(Q_I_FRAMES[0], self.t, aux=geometry) + \
+            np.reshape(U_cart_2 @ TA_INTERPOLATED[1], data_shape)
         toc_I_cart = time.process_time()
 
-        res = np.squeeze(np.reshape(Q - Q_recon_sPOD_cart, newshape=[-1, 1, self.Nt], order="F"))
-        err_full_sPOD = np.linalg.norm(res) / np.linalg.norm(self.q_test)
-        res = np.squeeze(np.reshape(Q - Q_recon_POD_cart, newshape=[-1, 1, self.Nt], order="F"))
-        err_full_POD = np.linalg.norm(res) / np.linalg.norm(self.q_test)
-        res = np.squeeze(np.reshape(Q - Q_recon_interp_cart, newshape=[-1, 1, self.Nt], order="F"))
-        err_full_interp = np.linalg.norm(res) / np.linalg.norm(self.q_test)
+        res = np.squeeze(np.reshape(Q - Q_recon_sPOD_cart, newshape=[-1, 1, Nt], order="F"))
+        err_full_sPOD = np.linalg.norm(res) / np.linalg.norm(Q)
+        res = np.squeeze(np.reshape(Q - Q_recon_POD_cart, newshape=[-1, 1, Nt], order="F"))
+        err_full_POD = np.linalg.norm(res) / np.linalg.norm(Q)
+        res = np.squeeze(np.reshape(Q - Q_recon_interp_cart, newshape=[-1, 1, Nt], order="F"))
+        err_full_interp = np.linalg.norm(res) / np.linalg.norm(Q)
         print('Check 4...')
         print("Relative reconstruction error indicator for full snapshot (cartesian) (sPOD-NN): {}".format(
             err_full_sPOD))
@@ -406,37 +496,32 @@ class wildfire2DNonLinear_sup:
             err_full_interp))
         print("Relative reconstruction error indicator for full snapshot (cartesian) (POD-NN): {}".format(err_full_POD))
 
-        Q_diff_sPOD = np.concatenate([Q[:, :, 0, n].flatten('F') - Q_recon_sPOD_cart[:, :, 0, n].flatten('F')
-                                      for n in range(Nt)]).reshape(self.Nx * self.Ny, Nt, order='F')
-        Q_diff_POD = np.concatenate([Q[:, :, 0, n].flatten('F') - Q_recon_POD_cart[:, :, 0, n].flatten('F')
-                                     for n in range(Nt)]).reshape(self.Nx * self.Ny, Nt, order='F')
-        Q_diff_interp = np.concatenate([Q[:, :, 0, n].flatten('F') - Q_recon_interp_cart[:, :, 0, n].flatten('F')
-                                        for n in range(Nt)]).reshape(self.Nx * self.Ny, Nt, order='F')
-        Q_act = np.concatenate([Q[:, :, 0, n].flatten('F')
-                                for n in range(Nt)]).reshape(self.Nx * self.Ny, Nt, order='F')
-        num1 = np.sqrt(np.einsum('ij,ij->j', Q_diff_sPOD, Q_diff_sPOD))
-        den1 = np.sqrt(np.sum(np.einsum('ij,ij->j', Q_act, Q_act)) / self.Nt)
-        num2 = np.sqrt(np.einsum('ij,ij->j', Q_diff_POD, Q_diff_POD))
-        num3 = np.sqrt(np.einsum('ij,ij->j', Q_diff_interp, Q_diff_interp))
-
-        rel_err_sPOD_cart = num1 / den1
-        rel_err_POD_cart = num2 / den1
-        rel_err_interp_cart = num3 / den1
-
-        errors = [rel_err_sPOD_cart, rel_err_POD_cart, rel_err_interp_cart]
-
-        print('Timing...')
-        print(
-            f"Time consumption in assembling the transformation operators (sPOD-NN) : {toc_trafo_2 - tic_trafo_2:0.4f} seconds")
-        print(
-            f"Time consumption in assembling the transformation operators (sPOD-I) : {toc_trafo_1 - tic_trafo_1:0.4f} seconds")
-        print(
-            f"Time consumption in assembling the final solution (sPOD-NN) : {((toc_sPOD - tic_sPOD) - (toc_trafo_2 - tic_trafo_2)):0.4f} seconds")
-        print(
-            f"Time consumption in assembling the final solution (sPOD-I)  : {((toc_I - tic_I) - (toc_trafo_1 - tic_trafo_1)):0.4f} seconds")
-        print(f"Time consumption in assembling the final solution (POD-NN)  : {(toc_POD - tic_POD):0.4f} seconds")
-        print(
-            f"Time consumption in converting from cart-polar-cart  : {(2 * (toc_sPOD_cart - tic_sPOD_cart)):0.4f} seconds")
+        if t_exact is None:
+            Q_diff_sPOD = np.concatenate([Q[:, :, 0, n].flatten('F') - Q_recon_sPOD_cart[:, :, 0, n].flatten('F')
+                                          for n in range(Nt)]).reshape(self.Nx * self.Ny, Nt, order='F')
+            Q_diff_POD = np.concatenate([Q[:, :, 0, n].flatten('F') - Q_recon_POD_cart[:, :, 0, n].flatten('F')
+                                         for n in range(Nt)]).reshape(self.Nx * self.Ny, Nt, order='F')
+            Q_diff_interp = np.concatenate([Q[:, :, 0, n].flatten('F') - Q_recon_interp_cart[:, :, 0, n].flatten('F')
+                                            for n in range(Nt)]).reshape(self.Nx * self.Ny, Nt, order='F')
+            Q_act = np.concatenate([Q[:, :, 0, n].flatten('F')
+                                    for n in range(Nt)]).reshape(self.Nx * self.Ny, Nt, order='F')
+            num1 = np.sqrt(np.einsum('ij,ij->j', Q_diff_sPOD, Q_diff_sPOD))
+            den1 = np.sqrt(np.sum(np.einsum('ij,ij->j', Q_act, Q_act)) / self.Nt)
+            num2 = np.sqrt(np.einsum('ij,ij->j', Q_diff_POD, Q_diff_POD))
+            num3 = np.sqrt(np.einsum('ij,ij->j', Q_diff_interp, Q_diff_interp))
+
+            rel_err_sPOD_cart = num1 / den1
+            rel_err_POD_cart = num2 / den1
+            rel_err_interp_cart = num3 / den1
+
+            errors = [rel_err_sPOD_cart, rel_err_POD_cart, rel_err_interp_cart]
+        else:
+            errors = [np.zeros(self.Nt), np.zeros(self.Nt), np.zeros(self.Nt)]
+
+        report_online_timing(trafo_time_sPOD, trafo_time_I, toc_sPOD - tic_sPOD - trafo_time_sPOD,
+                             toc_I - tic_I - trafo_time_I, toc_POD - tic_POD,
+                             conversion=(toc_sPOD_cart - tic_sPOD_cart) + (toc_I_cart - tic_I_cart),
+                             verbose=verbose)
 
         return Q_recon_sPOD_cart, Q_recon_POD_cart, Q_recon_interp_cart, errors
 
@@ -508,6 +593,7 @@ class wildfire2DNonLinear_sup:
         subfig_b.supylabel(r"$T$")
         subfig_b.supxlabel(r"space $x$")
 
+        os.makedirs(impath, exist_ok=True)
         fig.savefig(impath + str(var_name) + "-mixed", dpi=300, transparent=True)
         plt.close(fig)
 
@@ -576,17 +662,6 @@ def plot_pred_comb(time_amplitudes_1_pred, time_amplitudes_1_test, time_amplitud
 
     subfig_t.supxlabel(r"time $t$")
 
+    os.makedirs(impath, exist_ok=True)
     save_fig(filepath=impath + "all_comb_pred", figure=fig)
     fig.savefig(impath + "all_comb_pred" + ".eps", format='eps', dpi=600, transparent=True)
-
-
-
-def truncate_shifts(delta, rank=4):
-
-    # Shifts considered here are for the frame 1 and r coordinate. Rest all the shifts are zero by problem design
-    shifts = np.squeeze(delta[0][0, ...])
-    U, S, VT = np.linalg.svd(shifts, full_matrices=False)
-
-    TA = np.diag(S[:rank]).dot(VT[:rank, :])
-
-    return U[:, :rank], TA
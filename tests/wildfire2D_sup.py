@@ -1,9 +1,8 @@
 import time
 from Helper import *
-from mpl_toolkits.axes_grid1.inset_locator import inset_axes
+from snapshot_io import SnapshotDataset, extract_variable, time_steps
 
 impath = "../plots/images_wildfire2D/"
-os.makedirs(impath, exist_ok=True)
 
 data_path = os.path.abspath(".") + '/wildfire_data/2D/'
 
@@ -14,24 +13,21 @@ cmap = 'YlOrRd'
 
 
 class wildfire2D_sup:
-    def __init__(self, q_test, shifts_test, param_test_val, var):
-        dat1_train = np.load(data_path + 'SnapShotMatrix540.npy')
-        dat2_train = np.load(data_path + 'SnapShotMatrix550.npy')
-        dat3_train = np.load(data_path + 'SnapShotMatrix560.npy')
-        dat4_train = np.load(data_path + 'SnapShotMatrix570.npy')
-        dat5_train = np.load(data_path + 'SnapShotMatrix580.npy')
-        self.grid_1D = np.load(data_path + '1D_Grid.npy', allow_pickle=True)
-        self.grid_2D = np.load(data_path + '2D_Grid.npy', allow_pickle=True)
+    def __init__(self, q_test, shifts_test, param_test_val, var, mu_vecs_train=(540, 550, 560, 570, 580),
+                 mmap_mode='r', dtype=np.float64, io_workers=4, test_sample=None):
+        self.dataset = SnapshotDataset(data_path)
+        # Working precision of snapshots, polar data, modes and reconstructions (shifts are kept in float64)
+        self.dtype = np.dtype(dtype)
+        self.mu_vecs_train = np.asarray(mu_vecs_train)
+
+        # Grids, time, shifts and the snapshots of the training parameters are read concurrently
+        (self.grid_1D, self.grid_2D, self.t), deltas_train, q_train = self.dataset.load_training(
+            self.mu_vecs_train, var, files=('1D_Grid.npy', '2D_Grid.npy', 'Time.npy'), io_workers=io_workers,
+            mmap_mode=mmap_mode, order="F", dtype=self.dtype)
         self.x = self.grid_1D[0]
         self.y = self.grid_1D[1]
         self.X = self.grid_2D[0]
         self.Y = self.grid_2D[1]
-        self.t = np.load(data_path + 'Time.npy')
-        delta1_train = np.load(data_path + 'Shifts540.npy')
-        delta2_train = np.load(data_path + 'Shifts550.npy')
-        delta3_train = np.load(data_path + 'Shifts560.npy')
-        delta4_train = np.load(data_path + 'Shifts570.npy')
-        delta5_train = np.load(data_path + 'Shifts580.npy')
 
         self.var = var
         self.Nx = np.size(self.x)
@@ -39,57 +35,50 @@ class wildfire2D_sup:
         self.Nt = np.size(self.t)
         self.x_c = self.x[-1] // 2
         self.y_c = self.y[-1] // 2
+        self.geometry = PolarGeometry(self.x, self.y)
 
         # Test data
         self.param_test_val = param_test_val
         self.mu_vecs_test = np.asarray([self.param_test_val])
-        self.q_test = np.reshape(np.transpose(q_test), newshape=[self.Nt, 2, self.Nx, self.Ny], order="F")
-        self.q_test = np.transpose(np.reshape(np.squeeze(self.q_test[:, var, :, :]), newshape=[self.Nt, -1], order="F"))
+        # The test parameter is read from the case directory unless given. With `test_sample` (query mode) only that
+        # time step is kept and read from disk, from the time-chunked store if one was written by convert_to_chunked
+        self.test_sample = test_sample
+        if q_test is None:
+            self.q_test = self.dataset.load_snapshots(param_test_val, var, mmap_mode=mmap_mode, order="F",
+                                                      t=test_sample, dtype=self.dtype)
+        else:
+            self.q_test = np.asfortranarray(time_steps(extract_variable(q_test, var), test_sample), dtype=self.dtype)
+        if shifts_test is None:
+            shifts_test = self.dataset.load_shifts(param_test_val, t=test_sample)
+        else:
+            shifts_test = time_steps(np.asarray(shifts_test), test_sample)
         self.shifts_test = shifts_test
         self.q_polar_test = None
 
         # Train data
-        self.Nsamples_train = 5
+        self.Nsamples_train = np.size(self.mu_vecs_train)
         self.NumFrames = 2
-        self.mu_vecs_train = np.asarray([540, 550, 560, 570, 580])
         self.params_train = [np.squeeze(np.asarray([[np.ones_like(self.t) * mu], [self.t]])) for mu in
                              self.mu_vecs_train]
         self.params_train = np.concatenate(self.params_train, axis=1)
         self.shifts_train = np.zeros((self.NumFrames, 2, self.Nsamples_train * self.Nt), dtype=float)
-        self.shifts_train[0] = np.concatenate((delta1_train[0], delta2_train[0], delta3_train[0],
-                                               delta4_train[0], delta5_train[0]), axis=1)
-        self.shifts_train[1] = np.concatenate((delta1_train[1], delta2_train[1], delta3_train[1],
-                                               delta4_train[1], delta5_train[1]), axis=1)
-        dat1_train = np.reshape(np.transpose(dat1_train), newshape=[self.Nt, 2, self.Nx, self.Ny], order="F")
-        dat1_train = np.transpose(np.reshape(np.squeeze(dat1_train[:, var, :, :]), newshape=[self.Nt, -1], order="F"))
-        dat2_train = np.reshape(np.transpose(dat2_train), newshape=[self.Nt, 2, self.Nx, self.Ny], order="F")
-        dat2_train = np.transpose(np.reshape(np.squeeze(dat2_train[:, var, :, :]), newshape=[self.Nt, -1], order="F"))
-        dat3_train = np.reshape(np.transpose(dat3_train), newshape=[self.Nt, 2, self.Nx, self.Ny], order="F")
-        dat3_train = np.transpose(np.reshape(np.squeeze(dat3_train[:, var, :, :]), newshape=[self.Nt, -1], order="F"))
-        dat4_train = np.reshape(np.transpose(dat4_train), newshape=[self.Nt, 2, self.Nx, self.Ny], order="F")
-        dat4_train = np.transpose(np.reshape(np.squeeze(dat4_train[:, var, :, :]), newshape=[self.Nt, -1], order="F"))
-        dat5_train = np.reshape(np.transpose(dat5_train), newshape=[self.Nt, 2, self.Nx, self.Ny], order="F")
-        dat5_train = np.transpose(np.reshape(np.squeeze(dat5_train[:, var, :, :]), newshape=[self.Nt, -1], order="F"))
-        self.q_train = [dat1_train, dat2_train, dat3_train, dat4_train, dat5_train]
+        self.shifts_train[0] = np.concatenate([delta[0] for delta in deltas_train], axis=1)
+        self.shifts_train[1] = np.concatenate([delta[1] for delta in deltas_train], axis=1)
+        self.q_train = q_train
         self.q_polar_train = None
 
     def run_sPOD(self, spod_iter):
         # Reshape the variable array to suit the dimension of the input for the sPOD
         self.q_train = [np.reshape(q, newshape=[self.Nx, self.Ny, 1, self.Nt], order="F") for q in self.q_train]
 
-        # Map the field variable from cartesian to polar coordinate system
-        q_polar = []
-        s0, theta_i, r_i, _ = cartesian_to_polar(self.q_train[0], self.x, self.y, self.t)
-        q_polar.append(s0)
-        for samples in range(self.Nsamples_train - 1):
-            s, _, _, _ = cartesian_to_polar(self.q_train[samples + 1], self.x, self.y, self.t)
-            q_polar.append(s)
+        # Map the field variable from cartesian to polar coordinate system. The training matrix is allocated once at
+        # its final size and every sample is converted directly into its own columns
+        qmat = np.empty((self.Nx * self.Ny, self.Nsamples_train * self.Nt), dtype=self.dtype)
+        samples_to_polar(self.q_train, self.geometry, qmat)
 
         data_shape = [self.Nx, self.Ny, 1, self.Nsamples_train * self.Nt]
-        dr = r_i[1] - r_i[0]
-        dtheta = theta_i[1] - theta_i[0]
-        d_del = np.asarray([dr, dtheta])
-        L = np.asarray([r_i[-1], theta_i[-1]])
+        d_del = self.geometry.d_del
+        L = self.geometry.L
 
         # Create the transformations
         trafo_train_1 = transforms(data_shape, L, shifts=self.shifts_train[0],
@@ -101,7 +90,6 @@ class wildfire2D_sup:
 
         # Apply srPCA on the data
         transform_list = [trafo_train_1, trafo_train_2]
-        qmat = np.concatenate([np.reshape(q, newshape=[-1, self.Nt]) for q in q_polar], axis=1)
         mu = np.prod(np.size(qmat, 0)) / (4 * np.sum(np.abs(qmat))) * 0.7
         lambd = 1 / np.sqrt(np.max([self.Nx, self.Ny]))
         ret = shifted_rPCA(qmat, transform_list, nmodes_max=12, eps=1e-4, Niter=spod_iter, use_rSVD=True, mu=mu,
@@ -112,42 +100,51 @@ class wildfire2D_sup:
         # Calculate the time amplitudes for training data
         U_list = []
         spod_modes = []
-        frame_amplitude_list_interpolation = []
         frame_amplitude_list_training = []
         cnt = 0
         for frame in sPOD_frames_train:
             VT = frame.modal_system["VT"]
             S = frame.modal_system["sigma"]
-            VT = np.diag(S) @ VT
+            VT = np.asarray(np.diag(S) @ VT, dtype=self.dtype)
             Nmodes = frame.Nmodes
-            amplitudes = [np.reshape(VT[n, :], [self.Nsamples_train, self.Nt]).T for n in range(Nmodes)]
-            frame_amplitude_list_interpolation.append(amplitudes)
             frame_amplitude_list_training.append(VT)
-            U_list.append(frame.modal_system["U"])
+            U_list.append(np.asarray(frame.modal_system["U"], dtype=self.dtype))
             spod_modes.append(Nmodes)
             cnt = cnt + 1
 
+        frame_amplitude_list_interpolation = AmplitudeTable.from_training(
+            [VT[:Nmodes] for VT, Nmodes in zip(frame_amplitude_list_training, spod_modes)], self.Nsamples_train,
+            self.Nt)
+
         return U_list, frame_amplitude_list_training, frame_amplitude_list_interpolation, spod_modes
 
-    def test_data(self, spod_iter):
+    def test_data(self, spod_iter, check="full", check_budget=16, check_seed=None):
+        if self.test_sample is not None:
+            raise ValueError("test_data needs the full test trajectory, only time step {} was loaded".format(
+                self.test_sample))
         ##########################################
         # Reshape the variable array to suit the dimension of the input for the sPOD
         q = np.reshape(self.q_test, newshape=[self.Nx, self.Ny, 1, self.Nt], order="F")
 
         # Map the field variable from cartesian to polar coordinate system
-        q_polar, theta_i, r_i, aux = cartesian_to_polar(q, self.x, self.y, self.t)
-
-        # Check the transformation back and forth error between polar and cartesian coordinates (Checkpoint)
-        q_cartesian = polar_to_cartesian(q_polar, self.t, aux=aux)
-        res = q - q_cartesian
-        err = np.linalg.norm(np.reshape(res, -1)) / np.linalg.norm(np.reshape(q, -1))
-        print("Transformation back and forth error (cartesian - polar - cartesian) =  %4.4e " % err)
+        q_polar, _, _, geometry = cartesian_to_polar(q, self.x, self.y, self.t, dtype=self.dtype,
+                                                     geometry=self.geometry)
+
+        # Diagnostics (back and forth error of the polar mapping, interpolation error of the transformation), computed
+        # on all time steps (check="full"), on `check_budget` strided or random time steps or skipped (check=None)
+        steps = check_steps(self.Nt, check_budget, check, check_seed) if check is not None else []
+        if len(steps) > 0:
+            # Check the transformation back and forth error between polar and cartesian coordinates (Checkpoint)
+            q_steps = np.reshape(q[..., steps], [-1, len(steps)])
+            q_cartesian = np.reshape(polar_to_cartesian(q_polar[..., steps], self.t[steps], aux=geometry),
+                                     [-1, len(steps)])
+            report_check("Transformation back and forth error (cartesian - polar - cartesian)",
+                         np.sum((q_steps - q_cartesian) ** 2, axis=0), np.sum(q_steps ** 2, axis=0), self.Nt,
+                         seed=check_seed)
 
         data_shape = [self.Nx, self.Ny, 1, self.Nt]
-        dr = r_i[1] - r_i[0]
-        dtheta = theta_i[1] - theta_i[0]
-        d_del = np.asarray([dr, dtheta])
-        L = np.asarray([r_i[-1], theta_i[-1]])
+        d_del = self.geometry.d_del
+        L = self.geometry.L
 
         trafo_test_1 = transforms(data_shape, L, shifts=self.shifts_test[0],
                                   dx=d_del,
@@ -157,8 +154,18 @@ class wildfire2D_sup:
                                   use_scipy_transform=True)
 
         # Check the transformation interpolation error
-        err = give_interpolation_error(q_polar, trafo_test_1)
-        print("Transformation interpolation error =  %4.4e " % err)
+        if len(steps) == self.Nt:
+            err = give_interpolation_error(q_polar, trafo_test_1)
+            print("Transformation interpolation error =  %4.4e " % err)
+        elif len(steps) > 0:
+            # Sampled: the error of every checked time step with a transformation of that step only
+            num, den = [], []
+            for k in steps:
+                trafo_k = transforms([self.Nx, self.Ny, 1, 1], L, shifts=self.shifts_test[0][..., k:k + 1], dx=d_del,
+                                     use_scipy_transform=True)
+                den.append(np.sum(np.asarray(q_polar[..., k], dtype=np.float64) ** 2))
+                num.append(give_interpolation_error(q_polar[..., k:k + 1], trafo_k) ** 2 * den[-1])
+            report_check("Transformation interpolation error", num, den, self.Nt, seed=check_seed)
 
         ##########################################
         # Apply sPOD on the data
@@ -173,18 +180,21 @@ class wildfire2D_sup:
 
         # Deduce the frames
         modes_list = [sPOD_frames_test[0].Nmodes, sPOD_frames_test[1].Nmodes]
-        q_frame_1 = sPOD_frames_test[0].build_field()
-        q_frame_2 = sPOD_frames_test[1].build_field()
+        q_frame_1 = np.asarray(sPOD_frames_test[0].build_field(), dtype=self.dtype)
+        q_frame_2 = np.asarray(sPOD_frames_test[1].build_field(), dtype=self.dtype)
+        qtilde_test = np.asarray(qtilde_test, dtype=self.dtype)
         qtilde = np.reshape(qtilde_test, newshape=data_shape)
 
         # Transform the frame wise snapshots into lab frame (moving frame)
-        q_frame_1_lab = transform_list[0].apply(np.reshape(q_frame_1, newshape=data_shape))
-        q_frame_2_lab = transform_list[1].apply(np.reshape(q_frame_2, newshape=data_shape))
+        q_frame_1_lab = np.asarray(transform_list[0].apply(np.reshape(q_frame_1, newshape=data_shape)),
+                                   dtype=self.dtype)
+        q_frame_2_lab = np.asarray(transform_list[1].apply(np.reshape(q_frame_2, newshape=data_shape)),
+                                   dtype=self.dtype)
 
         # Shift the pre-transformed polar data to cartesian grid to visualize
-        q_frame_1_cart_lab = polar_to_cartesian(q_frame_1_lab, self.t, aux=aux)
-        q_frame_2_cart_lab = polar_to_cartesian(q_frame_2_lab, self.t, aux=aux)
-        qtilde_cart = polar_to_cartesian(qtilde, self.t, aux=aux)
+        q_frame_1_cart_lab = polar_to_cartesian(q_frame_1_lab, self.t, aux=geometry)
+        q_frame_2_cart_lab = polar_to_cartesian(q_frame_2_lab, self.t, aux=geometry)
+        qtilde_cart = polar_to_cartesian(qtilde, self.t, aux=geometry)
 
         # Relative reconstruction error for sPOD
         res = q - qtilde_cart
@@ -194,7 +204,7 @@ class wildfire2D_sup:
         Q_frames_test_polar = [q_frame_1, q_frame_2, qtilde_test]
         Q_frames_test_cart = [q_frame_1_cart_lab, q_frame_2_cart_lab, qtilde_cart]
 
-        return Q_frames_test_polar, Q_frames_test_cart, aux
+        return Q_frames_test_polar, Q_frames_test_cart, geometry
 
     def plot_sPOD_frames(self, Q_frames_test_cart, plot_every=10, var_name="T"):
         q = np.reshape(self.q_test, newshape=[self.Nx, self.Ny, 1, self.Nt], order="F")
@@ -241,87 +251,132 @@ class wildfire2D_sup:
                 fig.savefig(immpath + str(var_name) + "-" + str(n), dpi=200, transparent=True)
                 plt.close(fig)
 
+    def test_snapshot(self, t):
+        """Test snapshot [M, 1] and test shifts [..., 1] of time step `t` (query mode)"""
+        if self.test_sample is None:
+            return self.q_test[:, t:t + 1], np.asarray(self.shifts_test)[..., t:t + 1]
+        if t != self.test_sample:
+            raise ValueError("Only time step {} of the test parameter was loaded".format(self.test_sample))
+        return self.q_test, np.asarray(self.shifts_test)
+
+    def trafo_kwargs(self):
+        """Arguments of the frame transformations on the polar grid, frame 2 is not shifted"""
+        kwargs = {'dx': self.geometry.d_del, 'use_scipy_transform': True, 'interp_order': 5}
+        return [kwargs, dict(kwargs, trafo_type="identity")]
+
+    def reconstruct_sPOD_batch(self, frame_amplitudes_predicted_sPOD, shifts_predicted, spod_modes, U_list,
+                               batch_size=None, max_bytes=None):
+        """Cartesian sPOD-NN reconstructions of several test parameters, given the lists of their predicted time
+        amplitudes and shifts (as passed to `plot_online_data`). The shifted frame of the parameters of a chunk
+        (`batch_size`, or bounded by `max_bytes`, see `reconstruct_batch`) is transformed and mapped back from the polar
+        grid at once, the identity frame is reconstructed from its premapped modes. Returns a generator of the
+        [Nx, Ny, 1, Nt] reconstructions."""
+        Nmf = spod_modes
+        Nt = np.size(frame_amplitudes_predicted_sPOD[0], 1)
+        TA = [np.asarray(a, dtype=self.dtype) for a in frame_amplitudes_predicted_sPOD]
+        U_cart_2 = self.geometry.cartesian_basis(U_list[1]).astype(self.dtype, copy=False)
+        U_list = [np.asarray(U, dtype=self.dtype) for U in U_list]
+        shifts = []
+        for s in shifts_predicted:
+            shift = np.zeros([2, Nt])
+            shift[0] = s[0, :]
+            shifts.append(shift)
+
+        data_shape = [self.Nx, self.Ny, 1, Nt]
+        TA_2 = [a[Nmf[0]:, :] for a in TA]
+
+        batches = reconstruct_batch(U_list[:1], [[a[:Nmf[0], :] for a in TA]], [shifts], data_shape, self.geometry.L,
+                                    self.trafo_kwargs()[:1], dtype=self.dtype, batch_size=batch_size,
+                                    max_bytes=max_bytes)
+        return unstack_batch(batches, cartesian_finish(self.geometry, self.t, U_cart_2, TA_2))
+
+    def sPOD_I_sweep(self, mu_vecs, TA_list_interp, spod_modes, U_list, reconstruct=False, method="linear",
+                     batch_size=None, max_bytes=None):
+        """sPOD-I predictions of K parameters `mu_vecs` at once (e.g. a dense parameter sweep). Amplitudes and shifts of
+        all parameters are interpolated in one pass, the reconstructions of a chunk of parameters share one
+        transformation of the shifted frame and one mapping back to the cartesian grid (see `sweep_reconstructions`).
+
+        Returns the amplitudes [K, frame_modes, Nt] of every frame, the shifts [K, 2, Nt] (x and y) of frame 1 and, with
+        `reconstruct=True`, a generator of the K cartesian reconstructions [Nx, Ny, 1, Nt].
+        """
+        mu_vecs = np.asarray(mu_vecs)
+        Nt = self.Nt
+        shift_series = [np.reshape(self.shifts_train[0][dim], [self.Nsamples_train, Nt]).T for dim in range(2)]
+        TA, shifts = interpolate_many(spod_modes, TA_list_interp, self.mu_vecs_train, mu_vecs, shift_series,
+                                      method=method)
+        if not reconstruct:
+            return TA, shifts
+
+        U_cart_2 = self.geometry.cartesian_basis(U_list[1])[:, :spod_modes[1]].astype(self.dtype, copy=False)
+        finish = cartesian_finish(self.geometry, self.t, U_cart_2, np.asarray(TA[1], dtype=self.dtype))
+        Q = sweep_reconstructions(U_list[:1], TA[:1], [list(shifts)], [self.Nx, self.Ny, 1, Nt], self.geometry.L,
+                                  self.trafo_kwargs()[:1], dtype=self.dtype, finish=finish, batch_size=batch_size,
+                                  max_bytes=max_bytes)
+        return TA, shifts, Q
+
     def plot_online_data(self, frame_amplitude_predicted_sPOD, frame_amplitude_predicted_POD,
                          TA_TEST, TA_POD_TEST, TA_list_interp, shifts_predicted, SHIFTS_TEST, spod_modes,
                          U_list, U_POD_TRAIN, q_test_polar, Q_frames_test_polar, aux, plot_online=False,
-                         test_type=None):
+                         test_type=None, verbose=False):
 
         Ndims = 2
         Nt = frame_amplitude_predicted_sPOD.shape[1]
-        Q = np.reshape(self.q_test, newshape=[self.Nx, self.Ny, 1, self.Nt], order="F")
-        q_test_polar = np.reshape(q_test_polar, newshape=[self.Nx, self.Ny, 1, self.Nt])
-        if test_type['typeOfTest'] == "query":
+        shifts_train = self.shifts_train
+        shifts_test = np.asarray(self.shifts_test)
+        t_exact = None
+        if test_type is not None and test_type['typeOfTest'] == "query":
             plot_online = False
             test_sample = test_type['test_sample']
-
-            tmp_Tr = []
-            tmp_Te = []
-            for frame in range(self.NumFrames):
-                tt_Tr = []
-                tt_Te = []
-                for dim in range(Ndims):
-                    ampl_Tr = np.asarray([self.shifts_train[frame][dim][i * self.Nt + test_sample]
-                                          for i in range(self.Nsamples_train)])
-                    ampl_Te = self.shifts_test[frame][dim][test_sample][np.newaxis]
-                    tt_Tr.append(ampl_Tr)
-                    tt_Te.append(ampl_Te)
-                tmp_Tr.append(tt_Tr)
-                tmp_Te.append(tt_Te)
-            self.shifts_train = tmp_Tr
-            self.shifts_test = tmp_Te
-            q_test_polar = q_test_polar[..., 0, test_sample][..., np.newaxis, np.newaxis]
-            Q = Q[..., 0, test_sample][..., np.newaxis, np.newaxis]
+            t_exact = test_sample
+
+            # Only the requested time step is taken from the training shifts (one strided view) and the test data,
+            # the rest of the evaluation then runs on a single column
+            shifts_train = shifts_train[..., test_sample::self.Nt]
+            q_test, shifts_test = self.test_snapshot(test_sample)
+            q_test_polar = np.reshape(np.reshape(q_test_polar, [-1, self.Nt])[:, test_sample], [self.Nx, self.Ny, 1, 1])
+            Q = np.reshape(q_test, [self.Nx, self.Ny, 1, 1], order="F")
+        else:
+            Q = np.reshape(self.q_test, newshape=[self.Nx, self.Ny, 1, self.Nt], order="F")
+            q_test_polar = np.reshape(q_test_polar, newshape=[self.Nx, self.Ny, 1, self.Nt])
 
         print("#############################################")
         print('Online Error checks')
         # %% Online error with respect to testing wildfire_data
         Nmf = spod_modes
+        frame_amplitude_predicted_sPOD = np.asarray(frame_amplitude_predicted_sPOD, dtype=self.dtype)
+        frame_amplitude_predicted_POD = np.asarray(frame_amplitude_predicted_POD, dtype=self.dtype)
+        U_list = [np.asarray(U, dtype=self.dtype) for U in U_list]
+        U_POD_TRAIN = np.asarray(U_POD_TRAIN, dtype=self.dtype)
         time_amplitudes_1_pred = frame_amplitude_predicted_sPOD[:Nmf[0], :]
         time_amplitudes_2_pred = frame_amplitude_predicted_sPOD[Nmf[0]:, :]
         shifts_1_pred = shifts_predicted[0, :]
 
-        X_new = self.X - self.x_c  # Shift the origin to the center of the image
-        Y_new = self.Y - self.y_c
-        r = np.sqrt(X_new ** 2 + Y_new ** 2).flatten()  # polar coordinate r
-        theta = np.arctan2(Y_new, X_new).flatten()  # polar coordinate theta
-        r_i = np.linspace(np.min(r), np.max(r), self.Nx)
-        theta_i = np.linspace(np.min(theta), np.max(theta), self.Ny)
-        dr = r_i[1] - r_i[0]
-        dtheta = theta_i[1] - theta_i[0]
-        d_del = np.asarray([dr, dtheta])
-        L = np.asarray([r_i[-1], theta_i[-1]])
+        L = self.geometry.L
         data_shape = [self.Nx, self.Ny, 1, Nt]
 
         # Implement the interpolation to find the online prediction
         tic_I = time.process_time()
+        interpolator = interpolation_weights(self.mu_vecs_train, self.mu_vecs_test)
         shifts_list_interpolated = []
         for frame in range(self.NumFrames):
             for dim in range(Ndims):
                 shifts_list_interpolated.append(
-                    np.reshape(self.shifts_train[frame][dim], [self.Nsamples_train, Nt]).T)
+                    np.reshape(shifts_train[frame][dim], [self.Nsamples_train, Nt]).T)
 
-        DELTA = my_delta_interpolate(shifts_list_interpolated, self.mu_vecs_train, self.mu_vecs_test)
-        DELTA_PRED_FRAME_WISE = np.zeros_like(self.shifts_test)
+        DELTA = my_delta_interpolate(shifts_list_interpolated, self.mu_vecs_train, self.mu_vecs_test, interpolator)
+        DELTA_PRED_FRAME_WISE = np.zeros_like(shifts_test)
         DELTA_PRED_FRAME_WISE[0][0] = DELTA[0]
         DELTA_PRED_FRAME_WISE[0][1] = DELTA[1]
         DELTA_PRED_FRAME_WISE[1][0] = DELTA[2]
         DELTA_PRED_FRAME_WISE[1][1] = DELTA[3]
 
-        tic_trafo_1 = time.process_time()
-        trafo_interpolated_1 = transforms(data_shape, L, shifts=DELTA_PRED_FRAME_WISE[0],
-                                          dx=d_del,
-                                          use_scipy_transform=True,
-                                          interp_order=5)
-        trafo_interpolated_2 = transforms(data_shape, L, shifts=DELTA_PRED_FRAME_WISE[1], trafo_type="identity",
-                                          dx=d_del,
-                                          use_scipy_transform=True,
-                                          interp_order=5)
-        toc_trafo_1 = time.process_time()
-        trafos_interpolated = [trafo_interpolated_1, trafo_interpolated_2]
-        QTILDE_FRAME_WISE, TA_INTERPOLATED = my_interpolated_state(spod_modes, U_list,
-                                                                   TA_list_interp, self.mu_vecs_train,
-                                                                   self.Nx, self.Ny, Nt, self.mu_vecs_test,
-                                                                   trafos_interpolated)
+        trafos_interpolated, trafo_time_I = frame_transforms(data_shape, L, DELTA_PRED_FRAME_WISE, self.trafo_kwargs())
+        Q_I_FRAMES, TA_INTERPOLATED = my_interpolated_state(spod_modes, U_list,
+                                                            TA_list_interp, self.mu_vecs_train,
+                                                            self.Nx, self.Ny, Nt, self.mu_vecs_test,
+                                                            trafos_interpolated, frame_wise=True,
+                                                            interpolator=interpolator)
+        QTILDE_FRAME_WISE = Q_I_FRAMES[0] + Q_I_FRAMES[1]
         toc_I = time.process_time()
 
         # Shifts error
@@ -354,32 +409,16 @@ class wildfire2D_sup:
         print("Relative time amplitude error indicator (polar) (POD-NN): {}".format(num3 / den3))
 
         tic_sPOD = time.process_time()
-        q1_pred = U_list[0] @ time_amplitudes_1_pred
-        q2_pred = U_list[1] @ time_amplitudes_2_pred
         use_original_shift = False
-        NumFrames = 2
-        data_shape = [self.Nx, self.Ny, 1, Nt]
-        Q_pred = [np.reshape(q1_pred, newshape=data_shape), np.reshape(q2_pred, newshape=data_shape)]
-        Q_recon_sPOD_polar = np.zeros_like(q_test_polar)
         if use_original_shift:
-            shifts = self.shifts_test
+            shifts = shifts_test
         else:
-            shifts = np.zeros_like(self.shifts_test)
+            shifts = np.zeros_like(shifts_test)
             shifts[0][0] = shifts_1_pred
-
-        tic_trafo_2 = time.process_time()
-        trafos_1 = transforms(data_shape, L, shifts=shifts[0],
-                              dx=d_del,
-                              use_scipy_transform=True,
-                              interp_order=5)
-        trafos_2 = transforms(data_shape, L, shifts=shifts[1],
-                              trafo_type="identity", dx=d_del,
-                              use_scipy_transform=True,
-                              interp_order=5)
-        toc_trafo_2 = time.process_time()
-        trafos = [trafos_1, trafos_2]
-        for frame in range(NumFrames):
-            Q_recon_sPOD_polar += trafos[frame].apply(Q_pred[frame])
+        trafos, trafo_time_sPOD = frame_transforms(data_shape, L, shifts, self.trafo_kwargs())
+        Q_frames_sPOD = reconstruct_frames(U_list, [time_amplitudes_1_pred, time_amplitudes_2_pred], trafos, data_shape,
+                                           self.dtype)
+        Q_recon_sPOD_polar = Q_frames_sPOD[0] + Q_frames_sPOD[1]
         toc_sPOD = time.process_time()
         res = q_test_polar - Q_recon_sPOD_polar
         err_full_sPOD = np.linalg.norm(np.reshape(res, -1)) / np.linalg.norm(np.reshape(q_test_polar, -1))
@@ -392,12 +431,14 @@ class wildfire2D_sup:
         print(
             "Relative reconstruction error indicator for full snapshot (polar) (sPOD-I): {}".format(err_full_interp))
 
-        # Convert the polar data into cartesian data
+        # Convert the polar data into cartesian data. Only the shifted frame is mapped back from the polar grid, the
+        # identity frame is reconstructed directly from its modes premapped to the cartesian grid (P @ U, computed on
+        # the first call for this basis and counted in the conversion time)
+        geometry = self.geometry
         tic_sPOD_cart = time.process_time()
-        Q_recon_sPOD_cart = polar_to_cartesian(Q_recon_sPOD_polar, self.t, aux=aux,
-                                               t_exact=test_type['test_sample']
-                                               if test_type['typeOfTest'] == "query" else None
-                                               )
+        U_cart_2 = geometry.cartesian_basis(U_list[1])
+        Q_recon_sPOD_cart = polar_to_cartesian(Q_frames_sPOD[0], self.t, aux=geometry) + \
+            np.reshape(U_cart_2 @ time_amplitudes_2_pred, data_shape)
         toc_sPOD_cart = time.process_time()
 
         tic_POD = time.process_time()
@@ -406,10 +447,8 @@ class wildfire2D_sup:
         toc_POD = time.process_time()
 
         tic_I_cart = time.process_time()
-        Q_recon_interp_cart = polar_to_cartesian(QTILDE_FRAME_WISE, self.t, aux=aux,
-                                                 t_exact=test_type['test_sample']
-                                                 if test_type['typeOfTest'] == "query" else None
-                                                 )
+        Q_recon_interp_cart = polar_to_cartesian(Q_I_FRAMES[0], self.t, aux=geometry) + \
+            np.reshape(U_cart_2 @ TA_INTERPOLATED[1], data_shape)
         toc_I_cart = time.process_time()
 
         res = Q - Q_recon_sPOD_cart
@@ -425,7 +464,7 @@ class wildfire2D_sup:
             err_full_interp))
         print("Relative reconstruction error indicator for full snapshot (cartesian) (POD-NN): {}".format(err_full_POD))
 
-        if test_type['typeOfTest'] != "query":
+        if t_exact is None:
             Q_diff_sPOD = np.concatenate([Q[:, :, 0, n].flatten('F') - Q_recon_sPOD_cart[:, :, 0, n].flatten('F')
                                      for n in range(Nt)]).reshape(self.Nx * self.Ny, Nt, order='F')
             Q_diff_POD = np.concatenate([Q[:, :, 0, n].flatten('F') - Q_recon_POD_cart[:, :, 0, n].flatten('F')
@@ -454,18 +493,10 @@ class wildfire2D_sup:
                            frame_amplitude_predicted_POD, TA_POD_TEST, self.x, self.t)
 
 
-        print('Timing...')
-        print(
-            f"Time consumption in assembling the transformation operators (sPOD-NN) : {toc_trafo_2 - tic_trafo_2:0.4f} seconds")
-        print(
-            f"Time consumption in assembling the transformation operators (sPOD-I) : {toc_trafo_1 - tic_trafo_1:0.4f} seconds")
-        print(
-            f"Time consumption in assembling the final solution (sPOD-NN) : {((toc_sPOD - tic_sPOD) - (toc_trafo_2 - tic_trafo_2)):0.4f} seconds")
-        print(
-            f"Time consumption in assembling the final solution (sPOD-I)  : {((toc_I - tic_I) - (toc_trafo_1 - tic_trafo_1)):0.4f} seconds")
-        print(f"Time consumption in assembling the final solution (POD-NN)  : {(toc_POD - tic_POD):0.4f} seconds")
-        print(
-            f"Time consumption in converting from cart-polar-cart  : {(2 * (toc_sPOD_cart - tic_sPOD_cart)):0.4f} seconds")
+        report_online_timing(trafo_time_sPOD, trafo_time_I, toc_sPOD - tic_sPOD - trafo_time_sPOD,
+                             toc_I - tic_I - trafo_time_I, toc_POD - tic_POD,
+                             conversion=(toc_sPOD_cart - tic_sPOD_cart) + (toc_I_cart - tic_I_cart),
+                             verbose=verbose)
 
         return Q_recon_sPOD_cart, Q_recon_POD_cart, Q_recon_interp_cart, errors
 
@@ -537,6 +568,7 @@ class wildfire2D_sup:
         subfig_b.supylabel(r"$T$")
         subfig_b.supxlabel(r"space $x$")
 
+        os.makedirs(impath, exist_ok=True)
         fig.savefig(impath + str(var_name) + "-mixed", dpi=300, transparent=True)
         plt.close(fig)
 
@@ -605,71 +637,6 @@ def plot_pred_comb(time_amplitudes_1_pred, time_amplitudes_1_test, time_amplitud
 
     subfig_t.supxlabel(r"time $t$")
 
+    os.makedirs(impath, exist_ok=True)
     save_fig(filepath=impath + "all_comb_pred_2D", figure=fig)
     fig.savefig(impath + "all_comb_pred_2D" + ".pdf", format='pdf', dpi=200, transparent=True, bbox_inches="tight")
-
-
-def cartesian_to_polar(cartesian_data, X, Y, t, t_exact=None, fill_val=0):
-    Nx = np.size(X)
-    Ny = np.size(Y)
-    Nt = np.size(t)
-    X_grid, Y_grid = np.meshgrid(X, Y)
-    X_c = X[-1] // 2
-    Y_c = Y[-1] // 2
-    aux = []
-
-    X_new = X_grid - X_c  # Shift the origin to the center of the image
-    Y_new = Y_grid - Y_c
-    r = np.sqrt(X_new ** 2 + Y_new ** 2).flatten()  # polar coordinate r
-    theta = np.arctan2(Y_new, X_new).flatten()  # polar coordinate theta
-
-    # Make a regular (in polar space) grid based on the min and max r & theta
-    N_r = Nx
-    N_theta = Ny
-    r_i = np.linspace(np.min(r), np.max(r), N_r)
-    theta_i = np.linspace(np.min(theta), np.max(theta), N_theta)
-    polar_data = np.zeros((N_r, N_theta, 1, Nt))
-
-    import polarTransform
-    if t_exact is None:
-        for k in range(Nt):
-            print(k)
-            data, ptSettings = polarTransform.convertToPolarImage(cartesian_data[..., 0, k],
-                                                                  radiusSize=N_r,
-                                                                  angleSize=N_theta,
-                                                                  initialRadius=np.min(r_i),
-                                                                  finalRadius=np.max(r_i),
-                                                                  initialAngle=np.min(theta_i),
-                                                                  finalAngle=np.max(theta_i),
-                                                                  center=(X_c, Y_c),
-                                                                  borderVal=fill_val)
-            polar_data[..., 0, k] = data.transpose()
-            aux.append(ptSettings)
-    else:
-        data, ptSettings = polarTransform.convertToPolarImage(cartesian_data[..., 0, 0],
-                                                              radiusSize=N_r,
-                                                              angleSize=N_theta,
-                                                              initialRadius=np.min(r_i),
-                                                              finalRadius=np.max(r_i),
-                                                              initialAngle=np.min(theta_i),
-                                                              finalAngle=np.max(theta_i),
-                                                              center=(X_c, Y_c),
-                                                              borderVal=fill_val)
-        polar_data[..., 0, 0] = data.transpose()
-        aux.append(ptSettings)
-
-    return polar_data, theta_i, r_i, aux
-
-
-def polar_to_cartesian(polar_data, t, aux=None, t_exact=None):
-    Nt = len(t)
-    cartesian_data = np.zeros_like(polar_data)
-
-    if t_exact is None:
-        for k in range(Nt):
-            print(k)
-            cartesian_data[..., 0, k] = aux[k].convertToCartesianImage(polar_data[..., 0, k].transpose())
-    else:
-        cartesian_data[..., 0, 0] = aux[t_exact].convertToCartesianImage(polar_data[..., 0, 0].transpose())
-
-    return cartesian_data